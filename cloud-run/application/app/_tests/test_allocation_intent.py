@@ -1,106 +1,13 @@
 import asyncio
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from types import SimpleNamespace
 import unittest
 
 from intents.allocation import Allocation
-
-
-class FakeIntentDocument:
-    def __init__(self, path, data):
-        self._data = data
-        self.reference = SimpleNamespace(path=path)
-
-    def get(self):
-        return self
-
-    @property
-    def exists(self):
-        return self._data is not None
-
-    def to_dict(self):
-        return self._data
-
-
-class FakeIntentCollection:
-    def __init__(self, doc_id, intent_data):
-        self._doc_id = doc_id
-        self._intent_data = intent_data
-
-    def document(self, name):
-        path = f"strategies/{self._doc_id}/intent/{name}"
-        return FakeIntentDocument(path, self._intent_data)
-
-
-class FakeStrategyDoc:
-    def __init__(self, doc_id, data, intent_data):
-        self.id = doc_id
-        self._data = data
-        self._intent_data = intent_data
-        self.reference = SimpleNamespace(collection=lambda _: FakeIntentCollection(doc_id, intent_data))
-
-    def to_dict(self):
-        return self._data
-
-
-class FakeStrategyCollection:
-    def __init__(self, docs):
-        self._docs = docs
-
-    def stream(self):
-        return iter(self._docs)
-
-
-class FakeExecutionDocument:
-    def __init__(self, sink):
-        self._sink = sink
-        self.path = f"executions/{len(sink) + 1}"
-
-    def set(self, payload):
-        self._sink.append(payload)
-
-
-class FakeExecutionsCollection:
-    def __init__(self, sink):
-        self._sink = sink
-
-    def document(self):
-        return FakeExecutionDocument(self._sink)
-
-
-class FakePortfolioDocument:
-    def __init__(self, path, data):
-        self.path = path
-        self._data = data
-
-    def get(self):
-        return self
-
-    @property
-    def exists(self):
-        return self._data is not None
-
-    def to_dict(self):
-        return self._data
-
-
-class FakeDB:
-    def __init__(self, portfolio, strategy_docs, execution_sink):
-        self._portfolio = portfolio
-        self._strategy_docs = strategy_docs
-        self._execution_sink = execution_sink
-
-    def document(self, path):
-        if path.endswith('latest_portfolio'):
-            return FakePortfolioDocument(path, self._portfolio)
-        raise ValueError(f"Unsupported document path: {path}")
-
-    def collection(self, name):
-        if name == 'strategies':
-            return FakeStrategyCollection(self._strategy_docs)
-        if name == 'executions':
-            return FakeExecutionsCollection(self._execution_sink)
-        raise ValueError(f"Unsupported collection: {name}")
+from intents.intent import Intent
+from intents.pipeline import PipelineContext
+from lib.gcp import FirestoreStore
+from test_support import FakeAsyncFirestore
 
 
 class FakeIBGW:
@@ -111,9 +18,22 @@ class FakeIBGW:
         return None
 
 
+class FakeContracts:
+    async def qualify(self, *contracts):
+        return list(contracts)
+
+
+class FakeOrders:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, orders, on_ack=None):
+        self.submitted.extend(orders)
+        return []
+
+
 class AllocationIntentTests(unittest.TestCase):
     def setUp(self):
-        self.execution_sink = []
         now = datetime.now(timezone.utc).isoformat()
         # Portfolio: currently 10 shares, 2 buy orders pending
         self.portfolio_doc = {
@@ -133,38 +53,52 @@ class AllocationIntentTests(unittest.TestCase):
             ]
         }
         # Strategy target: aim for 20 shares total
-        self.strategy_doc = FakeStrategyDoc(
-            'testsignalgenerator',
-            {'enabled': True},
-            {
-                'status': 'success',
-                'updated_at': now,
-                'target_positions': [
-                    {
-                        'symbol': 'SPY',
-                        'secType': 'STK',
-                        'exchange': 'SMART',
-                        'currency': 'USD',
-                        'quantity': 20,
-                        'contract': {'conId': 1001, 'symbol': 'SPY', 'secType': 'STK', 'exchange': 'SMART', 'currency': 'USD'}
-                    }
-                ]
-            }
-        )
+        self.intent_doc = {
+            'status': 'success',
+            'updated_at': now,
+            'target_positions': [
+                {
+                    'symbol': 'SPY',
+                    'secType': 'STK',
+                    'exchange': 'SMART',
+                    'currency': 'USD',
+                    'quantity': 20,
+                    'contract': {'conId': 1001, 'symbol': 'SPY', 'secType': 'STK', 'exchange': 'SMART', 'currency': 'USD'}
+                }
+            ]
+        }
+        self.firestore = FakeAsyncFirestore({
+            'positions/paper/latest_portfolio': self.portfolio_doc,
+            'strategies/testsignalgenerator': {'enabled': True},
+            'strategies/testsignalgenerator/intent/latest': self.intent_doc
+        })
+        logging = SimpleNamespace(info=lambda *args, **kwargs: None,
+                                  warning=lambda *args, **kwargs: None,
+                                  error=lambda *args, **kwargs: None)
         self.env = SimpleNamespace(
-            db=FakeDB(self.portfolio_doc, [self.strategy_doc], self.execution_sink),
+            store=FirestoreStore(SimpleNamespace(adb=self.firestore, logging=logging), linger=0),
             ibgw=FakeIBGW(),
-            logging=SimpleNamespace(info=lambda *args, **kwargs: None,
-                                    warning=lambda *args, **kwargs: None,
-                                    error=lambda *args, **kwargs: None),
+            logging=logging,
             trading_mode='paper',
             env={'K_REVISION': 'localhost'},
-            config={'exposure': {'overall': 1.0, 'strategies': {'testsignalgenerator': 1.0}}}
+            config={'exposure': {'overall': 1.0, 'strategies': {'testsignalgenerator': 1.0}}},
+            config_hash='cfg',
+            config_version=None
         )
 
+    def _run(self, allocation):
+        async def scenario():
+            result = await allocation._core_async()
+            await self.env.store.flush()
+            return result
+        return asyncio.run(scenario())
+
+    def _executions(self):
+        return [data for path, data in self.firestore.docs.items() if path.startswith('executions/')]
+
     def test_allocation_generates_buy_plan_with_dry_run(self):
         allocation = Allocation(self.env, dryRun=True, strategies=['testsignalgenerator'])
-        result = asyncio.run(allocation._core_async())
+        result = self._run(allocation)
 
         self.assertTrue(result['dry_run'])
         self.assertEqual(len(result['decision']['diff']), 1)
@@ -173,8 +107,107 @@ class AllocationIntentTests(unittest.TestCase):
         self.assertEqual(planned_order['quantity'], 8)
         self.assertEqual(planned_order['action'], 'BUY')
         # Execution log should be recorded
-        self.assertEqual(len(self.execution_sink), 1)
-        self.assertEqual(self.execution_sink[0]['orders'][0]['simulated'], True)
+        executions = self._executions()
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(executions[0]['orders'][0]['simulated'], True)
+
+    def test_allocation_consumes_pipeline_without_reading_firestore(self):
+        pipeline = PipelineContext()
+        pipeline.publish_portfolio('positions/paper/latest_portfolio', self.portfolio_doc)
+        pipeline.publish_strategy_intent('testsignalgenerator', 'strategies/testsignalgenerator/intent/latest',
+                                         self.intent_doc)
+        # Only the strategy document (its config) is still read from Firestore.
+        del self.firestore.docs['positions/paper/latest_portfolio']
+        del self.firestore.docs['strategies/testsignalgenerator/intent/latest']
+
+        allocation = Allocation(self.env, dryRun=True, strategies=['testsignalgenerator'])
+        allocation.attach_pipeline(pipeline)
+        result = self._run(allocation)
+        self.assertEqual(8, result['decision']['diff'][0]['quantity'])
+        self.assertEqual({'enabled': True}, result['context']['strategy_snapshots'][0]['config'])
+        self.assertEqual(1, len(self._executions()))
+        self.assertEqual([], self.firestore.get_all_calls)
+
+    def test_strategy_missing_from_pipeline_falls_back_to_firestore_intent(self):
+        pipeline = PipelineContext()
+        pipeline.publish_portfolio('positions/paper/latest_portfolio', self.portfolio_doc)
+        # 'slow' timed out in this run; its intent from the previous run is still fresh.
+        self.firestore.docs.update({
+            'strategies/slow': {'enabled': True},
+            'strategies/slow/intent/latest': self.intent_doc,
+        })
+        pipeline.publish_strategy_intent('testsignalgenerator', 'strategies/testsignalgenerator/intent/latest',
+                                         self.intent_doc)
+
+        allocation = Allocation(self.env, dryRun=True, strategies=['testsignalgenerator', 'slow'])
+        allocation.attach_pipeline(pipeline)
+        result = self._run(allocation)
+
+        self.assertEqual(['strategies/slow/intent/latest'], self.firestore.get_all_calls[0])
+        self.assertEqual([], result['context']['missing_strategies'])
+        # Both strategies target 20: 40 - (10 held + 2 in flight).
+        self.assertEqual(28, result['decision']['diff'][0]['quantity'])
+
+    def test_intent_documents_are_batched_and_index_skips_stale_strategies(self):
+        stale_at = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+        self.firestore.docs.update({
+            'strategies/stale': {'intent_updated_at': stale_at, 'intent_status': 'success'},
+            'strategies/stale/intent/latest': {},
+            'strategies/failed': {'intent_status': 'error'},
+            'strategies/failed/intent/latest': {},
+            'strategies/unpublished': {}
+        })
+        allocation = Allocation(self.env, dryRun=True,
+                                strategies=['testsignalgenerator', 'stale', 'failed', 'unpublished'])
+        result = self._run(allocation)
+
+        self.assertEqual([['strategies/testsignalgenerator/intent/latest', 'strategies/unpublished/intent/latest']],
+                         self.firestore.get_all_calls)
+        self.assertCountEqual(['stale', 'failed'], result['context']['stale_strategies'])
+        self.assertEqual(['unpublished'], result['context']['missing_strategies'])
+        self.assertEqual(8, result['decision']['diff'][0]['quantity'])
+
+    def test_opposing_strategies_are_crossed_into_one_residual_order(self):
+        contract = {'conId': 1001, 'symbol': 'SPY', 'secType': 'STK', 'exchange': 'SMART', 'currency': 'USD'}
+        seller = {**self.intent_doc, 'target_positions': [{'symbol': 'SPY', 'quantity': 0, 'contract': contract}]}
+        self.firestore.docs.update({
+            'strategies/seller': {'enabled': True},
+            'strategies/seller/intent/latest': seller,
+            'positions/paper/holdings/testsignalgenerator': {'1001': 0},
+            'positions/paper/holdings/seller': {'1001': 10},
+        })
+        self.env.contracts = FakeContracts()
+        self.env.orders = FakeOrders()
+
+        allocation = Allocation(self.env, strategies=['testsignalgenerator', 'seller'])
+        result = self._run(allocation)
+
+        # Buyer needs 20, seller sells its 10: 10 cross internally, only 8 (after the 2 in flight) are bought.
+        [planned_order] = result['decision']['diff']
+        self.assertEqual((8, 10), (planned_order['quantity'], planned_order['crossed_quantity']))
+        self.assertEqual(1, len(self.env.orders.submitted))
+        self.assertCountEqual([{'strategy_id': 'testsignalgenerator', 'conId': '1001', 'quantity': 10, 'price': None},
+                               {'strategy_id': 'seller', 'conId': '1001', 'quantity': -10, 'price': None}],
+                              result['virtual_fills'])
+        # The strategies would trade 30 between them; the cross is attributed, not booked to their holdings.
+        self.assertEqual((30, 10), (allocation._activity_log['grossQuantity'],
+                                    allocation._activity_log['crossedQuantity']))
+        self.assertEqual({'1001': 0}, self.firestore.docs['positions/paper/holdings/testsignalgenerator'])
+        self.assertEqual({'1001': 10}, self.firestore.docs['positions/paper/holdings/seller'])
+
+    def test_publishing_indexes_only_existing_strategy_documents(self):
+        class Publisher(Intent):
+            async def _core_async(self):
+                for strategy_id in ('testsignalgenerator', 'unregistered'):
+                    await self._publish_strategy_intent(strategy_id, f'strategies/{strategy_id}/intent/latest',
+                                                        {'status': 'success', 'updated_at': 'now'})
+
+        self._run(Publisher(self.env))
+
+        self.assertEqual({'enabled': True, 'intent_updated_at': 'now', 'intent_status': 'success'},
+                         self.firestore.docs['strategies/testsignalgenerator'])
+        self.assertIn('strategies/unregistered/intent/latest', self.firestore.docs)
+        self.assertNotIn('strategies/unregistered', self.firestore.docs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+import unittest
+
+from ib_insync import MarketOrder, Stock
+
+from intents.close_all import CloseAll
+from lib.contracts import ContractRegistry
+from lib.gcp import FirestoreStore
+from lib.ib_simulator import IBSimulator
+from lib.orders import OrderSubmitter, OrderTracker
+from test_support import FakeAsyncFirestore
+
+
+class CloseAllIntentTests(unittest.TestCase):
+    def setUp(self):
+        self.firestore = FakeAsyncFirestore()
+        logging = SimpleNamespace(info=lambda *args, **kwargs: None,
+                                  warning=lambda *args, **kwargs: None,
+                                  error=lambda *args, **kwargs: None)
+        self.ibgw = IBSimulator(latency=0.005, jitter=0, fill_latency=0.02)
+        registry_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(registry_dir.cleanup)
+        tracker = OrderTracker(self.ibgw)
+        self.env = SimpleNamespace(
+            store=FirestoreStore(SimpleNamespace(adb=self.firestore, logging=logging), linger=0),
+            ibgw=self.ibgw,
+            contracts=ContractRegistry(self.ibgw, path=os.path.join(registry_dir.name, 'contracts.json')),
+            order_tracker=tracker,
+            orders=OrderSubmitter(self.ibgw, tracker=tracker),
+            logging=logging,
+            trading_mode='paper',
+            env={'K_REVISION': 'localhost'},
+            config={'account': 'DU123'},
+            config_hash='cfg',
+            config_version=None
+        )
+        self.spy, self.qqq, self.tlt = (Stock(symbol, 'SMART', 'USD') for symbol in ('SPY', 'QQQ', 'TLT'))
+        for contract, quantity in ((self.spy, 100), (self.qqq, -40), (self.tlt, 25)):
+            self.ibgw.seed_position(contract, quantity)
+
+    def _run(self, close_all):
+        events = []
+        close_all.add_progress_listener(events.append)
+
+        async def scenario():
+            await self.ibgw.connectAsync()
+            self.ibgw.fill_latency = 3600
+            resting = self.ibgw.placeOrder(self.spy, MarketOrder('BUY', 10))
+            await self.env.order_tracker.submitted(resting, timeout=1)
+            self.ibgw.fill_latency = 0.02
+            result = await close_all._core_async()
+            await self.env.store.flush()
+            return resting, result
+        resting, result = asyncio.run(scenario())
+        return resting, result, events
+
+    def test_cancels_open_orders_and_flattens_account(self):
+        resting, result, events = self._run(CloseAll(self.env, waitForFills=True))
+
+        self.assertEqual('Cancelled', resting.orderStatus.status)
+        self.assertEqual(1, result['cancelledOrders'])
+        self.assertEqual([], self.ibgw.positions())
+        self.assertEqual([], result['unfilled'])
+        self.assertEqual({'cancelMs', 'positionsMs', 'ackMs', 'flattenMs'}, set(result['latency']))
+        self.assertEqual(['plan', 'order', 'order', 'order'], [event['stage'] for event in events])
+        self.assertTrue(all(event['order']['ack'] == 'acknowledged' for event in events[1:]))
+
+    def test_returns_once_closing_orders_are_acknowledged(self):
+        _, result, _ = self._run(CloseAll(self.env))
+
+        self.assertEqual(3, len(result['executed_orders']))
+        self.assertNotIn('unfilled', result)
+        self.assertEqual({'cancelMs', 'positionsMs', 'ackMs'}, set(result['latency']))
+
+    def test_strategy_holdings_are_netted_before_closing(self):
+        holdings = 'positions/paper/holdings'
+        self.firestore.docs.update({
+            f'{holdings}/trend': {str(self.spy.conId): 60, str(self.tlt.conId): 25},
+            f'{holdings}/meanreversion': {str(self.spy.conId): -20},
+        })
+
+        _, result, _ = self._run(CloseAll(self.env, strategies=['trend', 'meanreversion'], waitForFills=True))
+
+        self.assertEqual([{'symbol': 'SPY', 'conId': self.spy.conId, 'action': 'SELL', 'quantity': 40.0},
+                          {'symbol': 'TLT', 'conId': self.tlt.conId, 'action': 'SELL', 'quantity': 25.0}],
+                         result['closing_plan'])
+        self.assertEqual({self.spy.conId: 60, self.qqq.conId: -40},
+                         {p.contract.conId: p.position for p in self.ibgw.positions()})
+        self.assertEqual([[f'{holdings}/trend', f'{holdings}/meanreversion']], self.firestore.get_all_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+import unittest
+from unittest.mock import patch
+
+from intents.intent import Intent
+from intents import orchestrator
+from intents.orchestrator import Orchestrator
+
+
+class FakeStrategyIntent(Intent):
+    delay = 0.05
+    active = 0
+    peak = 0
+
+    async def run(self):
+        FakeStrategyIntent.active += 1
+        FakeStrategyIntent.peak = max(FakeStrategyIntent.peak, FakeStrategyIntent.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            FakeStrategyIntent.active -= 1
+        return {'status': 'success', 'updated_at': 'now', 'metadata': {}}
+
+
+class HangingStrategyIntent(FakeStrategyIntent):
+    delay = 10
+
+
+class BrokenStrategyIntent(Intent):
+    async def run(self):
+        raise RuntimeError("no market data")
+
+
+class FakeReconcile(Intent):
+    async def run(self):
+        await asyncio.sleep(0.05)
+        return {'updated_at': 'now', 'holdings': [1, 2], 'open_orders': []}
+
+
+class FakeAllocation(Intent):
+    async def run(self):
+        return {'status': 'completed', 'orders': [], 'context': {}}
+
+
+class OrchestratorIntentTests(unittest.TestCase):
+    def setUp(self):
+        FakeStrategyIntent.active = 0
+        FakeStrategyIntent.peak = 0
+        self.env = SimpleNamespace(
+            logging=SimpleNamespace(info=lambda *a, **k: None, warning=lambda *a, **k: None, error=lambda *a, **k: None),
+            trading_mode='paper',
+            env={'K_REVISION': 'localhost'},
+            config={},
+            config_hash='cfg',
+            config_version=None
+        )
+        registry = {
+            's1': FakeStrategyIntent,
+            's2': FakeStrategyIntent,
+            's3': FakeStrategyIntent,
+            'hanging': HangingStrategyIntent,
+            'broken': BrokenStrategyIntent
+        }
+        patches = [
+            patch.object(orchestrator, 'STRATEGY_INTENT_REGISTRY', registry),
+            patch.object(orchestrator, 'Reconcile', FakeReconcile),
+            patch.object(orchestrator, 'Allocation', FakeAllocation)
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_strategies_run_concurrently_with_reconcile(self):
+        intent = Orchestrator(self.env, strategies=['s1', 's2', 's3'], maxConcurrentStrategies=2)
+        loop = asyncio.new_event_loop()
+        try:
+            started = loop.time()
+            result = loop.run_until_complete(intent._core_async())
+            elapsed = loop.time() - started
+        finally:
+            loop.close()
+
+        self.assertEqual(2, FakeStrategyIntent.peak)
+        self.assertEqual(['s1', 's2', 's3'], [s['strategy_id'] for s in result['strategies']])
+        self.assertEqual(2, result['reconcile']['holdings'])
+        # Two waves of strategies with reconcile overlapping: well under the 0.2s sequential time.
+        self.assertLess(elapsed, 0.18)
+
+    def test_failures_and_timeouts_are_isolated(self):
+        intent = Orchestrator(self.env, strategies=['s1', 'hanging', 'broken', 'unknown'], strategyTimeout=0.1)
+        result = asyncio.run(intent._core_async())
+
+        by_id = {s['strategy_id']: s for s in result['strategies']}
+        self.assertEqual('success', by_id['s1']['status'])
+        self.assertEqual('Timed out after 0.1s', by_id['hanging']['error'])
+        self.assertEqual('no market data', by_id['broken']['error'])
+        self.assertEqual('error', by_id['unknown']['status'])
+        self.assertEqual('completed', result['commander']['status'])
+
+
+if __name__ == '__main__':
+    unittest.main()
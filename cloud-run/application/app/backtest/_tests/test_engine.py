@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest.engine import Backtest, macd_crossover_sweep, parameter_grid, sweep
+from strategies.spy_macd_vixy import SpyMacdVixyIntent
+
+
+def _bars(closes):
+    days = [date(2024, 1, 1) + timedelta(days=n) for n in range(len(closes))]
+    closes = np.asarray(closes, dtype=float)
+    opens = np.append(closes[0], closes[:-1])
+    return pd.DataFrame({'date': days, 'open': opens, 'high': np.maximum(opens, closes) + 0.5,
+                         'low': np.minimum(opens, closes) - 0.5, 'close': closes, 'volume': 1000.0})
+
+
+class BacktestTests(unittest.TestCase):
+
+    def setUp(self):
+        t = np.arange(160)
+        self.bars = {
+            'SPY': _bars(400 + 20 * np.sin(t / 8) + t * 0.2),
+            'VIXY': _bars(20 - 3 * np.sin(t / 8)),
+        }
+        self.config = {'exposure': {'overall': 1.0, 'strategies': {'spy_macd_vixy': 1.0}}}
+
+    def test_intent_trades_on_crossovers_and_fills_next_bar(self):
+        result = Backtest(SpyMacdVixyIntent, self.bars, config=self.config, warmup=40).run()
+
+        self.assertEqual(120, len(result.equity))
+        self.assertGreater(result.stats['trades'], 2)
+        self.assertGreater(result.stats['slippage'], 0)
+        self.assertGreater(result.stats['turnover'], 0)
+        # Orders are placed at a bar's close and filled at the following bar's open.
+        first_fill = result.fills['date'].iloc[0]
+        self.assertEqual(100_000.0, result.equity[first_fill - timedelta(days=1)])
+        spy_open = self.bars['SPY'].set_index('date')['open']
+        spy_fill = result.fills[result.fills['symbol'] == 'SPY'].iloc[0]
+        self.assertAlmostEqual(spy_open[spy_fill['date']] * (1 + np.sign(spy_fill['quantity']) * 1e-4),
+                               spy_fill['price'])
+
+    def test_sweep_runs_each_parameter_set_in_a_worker(self):
+        grid = parameter_grid(slippage_bps=[0.0, 50.0])
+        results = sweep(SpyMacdVixyIntent, self.bars, grid, processes=2, config=self.config, warmup=40)
+
+        self.assertEqual([0.0, 50.0], list(results['slippage_bps']))
+        self.assertEqual(0.0, results['slippage'].iloc[0])
+        self.assertGreater(results['total_return'].iloc[0], results['total_return'].iloc[1])
+
+    def test_vectorized_macd_sweep_matches_single_configurations(self):
+        grid = parameter_grid(fast=[8, 12], slow=[26, 40], signal=[9])
+        spy = self.bars['SPY']
+        together = macd_crossover_sweep(spy, grid)
+        for row, params in enumerate(grid):
+            alone = macd_crossover_sweep(spy, [params])
+            self.assertAlmostEqual(alone['total_return'].iloc[0], together['total_return'].iloc[row])
+        self.assertEqual(4, len(together))
+        self.assertTrue((together['trades'] > 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
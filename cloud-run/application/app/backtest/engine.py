@@ -0,0 +1,174 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import math
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+from ib_insync import MarketOrder
+
+from backtest.environment import BacktestEnvironment, logger
+from backtest.simulator import SimulatedIBGW
+from lib import indicators
+from lib.market_data import bar_size_seconds
+
+# Regular trading hours per year, used to annualise intraday bars.
+_TRADING_DAYS = 252
+_SESSION_SECONDS = 6.5 * 3600
+
+
+def periods_per_year(bar_size: str) -> float:
+    seconds = bar_size_seconds(bar_size)
+    return _TRADING_DAYS * 86400 / seconds if seconds >= 86400 else _TRADING_DAYS * _SESSION_SECONDS / seconds
+
+
+def performance_stats(equity: pd.Series, bar_size: str) -> Dict[str, float]:
+    if equity.empty:
+        return {'total_return': 0.0, 'sharpe': 0.0, 'max_drawdown': 0.0}
+    returns = equity.pct_change().dropna()
+    std = returns.std()
+    return {
+        'total_return': float(equity.iloc[-1] / equity.iloc[0] - 1),
+        'sharpe': float(returns.mean() / std * math.sqrt(periods_per_year(bar_size))) if std > 0 else 0.0,
+        'max_drawdown': float((equity / equity.cummax() - 1).min()),
+    }
+
+
+class BacktestResult(NamedTuple):
+    equity: pd.Series
+    fills: pd.DataFrame
+    stats: Dict[str, float]
+
+
+class Backtest:
+    """
+    Runs a strategy intent (e.g. SpyMacdVixyIntent) bar by bar over stored
+    bars, through a SimulatedIBGW and an in-memory store.
+
+    At every bar after `warmup` the intent runs as it would live. Its
+    successful target positions are turned into market orders the way
+    Allocation does (target minus holdings minus open orders). Those orders
+    fill at the next bar's open. An empty target list leaves the holdings
+    untouched. Equity is marked at every bar's close.
+    """
+
+    def __init__(self, intent_cls, bars: Dict[str, pd.DataFrame], config: Dict[str, Any] = None,
+                 intent_kwargs: Dict[str, Any] = None, bar_size: str = '1 day', warmup: int = 0,
+                 initial_cash: float = 100_000.0, slippage_bps: float = 1.0, commission_per_share: float = 0.005):
+        self.intent_cls = intent_cls
+        self.intent_kwargs = intent_kwargs or {}
+        self.bar_size = bar_size
+        self.warmup = warmup
+        self.ibgw = SimulatedIBGW(bars, bar_size=bar_size, initial_cash=initial_cash, slippage_bps=slippage_bps,
+                                  commission_per_share=commission_per_share)
+        self.env = BacktestEnvironment(self.ibgw, config or {})
+
+    def run(self) -> BacktestResult:
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> BacktestResult:
+        equity = {}
+        for now in self.ibgw.calendar[self.warmup:]:
+            self.ibgw.fill_pending(now)
+            self.ibgw.now = now
+            try:
+                result = await self.intent_cls(self.env, **self.intent_kwargs).run()
+            except Exception as e:
+                logger.warning(f"Backtest: {self.intent_cls.__name__} failed at {now}: {e}")
+                result = None
+            if result and result.get('status') == 'success' and result.get('target_positions'):
+                self._rebalance(result['target_positions'])
+            equity[now] = self.ibgw.net_liquidation()
+
+        equity = pd.Series(equity, dtype=float)
+        fills = pd.DataFrame(self.ibgw.fills, columns=['date', 'symbol', 'quantity', 'price', 'notional',
+                                                        'slippage', 'commission'])
+        stats = performance_stats(equity, self.bar_size)
+        # Traded notional as a multiple of the average equity.
+        stats.update(turnover=float(fills['notional'].sum() / equity.mean()) if len(equity) else 0.0,
+                     trades=len(fills), slippage=float(fills['slippage'].sum()),
+                     commission=float(fills['commission'].sum()))
+        return BacktestResult(equity, fills, stats)
+
+    def _rebalance(self, target_positions: List[Dict[str, Any]]):
+        inflight = {}
+        for trade in self.ibgw.openTrades():
+            sign = 1 if trade.order.action == 'BUY' else -1
+            inflight[trade.contract.conId] = inflight.get(trade.contract.conId, 0) + sign * trade.remaining()
+        for target in target_positions:
+            con_id = target['contract']['conId']
+            held = self.ibgw.positions_by_con_id.get(con_id, 0) + inflight.get(con_id, 0)
+            quantity = int(target['quantity'] - held)
+            if quantity:
+                contract = self.ibgw._contract(con_id)
+                self.ibgw.placeOrder(contract, MarketOrder('BUY' if quantity > 0 else 'SELL', abs(quantity)))
+
+
+# --- Parameter sweeps ---
+
+_worker_setup: Dict[str, Any] = {}
+
+
+def _init_worker(intent_cls, bars, base_kwargs):
+    # Bars are shipped to each worker once instead of with every task.
+    _worker_setup.update(intent_cls=intent_cls, bars=bars, base_kwargs=base_kwargs)
+
+
+def _run_one(params: Dict[str, Any]) -> Dict[str, Any]:
+    kwargs = {**_worker_setup['base_kwargs'], **params}
+    result = Backtest(_worker_setup['intent_cls'], _worker_setup['bars'], **kwargs).run()
+    return {**params, **result.stats}
+
+
+def sweep(intent_cls, bars: Dict[str, pd.DataFrame], grid: Iterable[Dict[str, Any]], processes: int = None,
+          **backtest_kwargs) -> pd.DataFrame:
+    """
+    Runs one Backtest per parameter set across a process pool. Each set
+    overrides Backtest arguments (config, intent_kwargs, slippage_bps, ...);
+    returns one row of parameters and stats per set.
+    """
+    grid = list(grid)
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(intent_cls, bars, backtest_kwargs)) as pool:
+        return pd.DataFrame(list(pool.map(_run_one, grid, chunksize=max(1, len(grid) // (4 * processes)))))
+
+
+def parameter_grid(**values: Sequence[Any]) -> List[Dict[str, Any]]:
+    """parameter_grid(fast=[8, 12], slow=[26]) -> [{'fast': 8, 'slow': 26}, {'fast': 12, 'slow': 26}]"""
+    return [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+
+
+def macd_crossover_sweep(bars: pd.DataFrame, grid: List[Dict[str, int]], cost_bps: float = 1.0,
+                         bar_size: str = '1 day', short: bool = True) -> pd.DataFrame:
+    """
+    Evaluates a MACD crossover rule for every {'fast', 'slow', 'signal'} set
+    in one vectorized pass: each set is a column of the indicator arrays.
+    Positions follow the side of the MACD line relative to its signal line
+    (flat instead of short when `short` is False), are entered at the next
+    bar's open and pay `cost_bps` of the traded notional.
+    """
+    close = bars['close'].to_numpy(dtype=float)
+    opens = bars['open'].to_numpy(dtype=float)
+    spans = {k: np.array([params[k] for params in grid], dtype=float) for k in ('fast', 'slow', 'signal')}
+    universe = np.repeat(close[:, None], len(grid), axis=1)
+    result = indicators.macd(universe, spans['fast'], spans['slow'], spans['signal'])
+
+    position = np.sign(result.histogram)
+    if not short:
+        position = np.clip(position, 0, None)
+    # Decided at bar t's close, held from bar t+1's open to bar t+2's open.
+    held = np.vstack([np.zeros((1, len(grid))), position[:-1]])
+    open_returns = np.append(opens[1:] / opens[:-1] - 1, 0.0)[:, None]
+    trades = np.abs(np.diff(held, axis=0, prepend=0))
+    returns = held * open_returns - trades * cost_bps / 10_000
+    equity = np.cumprod(1 + returns, axis=0)
+
+    rows = []
+    for column, params in enumerate(grid):
+        stats = performance_stats(pd.Series(equity[:, column]), bar_size)
+        rows.append({**params, **stats, 'turnover': float(trades[:, column].sum()),
+                     'trades': int(np.count_nonzero(trades[:, column]))})
+    return pd.DataFrame(rows)
@@ -0,0 +1,140 @@
+import copy
+import itertools
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+from lib.config import config_hash
+
+logger = logging.getLogger('backtest')
+
+
+class MemoryStore:
+    """In-memory stand-in for FirestoreStore with the same read/write surface."""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count()
+
+    def new_path(self, collection: str) -> str:
+        return f'{collection}/{next(self._ids)}'
+
+    async def get(self, path: str) -> Optional[Dict[str, Any]]:
+        data = self.docs.get(path)
+        return copy.deepcopy(data) if data is not None else None
+
+    async def get_all(self, paths: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        return {path: await self.get(path) for path in paths}
+
+    def collection(self, name: str):
+        return _MemoryCollection(self, name)
+
+    async def write(self, path: str, data: Dict[str, Any], merge: bool = False):
+        self.write_nowait(path, data, merge)
+
+    def write_nowait(self, path: str, data: Dict[str, Any], merge: bool = False):
+        data = copy.deepcopy(data)
+        self.docs[path] = {**self.docs.get(path, {}), **data} if merge else data
+
+    async def update(self, path: str, data: Dict[str, Any]):
+        if path in self.docs:
+            self.write_nowait(path, data, merge=True)
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {'documents': len(self.docs)}
+
+
+class _MemoryCollection:
+    def __init__(self, store: MemoryStore, name: str):
+        self._store = store
+        self._name = name
+
+    async def stream(self):
+        prefix = f'{self._name}/'
+        for path, data in list(self._store.docs.items()):
+            if path.startswith(prefix) and '/' not in path[len(prefix):]:
+                yield _MemorySnapshot(path, data)
+
+
+class _MemorySnapshot:
+    def __init__(self, path: str, data: Dict[str, Any]):
+        self.id = path.rsplit('/', 1)[-1]
+        self.exists = True
+        self._data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return copy.deepcopy(self._data)
+
+
+class _Contracts:
+    """ContractRegistry surface over the simulated gateway; nothing is cached or persisted."""
+
+    def __init__(self, ibgw):
+        self._ibgw = ibgw
+
+    async def qualify(self, *contracts):
+        copies = [copy.copy(contract) for contract in contracts]
+        await self._ibgw.qualifyContractsAsync(*copies)
+        return [contract if contract.conId else None for contract in copies]
+
+    async def qualify_one(self, contract):
+        return (await self.qualify(contract))[0]
+
+    def lookup(self, contract):
+        return None
+
+
+class _Tickers:
+    """Backtests have no live quotes; intents fall back to bar closes."""
+
+    def subscribe(self, owner: str, *contracts):
+        pass
+
+    def release(self, owner: str, *contracts):
+        pass
+
+    def quote(self, con_id: int):
+        return None
+
+    def price(self, con_id: int):
+        return None
+
+
+class BacktestEnvironment:
+    """
+    The parts of lib.environment.Environment that intents use, backed by a
+    SimulatedIBGW and an in-memory store instead of the gateway and Firestore.
+    """
+
+    def __init__(self, ibgw, config: Dict[str, Any], trading_mode: str = 'paper'):
+        self.ibgw = ibgw
+        self.config = {'marketDataType': 1, 'tradingEnabled': True, **config}
+        self.config_hash = config_hash(self.config)
+        self.config_version = None
+        self.env = {'K_REVISION': 'localhost'}
+        self.trading_mode = trading_mode
+        self.logging = logger
+        self.store = MemoryStore()
+        self.contracts = _Contracts(ibgw)
+        self.tickers = _Tickers()
+
+    async def get_bars(self, contract, duration: str, bar_size: str, what_to_show: str = 'TRADES',
+                       use_rth: bool = True) -> pd.DataFrame:
+        if bar_size != self.ibgw.bar_size:
+            raise ValueError(f"Backtest data is in '{self.ibgw.bar_size}' bars, not '{bar_size}'.")
+        return self.ibgw.history(contract.conId, duration)
+
+    async def get_bars_since(self, contract, since, bar_size: str, what_to_show: str = 'TRADES',
+                             use_rth: bool = True) -> pd.DataFrame:
+        bars = await self.get_bars(contract, None, bar_size, what_to_show, use_rth)
+        return bars[bars['date'] >= since].reset_index(drop=True)
+
+    async def invalidate_bars(self, contract, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        """Backtest history is never adjusted after the fact."""
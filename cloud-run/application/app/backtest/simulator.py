@@ -0,0 +1,186 @@
+import copy
+from dataclasses import dataclass
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+_DURATION_UNITS = {'S': timedelta(seconds=1), 'D': timedelta(days=1), 'W': timedelta(weeks=1),
+                   'M': timedelta(days=30), 'Y': timedelta(days=365)}
+
+
+def duration_timedelta(duration: str) -> timedelta:
+    """IB duration string ('200 D', '3600 S', '1 Y') as a timedelta."""
+    count, unit = duration.split()
+    return int(count) * _DURATION_UNITS[unit]
+
+
+@dataclass
+class BarData:
+    date: Any
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class SimulatedTrade:
+    def __init__(self, contract, order):
+        self.contract = contract
+        self.order = order
+        self.orderStatus = SimpleNamespace(status='Submitted', filled=0, remaining=order.totalQuantity,
+                                           avgFillPrice=0.0)
+        self.fills = []
+
+    def remaining(self) -> float:
+        return self.orderStatus.remaining
+
+    def isDone(self) -> bool:
+        return self.orderStatus.status in ('Filled', 'Cancelled')
+
+
+class SimulatedIBGW:
+    """
+    Stand-in for `ib_insync.IB` over stored bars, for backtests.
+
+    The simulated clock `now` only reveals bars up to and including it. Orders
+    placed at `now` stay open and fill at the open of each symbol's next bar
+    when the engine calls `fill_pending`, adjusted by `slippage_bps` against
+    the trader and charged `commission_per_share`. Account values and the
+    portfolio are marked to the latest visible close.
+    """
+
+    def __init__(self, bars: Dict[str, pd.DataFrame], bar_size: str = '1 day', initial_cash: float = 100_000.0,
+                 slippage_bps: float = 1.0, commission_per_share: float = 0.005, currency: str = 'USD'):
+        self.bar_size = bar_size
+        self.currency = currency
+        self.slippage_bps = slippage_bps
+        self.commission_per_share = commission_per_share
+        self.cash = initial_cash
+        self.now = None
+        self._bars: Dict[int, pd.DataFrame] = {}
+        self._dates: Dict[int, np.ndarray] = {}
+        self._contracts: Dict[str, Any] = {}
+        for con_id, (symbol, df) in enumerate(sorted(bars.items()), start=1):
+            df = df.sort_values('date').reset_index(drop=True)
+            self._bars[con_id] = df
+            self._dates[con_id] = df['date'].to_numpy()
+            self._contracts[symbol] = SimpleNamespace(conId=con_id, symbol=symbol, secType='STK', exchange='SMART',
+                                                      primaryExchange='', currency=currency, localSymbol=symbol,
+                                                      multiplier='', lastTradeDateOrContractMonth='')
+        self.positions_by_con_id: Dict[int, float] = {}
+        self.fills: List[Dict[str, Any]] = []
+        self._open_trades: List[SimulatedTrade] = []
+
+    @property
+    def calendar(self) -> List[Any]:
+        """Every bar date of any symbol, in order."""
+        return sorted(set().union(*[df['date'] for df in self._bars.values()]))
+
+    def isConnected(self) -> bool:
+        return True
+
+    def reqMarketDataType(self, market_data_type: int):
+        pass
+
+    async def reqCurrentTimeAsync(self):
+        return self.now
+
+    async def qualifyContractsAsync(self, *contracts):
+        qualified = []
+        for contract in contracts:
+            known = self._contracts.get(contract.symbol)
+            if known is not None:
+                for field, value in vars(known).items():
+                    setattr(contract, field, value)
+                qualified.append(contract)
+        return qualified
+
+    def history(self, con_id: int, duration: str = None) -> pd.DataFrame:
+        """Visible bars of a contract, optionally limited to the last `duration`."""
+        df = self._bars[con_id]
+        end = int(np.searchsorted(self._dates[con_id], self.now, side='right'))
+        start = 0
+        if duration is not None:
+            since = pd.Timestamp(self.now) - duration_timedelta(duration)
+            start = int(np.searchsorted(pd.to_datetime(self._dates[con_id]), since, side='right'))
+        return df.iloc[start:end].reset_index(drop=True)
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 day',
+                                     whatToShow='TRADES', useRTH=True, timeout=None, **kwargs):
+        if barSizeSetting != self.bar_size:
+            raise ValueError(f"Backtest data is in '{self.bar_size}' bars, not '{barSizeSetting}'.")
+        df = self.history(contract.conId, durationStr)
+        return [BarData(**{k: row[k] for k in ('date', 'open', 'high', 'low', 'close', 'volume')})
+                for row in df.to_dict('records')]
+
+    def last_price(self, con_id: int) -> Optional[float]:
+        end = int(np.searchsorted(self._dates[con_id], self.now, side='right'))
+        return float(self._bars[con_id]['close'].iloc[end - 1]) if end else None
+
+    def net_liquidation(self) -> float:
+        return self.cash + sum(qty * (self.last_price(con_id) or 0.0) for con_id, qty in self.positions_by_con_id.items())
+
+    def accountValues(self, account: str = '') -> List[SimpleNamespace]:
+        values = {'NetLiquidation': self.net_liquidation(), 'TotalCashValue': self.cash}
+        return [SimpleNamespace(account=account, tag=tag, value=str(value), currency=self.currency, modelCode='')
+                for tag, value in values.items()]
+
+    def _contract(self, con_id: int):
+        return copy.copy(next(c for c in self._contracts.values() if c.conId == con_id))
+
+    def portfolio(self) -> List[SimpleNamespace]:
+        items = []
+        for con_id, qty in self.positions_by_con_id.items():
+            if qty:
+                price = self.last_price(con_id) or 0.0
+                items.append(SimpleNamespace(contract=self._contract(con_id), position=qty, marketPrice=price,
+                                             marketValue=qty * price, averageCost=0.0, account=''))
+        return items
+
+    def positions(self, account: str = '') -> List[SimpleNamespace]:
+        return [SimpleNamespace(account=account, contract=item.contract, position=item.position, avgCost=0.0)
+                for item in self.portfolio()]
+
+    def openTrades(self) -> List[SimulatedTrade]:
+        return list(self._open_trades)
+
+    def placeOrder(self, contract, order) -> SimulatedTrade:
+        trade = SimulatedTrade(contract, order)
+        self._open_trades.append(trade)
+        return trade
+
+    def cancelOrder(self, order):
+        for trade in self._open_trades:
+            if trade.order is order:
+                trade.orderStatus.status = 'Cancelled'
+        self._open_trades = [t for t in self._open_trades if not t.isDone()]
+
+    def fill_pending(self, at):
+        """Fills open orders at the open of the bar dated `at`; orders for symbols without that bar stay open."""
+        for trade in self._open_trades:
+            con_id = trade.contract.conId
+            index = int(np.searchsorted(self._dates[con_id], at, side='left'))
+            if index >= len(self._dates[con_id]) or self._dates[con_id][index] != at:
+                continue
+            reference = float(self._bars[con_id]['open'].iloc[index])
+            quantity = trade.remaining()
+            sign = 1 if trade.order.action == 'BUY' else -1
+            price = reference * (1 + sign * self.slippage_bps / 10_000)
+            commission = self.commission_per_share * quantity
+            self.cash -= sign * quantity * price + commission
+            self.positions_by_con_id[con_id] = self.positions_by_con_id.get(con_id, 0) + sign * quantity
+            trade.orderStatus = SimpleNamespace(status='Filled', filled=quantity, remaining=0, avgFillPrice=price)
+            self.fills.append({
+                'date': at,
+                'symbol': trade.contract.symbol,
+                'quantity': sign * quantity,
+                'price': price,
+                'notional': quantity * price,
+                'slippage': quantity * abs(price - reference),
+                'commission': commission,
+            })
+        self._open_trades = [t for t in self._open_trades if not t.isDone()]
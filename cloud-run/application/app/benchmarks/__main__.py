@@ -0,0 +1,70 @@
+"""
+Benchmarks the intent pipeline end to end against in-process fakes.
+
+    python -m benchmarks                      # run and compare against benchmarks/baseline.json
+    python -m benchmarks --update-baseline    # run and store the results as the new baseline
+    python -m benchmarks reconcile allocation --iterations 20 --output results.json
+
+Exits with status 1 if any metric regressed beyond the tolerance. Timings
+depend on the machine; regenerate the baseline on the machine (or CI runner
+class) that runs the comparison.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+
+from benchmarks.harness import compare, measure
+from benchmarks.scenarios import SCENARIOS
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('scenarios', nargs='*', help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    logging.getLogger('benchmarks').setLevel(logging.CRITICAL)
+    results = {name: measure(SCENARIOS[name], args.iterations) for name in args.scenarios or SCENARIOS}
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'iterations': args.iterations,
+        'benchmarks': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
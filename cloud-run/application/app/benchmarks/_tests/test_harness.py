@@ -0,0 +1,35 @@
+import unittest
+
+from benchmarks.harness import compare, measure
+from benchmarks.scenarios import SCENARIOS
+
+
+class HarnessTests(unittest.TestCase):
+
+    def test_compare_flags_extra_round_trips_and_slowdowns_beyond_tolerance(self):
+        baseline = {'allocation': {'wall_ms': 100.0, 'firestore_round_trips': 4, 'alloc_peak_kib': 50.0},
+                    'reconcile': {'wall_ms': 1.0}}
+        results = {
+            'allocation': {'wall_ms': 120.0, 'firestore_round_trips': 5, 'alloc_peak_kib': 70.0},
+            # Under the absolute floor: noise on a millisecond-scale benchmark is not a regression.
+            'reconcile': {'wall_ms': 2.5},
+            'new_scenario': {'wall_ms': 1000.0},
+        }
+
+        regressions = compare(results, baseline, tolerance=0.25)
+
+        self.assertEqual(2, len(regressions))
+        self.assertTrue(regressions[0].startswith('allocation.firestore_round_trips: 4 -> 5'))
+        self.assertTrue(regressions[1].startswith('allocation.alloc_peak_kib'))
+
+    def test_scenario_reports_every_metric(self):
+        result = measure(SCENARIOS['reconcile'], iterations=1)
+
+        self.assertEqual({'wall_ms', 'wall_ms_p95', 'loop_blocked_ms', 'max_lag_ms', 'firestore_round_trips',
+                          'gateway_round_trips', 'alloc_peak_kib', 'alloc_blocks'}, set(result))
+        self.assertGreater(result['firestore_round_trips'], 0)
+        self.assertGreater(result['gateway_round_trips'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple
+
+# Metrics where any increase is a regression.
+COUNT_METRICS = ('firestore_round_trips', 'gateway_round_trips')
+# Metrics compared with a relative tolerance; timings also need an absolute change of ABSOLUTE_FLOOR_MS.
+TIMING_METRICS = ('wall_ms', 'wall_ms_p95', 'loop_blocked_ms', 'max_lag_ms')
+MEMORY_METRICS = ('alloc_peak_kib',)
+ABSOLUTE_FLOOR_MS = 2.0
+
+
+class LoopMonitor:
+    """
+    Measures how long the event loop is blocked while it runs: a heartbeat
+    task that should wake every `interval` seconds records how late it wakes.
+    Lags under `threshold` are treated as scheduling noise.
+    """
+
+    def __init__(self, interval: float = 0.001, threshold: float = 0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._beat())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+
+class Scenario(NamedTuple):
+    """`setup` builds a fresh environment and returns a coroutine function running one end-to-end pass."""
+    name: str
+    setup: Callable[[], Awaitable[Callable[[], Awaitable[Any]]]]
+    # Returns (firestore round trips, gateway round trips) so far for the environment built by the last setup.
+    round_trips: Callable[[], tuple]
+
+
+async def _timed_run(scenario: Scenario) -> Dict[str, float]:
+    run = await scenario.setup()
+    firestore_before, gateway_before = scenario.round_trips()
+    async with LoopMonitor() as monitor:
+        started = time.perf_counter()
+        await run()
+        wall = time.perf_counter() - started
+    firestore_after, gateway_after = scenario.round_trips()
+    return {
+        'wall_ms': wall * 1000,
+        'loop_blocked_ms': monitor.blocked * 1000,
+        'max_lag_ms': monitor.max_lag * 1000,
+        'firestore_round_trips': firestore_after - firestore_before,
+        'gateway_round_trips': gateway_after - gateway_before,
+    }
+
+
+async def _allocation_run(scenario: Scenario) -> Dict[str, float]:
+    # Separate pass: tracing allocations slows the code down too much to time it at the same time.
+    run = await scenario.setup()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        await run()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {'alloc_peak_kib': peak / 1024, 'alloc_blocks': blocks}
+
+
+def measure(scenario: Scenario, iterations: int = 5) -> Dict[str, float]:
+    """Runs the scenario `iterations` times (plus one allocation-tracing pass) and summarises the runs."""
+    runs: List[Dict[str, float]] = [asyncio.run(_timed_run(scenario)) for _ in range(iterations)]
+    walls = sorted(run['wall_ms'] for run in runs)
+    result = {
+        'wall_ms': statistics.median(walls),
+        'wall_ms_p95': walls[min(len(walls) - 1, round(0.95 * (len(walls) - 1)))],
+        'loop_blocked_ms': statistics.median(run['loop_blocked_ms'] for run in runs),
+        'max_lag_ms': max(run['max_lag_ms'] for run in runs),
+        'firestore_round_trips': max(run['firestore_round_trips'] for run in runs),
+        'gateway_round_trips': max(run['gateway_round_trips'] for run in runs),
+    }
+    result.update(asyncio.run(_allocation_run(scenario)))
+    return {k: round(v, 3) for k, v in result.items()}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float = 0.25) -> List[str]:
+    """Describes every metric that regressed against the baseline; benchmarks missing from it are skipped."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in COUNT_METRICS:
+            if metric in base and metrics[metric] > base[metric]:
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {metrics[metric]}")
+        for metric in TIMING_METRICS + MEMORY_METRICS:
+            if metric not in base:
+                continue
+            limit = base[metric] * (1 + tolerance)
+            if metric in TIMING_METRICS:
+                limit = max(limit, base[metric] + ABSOLUTE_FLOOR_MS)
+            if metrics[metric] > limit:
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {metrics[metric]} (limit {round(limit, 3)})")
+    return regressions
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timezone
+import logging
+import os
+import tempfile
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from ib_insync import MarketOrder, Stock
+
+from benchmarks.harness import Scenario
+from intents.allocation import Allocation
+from intents.orchestrator import Orchestrator
+from intents.reconcile import Reconcile
+from intents.trade_reconciliation import TradeReconciliation
+from lib.config import config_hash
+from lib.contracts import ContractRegistry
+from lib.gcp import FirestoreStore
+from lib.ib_simulator import IBSimulator
+from lib.market_data import BarCache, TickerSubscriptions
+from lib.orders import OrderSubmitter, OrderTracker
+from test_support import FakeAsyncFirestore
+
+logger = logging.getLogger('benchmarks')
+
+STRATEGIES = ['spy_macd_vixy', 'testsignalgenerator']
+UNIVERSE = ['SPY', 'QQQ', 'IWM', 'TLT', 'GLD', 'VIXY', 'XLE', 'XLF', 'XLK', 'EEM']
+
+CONFIG = {
+    'marketDataType': 1,
+    'tradingEnabled': True,
+    'exposure': {'overall': 0.9, 'strategies': {strategy: 0.5 for strategy in STRATEGIES}},
+}
+
+
+class BenchmarkEnvironment:
+    """
+    The Environment surface intents use, with the service's own store, caches
+    and registry wired to in-process fakes: FakeAsyncFirestore behind the
+    FirestoreStore and an IBSimulator as the gateway.
+    """
+
+    def __init__(self, docs: Dict[str, Dict[str, Any]] = None):
+        self.env = {'K_REVISION': 'localhost'}
+        self.trading_mode = 'paper'
+        self.config = CONFIG
+        self.config_hash = config_hash(CONFIG)
+        self.config_version = None
+        self.logging = logger
+        self.firestore = FakeAsyncFirestore(docs)
+        self.store = FirestoreStore(SimpleNamespace(adb=self.firestore, logging=logger), linger=0)
+        self.ibgw = IBSimulator(latency=0.002, jitter=0.001, fill_latency=3600)
+        self._registry_dir = tempfile.TemporaryDirectory()
+        self.contracts = ContractRegistry(self.ibgw, path=os.path.join(self._registry_dir.name, 'contracts.json'))
+        self.bar_cache = BarCache(self.ibgw)
+        self.tickers = TickerSubscriptions(self.ibgw)
+        self.order_tracker = OrderTracker(self.ibgw)
+        self.orders = OrderSubmitter(self.ibgw, tracker=self.order_tracker)
+
+    async def get_bars(self, contract, duration: str, bar_size: str, what_to_show: str = 'TRADES',
+                       use_rth: bool = True):
+        return await self.bar_cache.get_bars(contract, duration, bar_size, what_to_show, use_rth)
+
+    async def get_bars_since(self, contract, since, bar_size: str, what_to_show: str = 'TRADES',
+                             use_rth: bool = True):
+        return await self.bar_cache.get_bars_since(contract, since, bar_size, what_to_show, use_rth)
+
+    async def invalidate_bars(self, contract, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        await self.bar_cache.invalidate(contract, bar_size, what_to_show, use_rth)
+
+    def round_trips(self) -> tuple:
+        return self.firestore.reads + len(self.firestore.commits), self.ibgw.stats()['requests']
+
+
+def _contract_dict(contract) -> Dict[str, Any]:
+    return {'conId': contract.conId, 'symbol': contract.symbol, 'secType': 'STK', 'exchange': 'SMART',
+            'currency': 'USD'}
+
+
+def _seeded_account(env: BenchmarkEnvironment, open_orders: int = 3) -> List[Any]:
+    contracts = []
+    for i, symbol in enumerate(UNIVERSE):
+        contract = Stock(symbol, 'SMART', 'USD')
+        env.ibgw.seed_position(contract, 100 + 10 * i)
+        contracts.append(contract)
+    for contract in contracts[:open_orders]:
+        env.ibgw.placeOrder(contract, MarketOrder('BUY', 5))
+    return contracts
+
+
+def _scenario(name: str, build) -> Scenario:
+    """`build(env)` seeds the environment and returns the intent to run."""
+    current = {}
+
+    async def setup():
+        env = current['env'] = BenchmarkEnvironment()
+        await env.ibgw.connectAsync()
+        intent = await build(env)
+
+        async def run():
+            await intent.run()
+            await env.store.flush()
+        return run
+
+    return Scenario(name, setup, lambda: current['env'].round_trips())
+
+
+async def _reconcile(env):
+    _seeded_account(env)
+    return Reconcile(env)
+
+
+async def _allocation(env):
+    contracts = _seeded_account(env)
+    now = datetime.now(timezone.utc).isoformat()
+    docs = env.firestore.docs
+    docs['positions/paper/latest_portfolio'] = {
+        'updated_at': now,
+        'holdings': [{'contract': _contract_dict(c), 'quantity': 100} for c in contracts],
+        'open_orders': [],
+    }
+    for i, strategy in enumerate(STRATEGIES):
+        docs[f'strategies/{strategy}'] = {'enabled': True, 'intent_updated_at': now, 'intent_status': 'success'}
+        docs[f'strategies/{strategy}/intent/latest'] = {
+            'status': 'success',
+            'updated_at': now,
+            'target_positions': [{'contract': _contract_dict(c), 'quantity': 150 + 10 * i}
+                                 for c in contracts[i::len(STRATEGIES)]],
+        }
+    return Allocation(env, strategies=STRATEGIES)
+
+
+async def _trade_reconciliation(env):
+    env.ibgw.fill_latency = 0
+    _seeded_account(env, open_orders=len(UNIVERSE))
+    while env.ibgw.openTrades():
+        await asyncio.sleep(0)
+    for fill in env.ibgw.fills():
+        env.firestore.docs[f'activity/{fill.execution.orderId}'] = {'orders': [{'permId': str(fill.execution.permId)}]}
+    return TradeReconciliation(env)
+
+
+async def _orchestrator(env):
+    _seeded_account(env)
+    for strategy in STRATEGIES:
+        env.firestore.docs[f'strategies/{strategy}'] = {'enabled': True}
+    return Orchestrator(env, strategies=STRATEGIES, dryRun=True)
+
+
+SCENARIOS = {
+    'reconcile': _scenario('reconcile', _reconcile),
+    'allocation': _scenario('allocation', _allocation),
+    'trade_reconciliation': _scenario('trade_reconciliation', _trade_reconciliation),
+    'orchestrator': _scenario('orchestrator', _orchestrator),
+}
@@ -1,101 +1,68 @@
+import asyncio
 import unittest
-from unittest.mock import call, MagicMock, patch, PropertyMock
+from unittest.mock import AsyncMock, call, MagicMock, patch
+
+from test_support import install_ib_insync_stub, install_google_cloud_stub
+
+install_ib_insync_stub()
+install_google_cloud_stub()
 
 from intents.close_all import CloseAll
 
 
 class TestCloseAll(unittest.TestCase):
 
-    ENV = {
-        'K_REVISION': 'k_revision',
-        'ORDER_PROPERTIES': '{"goodAfterTime":"today"}'
-    }
-    ORDER_PROPERTIES = {'goodAfterTime': 'today'}
+    ENV = {'K_REVISION': 'k_revision'}
     TRADING_MODE = 'trading_mode'
 
-    @patch('intents.intent.Environment', return_value=MagicMock(env=ENV))
-    def setUp(self, *_):
-        self.test_obj = CloseAll()
+    def setUp(self):
+        self.trades = [MagicMock(order=MagicMock(orderId=i)) for i in range(3)]
+        self.positions = [MagicMock(contract=MagicMock(conId=1, localSymbol='ABC'), position=100),
+                          MagicMock(contract=MagicMock(conId=2, localSymbol='DEF'), position=-10)]
+        acks = [MagicMock(trade=MagicMock(), acknowledged=True, to_dict=MagicMock(return_value={'orderId': i}))
+                for i in range(2)]
+        self.env = MagicMock(
+            env=self.ENV,
+            trading_mode=self.TRADING_MODE,
+            ibgw=MagicMock(reqOpenOrdersAsync=AsyncMock(),
+                           openTrades=MagicMock(return_value=self.trades),
+                           reqPositionsAsync=AsyncMock(return_value=self.positions)),
+            contracts=MagicMock(qualify=AsyncMock(side_effect=lambda *contracts: list(contracts))),
+            order_tracker=MagicMock(all=AsyncMock(side_effect=lambda _, trades, __: ['Cancelled'] * len(trades))),
+            orders=MagicMock(submit=AsyncMock(return_value=acks), cancel=AsyncMock()),
+        )
 
-    @patch('intents.intent.Environment', return_value=MagicMock(env=ENV))
-    def test_init(self, *_):
-        close_all = CloseAll()
-        self.assertEqual(CloseAll._dry_run, close_all._dry_run)
-        self.assertDictEqual(CloseAll._order_properties, close_all._order_properties)
+    def test_init(self):
+        close_all = CloseAll(self.env)
+        self.assertFalse(close_all._dry_run)
+        self.assertEqual([], close_all._strategies_to_close)
+        self.assertFalse(close_all._wait_for_fills)
 
-        dry_run = True
-        order_properties = {'order': 'properties'}
-        close_all = CloseAll(dryRun=dry_run, orderProperties=order_properties)
-        self.assertEqual(dry_run, close_all._dry_run)
-        self.assertDictEqual(order_properties, close_all._order_properties)
+        close_all = CloseAll(self.env, dryRun=True, strategies=['s1'], waitForFills=True)
+        self.assertTrue(close_all._dry_run)
+        self.assertEqual(['s1'], close_all._strategies_to_close)
+        self.assertTrue(close_all._wait_for_fills)
 
     @patch('intents.close_all.MarketOrder')
-    @patch('intents.close_all.Trade', return_value=MagicMock(consolidate_trades=MagicMock(),
-                                                             place_orders=MagicMock(return_value='orders'),
-                                                             trades={'abc': {'contract': MagicMock(local_symbol='ABC'), 'quantity': 100},
-                                                                     'def': {'contract': MagicMock(local_symbol='DEF'), 'quantity': -10}}))
-    def test_core(self, trade, market_order):
-        strategy_side_effect = [MagicMock(contracts={'abc': MagicMock(contract=MagicMock(localSymbol='ABC'), local_symbol='ABC'), 'def': MagicMock(contract=MagicMock(localSymbol='DEF'), local_symbol='DEF')},
-                                          holdings={'abc': 0.1, 'def': 0.2},
-                                          trades={'abc': -0.1, 'def': -0.2}),
-                                MagicMock(contracts={'def': MagicMock(contract=MagicMock(localSymbol='DEF'), local_symbol='DEF'), 'ghi': MagicMock(contract=MagicMock(localSymbol='GHI'), local_symbol='GHI')},
-                                          holdings={'def': -0.3, 'ghi': 0.4},
-                                          trades={'def': 0.3, 'ghi': -0.4})]
-        type(strategy_side_effect[0]).id = PropertyMock(return_value='s1')
-        type(strategy_side_effect[1]).id = PropertyMock(return_value='s2')
+    def test_core(self, market_order):
+        result = asyncio.run(CloseAll(self.env)._core_async())
 
-        with patch.object(self.test_obj, '_env',
-                          db=MagicMock(document=MagicMock(return_value=MagicMock(delete=MagicMock())),
-                                       collection=MagicMock(return_value=MagicMock(get=MagicMock(return_value=[MagicMock(id=f's{i + 1}') for i in range(2)])))),
-                          ibgw=MagicMock(orders=MagicMock(return_value=[MagicMock(permId=f'o{i}') for i in range(3)]),
-                                         cancelOrder=MagicMock(),
-                                         portfolio=MagicMock(return_value=[MagicMock(contract=MagicMock(conId='abc'), position=-100),
-                                                                           MagicMock(contract=MagicMock(conId='def'), position=10)])),
-                          logging=MagicMock(warning=MagicMock())) as env:
-            with patch('intents.close_all.Strategy', side_effect=strategy_side_effect) as strategy:
-                expected_log = {
-                    **self.test_obj._activity_log,
-                    'contractIds': {'ABC': 'abc', 'DEF': 'def', 'GHI': 'ghi'},
-                    'consolidatedTrades': {'ABC': 100, 'DEF': -10},
-                    'holdings': {'s1': {'ABC': 0.1, 'DEF': 0.2}, 's2': {'DEF': -0.3, 'GHI': 0.4}},
-                    'orders': 'orders',
-                    'trades': {'s1': {'ABC': -0.1, 'DEF': -0.2}, 's2': {'DEF': 0.3, 'GHI': -0.4}}
-                }
-                self.test_obj._core()
-                self.assertDictEqual(expected_log, self.test_obj._activity_log)
-                try:
-                    env.ibgw.cancelOrder.assert_has_calls([call(m) for m in env.ibgw.orders.return_value])
-                    env.db.document.assert_has_calls([call(f'positions/{self.test_obj._env.trading_mode}/openOrders/o{i}') for i in range(3)])
-                    self.assertEqual(3, env.db.document.return_value.delete.call_count)
-                    env.db.collection.assert_called_once_with(f'positions/{self.test_obj._env.trading_mode}/holdings')
-                    strategy.assert_has_calls([call(k.id) for k in env.db.collection.return_value.get.return_value])
-                    trade.return_value.consolidate_trades.assert_called_once()
-                    trade.return_value.place_orders.assert_called_once_with(market_order, order_properties=self.test_obj._order_properties)
-                except AssertionError:
-                    self.fail()
+        self.env.orders.cancel.assert_awaited_once_with(self.trades)
+        self.env.ibgw.reqGlobalCancel.assert_not_called()
+        self.env.order_tracker.all.assert_awaited_once_with('cancelled', self.trades, CloseAll.CANCEL_TIMEOUT)
+        market_order.assert_has_calls([call('SELL', 100), call('BUY', 10)])
+        self.env.orders.submit.assert_awaited_once()
+        self.assertEqual(3, result['cancelledOrders'])
+        self.assertEqual([{'symbol': 'ABC', 'conId': 1, 'action': 'SELL', 'quantity': 100},
+                          {'symbol': 'DEF', 'conId': 2, 'action': 'BUY', 'quantity': 10}], result['closing_plan'])
+        self.assertEqual([{'orderId': 0}, {'orderId': 1}], result['executed_orders'])
 
-            with patch('intents.close_all.Strategy', side_effect=strategy_side_effect):
-                with patch('intents.close_all.Trade', return_value=MagicMock(trades={'abc': {'contract': MagicMock(local_symbol='ABC'), 'quantity': -100},
-                                                                                     'def': {'contract': MagicMock(local_symbol='DEF'), 'quantity': 10}})):
-                    self.test_obj._core()
-                    try:
-                        portfolio = {item.contract.conId: item.position for item in env.ibgw.portfolio()}
-                        env.logging.warning.assert_called_once_with(f"Consolidated trade and IB portfolio don't match - portfolio: {portfolio}")
-                    except AssertionError:
-                        self.fail()
+    def test_core_dry_run(self):
+        result = asyncio.run(CloseAll(self.env, dryRun=True)._core_async())
 
-            with patch('intents.close_all.Strategy', side_effect=strategy_side_effect):
-                with patch.object(self.test_obj, '_dry_run', True):
-                    env.db.reset_mock()
-                    env.ibgw.reset_mock()
-                    trade.reset_mock()
-                    self.test_obj._core()
-                    try:
-                        env.ibgw.cancelOrder.assert_not_called()
-                        env.db.document.return_value.delete.assert_not_called()
-                        trade.return_value.place_orders.assert_not_called()
-                    except AssertionError:
-                        self.fail()
+        self.env.orders.cancel.assert_not_called()
+        self.env.orders.submit.assert_not_called()
+        self.assertEqual(2, len(result['closing_plan']))
 
 
 if __name__ == '__main__':
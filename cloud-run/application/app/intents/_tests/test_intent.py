@@ -31,7 +31,8 @@ class TestIntent(unittest.TestCase):
         intent = Intent(xyz='xyz', abc='abc')
         expected = {
             **self.ACTIVITY_LOG,
-            'config': intent._env.config,
+            'configHash': intent._env.config_hash,
+            'configVersion': intent._env.config_version,
             'intent': 'Intent',
             'signature': md5(b'k_revisionIntent{"abc": "abc", "xyz": "xyz"}').hexdigest(),
             'tradingMode': self.TRADING_MODE
@@ -1,10 +1,10 @@
-import asyncio
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from ib_insync import MarketOrder, util
 
 from intents.intent import Intent
+from lib.netting import NetOrder, NettingEngine
 
 
 def _parse_iso(ts: Optional[str]) -> Optional[datetime]:
@@ -30,6 +30,7 @@ class Allocation(Intent):
     Commander intent:
     - Read the latest reconciled portfolio
     - Aggregate target intents from strategies
+    - Net them into one order per contract, crossing opposing strategy deltas internally
     - Compute order deltas and (optionally) place trades
     - Persist an execution log to Firestore
     """
@@ -46,11 +47,14 @@ class Allocation(Intent):
         now = datetime.now(timezone.utc)
         freshness_delta = timedelta(minutes=self._fresh_minutes)
 
-        portfolio_doc_ref = self._env.db.document(f"positions/{self._env.trading_mode}/latest_portfolio")
-        portfolio_doc = portfolio_doc_ref.get()
-        if not portfolio_doc.exists:
-            raise RuntimeError("Portfolio snapshot missing; run reconcile first.")
-        portfolio = portfolio_doc.to_dict() or {}
+        if self._pipeline is not None and self._pipeline.portfolio is not None:
+            portfolio_path = self._pipeline.portfolio_path
+            portfolio = self._pipeline.portfolio
+        else:
+            portfolio_path = f"positions/{self._env.trading_mode}/latest_portfolio"
+            portfolio = await self._env.store.get(portfolio_path)
+            if portfolio is None:
+                raise RuntimeError("Portfolio snapshot missing; run reconcile first.")
 
         portfolio_updated_at = _parse_iso(portfolio.get('updated_at'))
         if portfolio_updated_at and now - portfolio_updated_at > freshness_delta:
@@ -63,7 +67,7 @@ class Allocation(Intent):
             stale_strategies,
             missing_strategies,
             aggregated_targets,
-        ) = self._collect_strategy_targets(now, freshness_delta)
+        ) = await self._collect_strategy_targets(now, freshness_delta)
 
         holdings_map: Dict[str, Dict[str, Any]] = {}
         for holding in portfolio.get('holdings', []):
@@ -102,48 +106,60 @@ class Allocation(Intent):
         # Apply global risk adjustments here if needed. For now, final targets == aggregated targets.
         final_targets = aggregated_targets
 
-        order_plan: List[Dict[str, Any]] = []
+        strategy_targets: Dict[str, Dict[str, int]] = {}
         for key, target in final_targets.items():
-            desired_quantity = int(target.get('quantity', 0))
-            current_quantity = int(holdings_map.get(key, {}).get('quantity', 0))
-            inflight_quantity = inflight_map.get(key, 0)
-            delta = desired_quantity - (current_quantity + inflight_quantity)
-            if delta == 0:
-                continue
-            action = 'BUY' if delta > 0 else 'SELL'
-            order_plan.append({
+            for contributor in target['contributors']:
+                quantities = strategy_targets.setdefault(contributor['strategy_id'], {})
+                quantities[key] = quantities.get(key, 0) + contributor['quantity']
+        strategy_holdings = await self._load_strategy_holdings(final_targets)
+        netting = NettingEngine.from_config(self._env.config).net(
+            final_targets,
+            strategy_targets,
+            strategy_holdings,
+            {key: holding['quantity'] for key, holding in holdings_map.items()},
+            inflight_map,
+            prices=self._unit_prices(final_targets, portfolio),
+            symbols={key: target.get('symbol') for key, target in final_targets.items()},
+        )
+
+        def _plan_entry(net: NetOrder) -> Dict[str, Any]:
+            target = final_targets[net.key]
+            return {
                 'contract': target['contract'],
                 'symbol': target.get('symbol'),
                 'secType': target.get('secType'),
                 'exchange': target.get('exchange'),
                 'currency': target.get('currency'),
-                'desired_quantity': desired_quantity,
-                'current_quantity': current_quantity,
-                'inflight_quantity': inflight_quantity,
-                'delta': delta,
-                'action': action,
-                'quantity': abs(delta)
-            })
+                'desired_quantity': net.desired,
+                'current_quantity': net.current,
+                'inflight_quantity': net.inflight,
+                'net_delta': net.raw_delta,
+                'crossed_quantity': net.crossed,
+                'rounding': net.adjustment,
+                'delta': net.delta,
+                'action': 'BUY' if net.delta > 0 else 'SELL',
+                'quantity': abs(net.delta)
+            }
+
+        order_plan = [_plan_entry(net) for net in netting.orders]
+        suppressed = [_plan_entry(net) for net in netting.suppressed]
+        virtual_fills = [fill.to_dict() for fill in netting.virtual_fills]
+        if virtual_fills:
+            self._emit_progress('cross', fills=virtual_fills)
+
+        self._emit_progress('plan', orders=order_plan)
 
         orders_placed: List[Dict[str, Any]] = []
+        rejected: List[Dict[str, Any]] = []
         if not self._dry_run:
-            for plan in order_plan:
-                contract = util.dictToContract(plan['contract'])
-                if contract.conId is None:
-                    qualified = await self._env.ibgw.qualifyContractsAsync(contract)
-                    if qualified:
-                        contract = qualified[0]
-                order = MarketOrder(plan['action'], plan['quantity'])
-                trade = self._env.ibgw.placeOrder(contract, order)
-                if trade:
-                    await asyncio.sleep(0.1)
-                    orders_placed.append({
-                        'orderId': trade.order.orderId,
-                        'symbol': trade.contract.symbol,
-                        'action': trade.order.action,
-                        'quantity': trade.order.totalQuantity,
-                        'status': trade.orderStatus.status
-                    })
+            contracts = [util.dictToContract(plan['contract']) for plan in order_plan]
+            qualified = await self._env.contracts.qualify(*contracts)
+            orders = [(qualified_contract or contract, MarketOrder(plan['action'], plan['quantity']))
+                      for plan, contract, qualified_contract in zip(order_plan, contracts, qualified)]
+            acks = await self._env.orders.submit(
+                orders, on_ack=lambda ack: self._emit_progress('order', order=ack.to_dict()))
+            orders_placed = [ack.to_dict() for ack in acks if ack.trade is not None]
+            rejected = [ack.to_dict() for ack in acks if not ack.acknowledged]
         else:
             for plan in order_plan:
                 orders_placed.append({
@@ -152,6 +168,7 @@ class Allocation(Intent):
                     'action': plan['action'],
                     'quantity': plan['quantity']
                 })
+                self._emit_progress('order', order=orders_placed[-1])
 
         execution_payload = {
             'executed_at': now.isoformat(),
@@ -159,7 +176,7 @@ class Allocation(Intent):
             'status': 'completed',
             'summary': f"Planned {len(order_plan)} orders; {'placed' if not self._dry_run else 'simulated'} {len(orders_placed)}",
             'context': {
-                'portfolio_snapshot_ref': f"{portfolio_doc_ref.path}@{portfolio.get('updated_at')}",
+                'portfolio_snapshot_ref': f"{portfolio_path}@{portfolio.get('updated_at')}",
                 'strategy_snapshots': strategy_snapshots,
                 'strategy_intents_refs': intent_refs,
                 'missing_strategies': missing_strategies,
@@ -183,19 +200,26 @@ class Allocation(Intent):
                     }
                     for target in final_targets.values()
                 ],
-                'diff': order_plan
+                'diff': order_plan,
+                'suppressed': suppressed
             },
             'orders': orders_placed,
+            'virtual_fills': virtual_fills,
+            'rejected_orders': rejected,
             'dry_run': self._dry_run
         }
 
-        execution_doc = self._env.db.collection('executions').document()
-        execution_doc.set(execution_payload)
+        await self._persist(self._env.store.new_path('executions'), execution_payload)
 
         self._activity_log.update(
             status='success',
             ordersPlanned=len(order_plan),
             ordersPlaced=len(orders_placed),
+            ordersRejected=len(rejected),
+            ordersSuppressed=len(suppressed),
+            grossQuantity=netting.gross_quantity,
+            crossedQuantity=netting.crossed_quantity,
+            virtualFills=len(virtual_fills),
             dryRun=self._dry_run,
             missingStrategies=missing_strategies,
             staleStrategies=stale_strategies
@@ -203,7 +227,43 @@ class Allocation(Intent):
 
         return execution_payload
 
-    def _collect_strategy_targets(
+    async def _load_strategy_holdings(self, targets: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+        """
+        Reads the holdings of the strategies that share a contract with another strategy, in one
+        batch. Nothing can be crossed in a contract only one strategy trades, so those are skipped.
+        """
+        strategy_ids = set()
+        for target in targets.values():
+            contributors = {contributor['strategy_id'] for contributor in target['contributors']}
+            if len(contributors) > 1:
+                strategy_ids |= contributors
+        if not strategy_ids:
+            return {}
+        holdings_path = f'positions/{self._env.trading_mode}/holdings'
+        paths = {f'{holdings_path}/{strategy_id}': strategy_id for strategy_id in sorted(strategy_ids)}
+        fetched = await self._env.store.get_all(paths)
+        return {paths[path]: holdings or {} for path, holdings in fetched.items()}
+
+    @staticmethod
+    def _unit_prices(targets: Dict[str, Dict[str, Any]], portfolio: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Value of one unit of quantity per contract, for the minimum order notional: the price a
+        strategy published with its target, times the multiplier, or else the average cost.
+        """
+        prices: Dict[str, float] = {}
+        for holding in portfolio.get('holdings', []):
+            if holding.get('avgCost'):
+                prices[_contract_key(holding.get('contract', {}))] = float(holding['avgCost'])
+        for key, target in targets.items():
+            if target.get('price'):
+                try:
+                    multiplier = float(target['contract'].get('multiplier') or 1)
+                except ValueError:
+                    multiplier = 1.0
+                prices[key] = float(target['price']) * multiplier
+        return prices
+
+    async def _collect_strategy_targets(
         self,
         now: datetime,
         freshness_delta: timedelta,
@@ -214,9 +274,6 @@ class Allocation(Intent):
         List[str],
         Dict[str, Dict[str, Any]]
     ]:
-        strategies_ref = self._env.db.collection('strategies')
-        docs = list(strategies_ref.stream())
-
         snapshots: List[Dict[str, Any]] = []
         intent_refs: List[str] = []
         stale_strategies: List[str] = []
@@ -225,18 +282,7 @@ class Allocation(Intent):
 
         allowed_ids = set(self._strategy_ids) if self._strategy_ids else None
 
-        for doc in docs:
-            strategy_id = doc.id
-            strategy_config = doc.to_dict() or {}
-            if allowed_ids is not None and strategy_id not in allowed_ids:
-                continue
-            if allowed_ids is None and not strategy_config.get('enabled', True):
-                continue
-
-            intent_ref = doc.reference.collection('intent').document('latest')
-            intent_doc = intent_ref.get()
-            intent_data = intent_doc.to_dict() if intent_doc.exists else None
-
+        for strategy_id, strategy_config, intent_path, intent_data in await self._load_strategy_intents(allowed_ids, now, freshness_delta):
             snapshot_meta = {
                 'strategy_id': strategy_id,
                 'config': strategy_config,
@@ -245,11 +291,11 @@ class Allocation(Intent):
             }
             snapshots.append(snapshot_meta)
 
-            if not intent_doc.exists:
+            if intent_data is None:
                 missing_strategies.append(strategy_id)
                 continue
 
-            intent_refs.append(f"{intent_doc.reference.path}@{intent_data.get('updated_at')}")
+            intent_refs.append(f"{intent_path}@{intent_data.get('updated_at')}")
             updated_at = _parse_iso(intent_data.get('updated_at'))
             if updated_at and now - updated_at > freshness_delta:
                 stale_strategies.append(strategy_id)
@@ -273,6 +319,8 @@ class Allocation(Intent):
                         'contributors': []
                     }
                 aggregated_targets[key]['quantity'] += quantity
+                if target.get('price'):
+                    aggregated_targets[key]['price'] = target['price']
                 aggregated_targets[key]['contributors'].append({
                     'strategy_id': strategy_id,
                     'quantity': quantity
@@ -285,3 +333,63 @@ class Allocation(Intent):
                     missing_strategies.append(requested)
 
         return snapshots, intent_refs, stale_strategies, missing_strategies, aggregated_targets
+
+    async def _load_strategy_intents(
+        self,
+        allowed_ids: Optional[Set[str]],
+        now: datetime,
+        freshness_delta: timedelta,
+    ) -> List[Tuple[str, Dict[str, Any], Optional[str], Optional[Dict[str, Any]]]]:
+        """
+        Returns (strategy_id, config, intent_path, intent_data) for every selected strategy.
+
+        The strategy documents are streamed once for their config. Inside an Orchestrator
+        pipeline the targets of strategies that published this run come straight from
+        memory; a strategy that timed out or failed before publishing falls back to its
+        Firestore intent, like every strategy outside a pipeline. Those intent documents
+        are fetched in a single batched `get_all` through the environment's store, so the
+        read cost stays flat as strategies are added. Strategies whose freshness index
+        (`intent_updated_at`, `intent_status` on the strategy document) already marks
+        them as stale or failed are not fetched; the index values stand in for the
+        intent document.
+        """
+        published_intents = self._pipeline.strategy_intents if self._pipeline is not None else {}
+        entries: Dict[str, Tuple[Dict[str, Any], str, Optional[Dict[str, Any]]]] = {}
+        to_fetch = {}
+        async for doc in self._env.store.collection('strategies').stream():
+            strategy_id = doc.id
+            strategy_config = doc.to_dict() or {}
+            if allowed_ids is not None and strategy_id not in allowed_ids:
+                continue
+            if allowed_ids is None and not strategy_config.get('enabled', True):
+                continue
+
+            published = published_intents.get(strategy_id)
+            if published is not None:
+                entries[strategy_id] = (strategy_config, published['path'], published['data'])
+                continue
+
+            intent_path = f"strategies/{strategy_id}/intent/latest"
+            indexed_at = _parse_iso(strategy_config.get('intent_updated_at'))
+            indexed_status = strategy_config.get('intent_status')
+            if (indexed_at and now - indexed_at > freshness_delta) or indexed_status not in (None, 'success'):
+                index_data = {'updated_at': strategy_config.get('intent_updated_at'), 'status': indexed_status}
+                entries[strategy_id] = (strategy_config, intent_path, index_data)
+                continue
+
+            entries[strategy_id] = (strategy_config, intent_path, None)
+            to_fetch[intent_path] = strategy_id
+
+        # Published this run without a strategy document to stream.
+        for strategy_id, published in published_intents.items():
+            if strategy_id not in entries and (allowed_ids is None or strategy_id in allowed_ids):
+                entries[strategy_id] = ({}, published['path'], published['data'])
+
+        if to_fetch:
+            fetched = await self._env.store.get_all(to_fetch)
+            for intent_path, intent_data in fetched.items():
+                strategy_id = to_fetch[intent_path]
+                strategy_config, _, _ = entries[strategy_id]
+                entries[strategy_id] = (strategy_config, intent_path, intent_data)
+
+        return [(strategy_id, config, path, data) for strategy_id, (config, path, data) in entries.items()]
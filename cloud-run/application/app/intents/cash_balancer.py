@@ -47,29 +47,26 @@ class CashBalancer(Intent):
             self._env.logging.info('No cash balances above the threshold')
 
         if not self._dry_run and len(trades):
-            # place orders
-            perm_ids = []
-            for k, v in trades.items():
-                order = await self._env.ibgw.placeOrderAsync(Forex(pair=k, exchange='FXCONV'),
-                                                  MarketOrder('BUY' if v > 0 else 'SELL', abs(v)))
-                perm_ids.append(order.order.permId)
-            
-            # Wait for trades to appear
-            await asyncio.sleep(2)
+            # place orders; submit() returns once the gateway has acknowledged or rejected each one
+            acks = await self._env.orders.submit(
+                (Forex(pair=k, exchange='FXCONV'), MarketOrder('BUY' if v > 0 else 'SELL', abs(v)))
+                for k, v in trades.items())
 
             orders = {
-                t.contract.pair(): {
+                ack.trade.contract.pair(): {
                     'order': {
                         k: v
-                        for k, v in t.order.nonDefaults().items()
+                        for k, v in ack.trade.order.nonDefaults().items()
                         if isinstance(v, (int, float, str))
                     },
                     'orderStatus': {
                         k: v
-                        for k, v in t.orderStatus.nonDefaults().items()
+                        for k, v in ack.trade.orderStatus.nonDefaults().items()
                         if isinstance(v, (int, float, str))
-                    }
-                } for t in self._env.ibgw.openTrades() if t.orderStatus.permId in perm_ids
+                    },
+                    'ack': ack.result,
+                    'error': ack.error
+                } for ack in acks if ack.trade is not None
             }
             self._activity_log.update(orders=orders)
             self._env.logging.info(f"Orders placed: {self._activity_log['orders']}")
@@ -1,95 +1,154 @@
 import asyncio
-from ib_insync import MarketOrder, Contract, Position
+import time
+from typing import Any, Dict, List, Tuple
+
+from ib_insync import MarketOrder, Contract
 from intents.intent import Intent
+from lib.orders import DONE_STATUSES
 
 class CloseAll(Intent):
     """
     Closes positions and cancels open orders.
     Can be configured to close all account positions, or only those for specific strategies.
     Supports dryRun mode.
+
+    Flattening is built for latency: this client's open orders are cancelled
+    back to back and their confirmations awaited together, contracts are
+    qualified in a single batch, and all closing orders are sent at once.
+    Cancels and orders both go through the paced order pipeline, so a large
+    flatten stays within the gateway's message rate. Each confirmation is streamed as a
+    progress event as it arrives, and the activity log records how long every
+    phase took. Orders placed by other API clients or in TWS are left alone.
+
+    The intent returns once the closing orders are acknowledged. With
+    waitForFills it also waits up to FILL_TIMEOUT for the fills, which keeps
+    the account's order queue blocked for that long.
     """
+
+    # Flattening takes precedence over any other queued order flow.
+    PRIORITY = 0
+    TIMEOUT = 120
+    # How long to wait for the gateway to confirm cancellations before closing positions.
+    CANCEL_TIMEOUT = 10
+    # How long waitForFills waits for the closing orders to fill before reporting them as unfilled.
+    FILL_TIMEOUT = 15
+
     def __init__(self, env, **kwargs):
         super().__init__(env=env, **kwargs)
         self._dry_run = kwargs.get('dryRun', False)
         self._strategies_to_close = kwargs.get('strategies', [])
+        self._wait_for_fills = kwargs.get('waitForFills', False)
         self._activity_log.update(dryRun=self._dry_run, strategies=self._strategies_to_close)
 
     async def _core_async(self):
-        # 1. 取消所有挂单 (这仍然是一个全局操作，是安全的)
-        self._env.logging.warning("Cancelling all open orders...")
-        if not self._dry_run:
-            open_orders = await self._env.ibgw.reqOpenOrdersAsync()
-            for order in open_orders:
-                await self._env.ibgw.cancelOrderAsync(order)
-            if open_orders:
-                await asyncio.sleep(2)
-                self._env.logging.info(f"{len(open_orders)} open orders cancelled.")
-
-        # 2. 根据参数决定是清空全部还是部分
-        positions_to_close = []
+        started = time.monotonic()
+        latency: Dict[str, float] = {}
+
+        def lap(phase: str):
+            latency[phase] = round((time.monotonic() - started) * 1000, 1)
+
+        # 1. Cancel this client's open orders (safe whichever positions are closed).
+        #    Strategy holdings come from Firestore and do not depend on fills, so they are loaded meanwhile.
+        strategy_positions = None
         if self._strategies_to_close:
-            # --- 精确清仓逻辑 ---
             self._env.logging.warning(f"Closing positions for specified strategies: {self._strategies_to_close}")
-            positions_to_close = await self._get_positions_for_strategies(self._strategies_to_close)
+            strategy_positions = asyncio.ensure_future(self._get_positions_for_strategies(self._strategies_to_close))
+        if not self._dry_run:
+            self._env.logging.warning("Cancelling open orders...")
+            await self._cancel_open_orders()
+            lap('cancelMs')
+
+        # 2. Positions to close. Account positions are read after the cancels so fills racing them are included.
+        if strategy_positions is not None:
+            positions_to_close = await strategy_positions
         else:
-            # --- 一键清仓逻辑 ---
             self._env.logging.warning("Closing ALL positions for the account...")
-            positions_to_close = await self._env.ibgw.reqPositionsAsync()
+            positions = await self._env.ibgw.reqPositionsAsync()
+            positions_to_close = await self._qualified([(p.contract, p.position) for p in positions])
+        positions_to_close = [(contract, quantity) for contract, quantity in positions_to_close if quantity]
+        lap('positionsMs')
 
         if not positions_to_close:
             self._env.logging.info("No positions to close.")
+            self._activity_log.update(latency=latency)
             return {"status": "No positions to close."}
 
-        # 3. 生成平仓计划
-        closing_plan = []
-        for p in positions_to_close:
-            if p.position == 0: continue
-            action = 'SELL' if p.position > 0 else 'BUY'
-            quantity = abs(p.position)
-            closing_plan.append({
-                'symbol': p.contract.localSymbol, 'action': action, 'quantity': quantity
-            })
+        # 3. Closing plan
+        closing_plan = [
+            {'symbol': contract.localSymbol or contract.symbol, 'conId': contract.conId,
+             'action': 'SELL' if quantity > 0 else 'BUY', 'quantity': abs(quantity)}
+            for contract, quantity in positions_to_close
+        ]
         self._activity_log.update(closing_plan=closing_plan)
+        self._emit_progress('plan', orders=closing_plan)
 
-        # 4. 如果不是 dryRun，则执行下单
+        # 4. Unless dryRun, fire all closing orders at once and stream the confirmations back.
         if not self._dry_run:
             self._env.logging.info("Executing closing orders...")
-            executed_orders = []
-            for p in positions_to_close:
-                 if p.position == 0: continue
-                 action = 'SELL' if p.position > 0 else 'BUY'
-                 quantity = abs(p.position)
-                 order = MarketOrder(action, quantity)
-                 trade = await self._env.ibgw.placeOrderAsync(p.contract, order)
-                 executed_orders.append({'symbol': p.contract.localSymbol, 'orderId': trade.order.orderId, 'status': trade.orderStatus.status})
+            acks = await self._env.orders.submit(
+                [(contract, MarketOrder(plan['action'], plan['quantity']))
+                 for (contract, _), plan in zip(positions_to_close, closing_plan)],
+                on_ack=lambda ack: self._emit_progress('order', order=ack.to_dict()))
+            lap('ackMs')
+            executed_orders = [ack.to_dict() for ack in acks if ack.trade is not None]
             self._activity_log.update(executed_orders=executed_orders)
-        
+
+            working = [ack.trade for ack in acks if ack.acknowledged]
+            if self._wait_for_fills and working:
+                statuses = await self._env.order_tracker.all('filled', working, self.FILL_TIMEOUT)
+                lap('flattenMs')
+                unfilled = [
+                    {'orderId': trade.order.orderId, 'symbol': trade.contract.symbol, 'status': status,
+                     'remaining': trade.remaining()}
+                    for trade, status in zip(working, statuses) if status != 'Filled'
+                ]
+                if unfilled:
+                    self._env.logging.warning(f"Closing orders not filled: {unfilled}")
+                self._activity_log.update(unfilled=unfilled)
+
+        self._activity_log.update(latency=latency)
+        self._env.logging.info(f"CloseAll latency: {latency}")
         return self._activity_log
 
-    async def _get_positions_for_strategies(self, strategy_ids: list) -> list:
+    async def _cancel_open_orders(self):
+        """
+        Cancels this client's open orders, paced through the order pipeline, and waits until the
+        gateway confirms them. reqGlobalCancel is not used: it would also cancel orders of other
+        clients on the account.
+        """
+        # Refreshes openTrades() with the orders the gateway knows about.
+        await self._env.ibgw.reqOpenOrdersAsync()
+        open_trades = self._env.ibgw.openTrades()
+        if not open_trades:
+            return
+        await self._env.orders.cancel(open_trades)
+        statuses = await self._env.order_tracker.all('cancelled', open_trades, self.CANCEL_TIMEOUT)
+        working = [t.order.orderId for t, status in zip(open_trades, statuses) if status not in DONE_STATUSES]
+        if working:
+            self._env.logging.warning(f"Orders {working} not confirmed cancelled within {self.CANCEL_TIMEOUT}s.")
+        self._env.logging.info(f"{len(open_trades) - len(working)} open orders cancelled.")
+        self._activity_log.update(cancelledOrders=len(open_trades) - len(working), uncancelledOrders=working)
+
+    async def _get_positions_for_strategies(self, strategy_ids: list) -> List[Tuple[Contract, float]]:
         """
-        从 Firestore 读取指定策略的持仓，并将其转换为 ib_insync 的 Position 对象列表。
+        Reads the holdings of the given strategies from Firestore in one batch and nets them per
+        contract, so strategies holding opposite positions in the same contract need no orders.
         """
-        positions_to_return = []
-        holdings_ref = self._env.db.collection(f'positions/{self._env.trading_mode}/holdings')
-        
+        holdings_path = f'positions/{self._env.trading_mode}/holdings'
+        fetched = await self._env.store.get_all([f'{holdings_path}/{strategy_id}' for strategy_id in strategy_ids])
+
+        net: Dict[int, float] = {}
         for strategy_id in strategy_ids:
-            doc_ref = holdings_ref.document(strategy_id)
-            doc = await doc_ref.get()
-            if not doc.exists:
+            holdings = fetched[f'{holdings_path}/{strategy_id}']
+            if holdings is None:
                 self._env.logging.warning(f"No holdings found in Firestore for strategy: {strategy_id}")
                 continue
+            for con_id, quantity in holdings.items():
+                net[int(con_id)] = net.get(int(con_id), 0.0) + float(quantity)
+
+        return await self._qualified([(Contract(conId=con_id), quantity) for con_id, quantity in net.items()])
 
-            holdings = doc.to_dict()
-            for conId_str, quantity in holdings.items():
-                # 创建一个临时的 Position 对象，以便后续代码可以统一处理
-                pos = Position(
-                    account=self._env.config['account'],
-                    contract=Contract(conId=int(conId_str)),
-                    position=float(quantity)
-                )
-                # 我们需要获取完整的合约信息才能下单
-                await self._env.ibgw.qualifyContractsAsync(pos.contract)
-                positions_to_return.append(pos)
-                
-        return positions_to_return
\ No newline at end of file
+    async def _qualified(self, positions: List[Tuple[Any, float]]) -> List[Tuple[Contract, float]]:
+        """Completes the contracts in one bulk request; orders need the exchange that positions leave empty."""
+        qualified = await self._env.contracts.qualify(*[contract for contract, _ in positions])
+        return [(contract or original, quantity) for (original, quantity), contract in zip(positions, qualified)]
@@ -1,35 +1,103 @@
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 from hashlib import md5
 import logging
-from typing import TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
 if TYPE_CHECKING:
+    from intents.pipeline import PipelineContext
     from lib.environment import Environment
 
 class Intent:
+
+    # Read-only intents never place orders and may run concurrently with each other.
+    READ_ONLY = False
+    # Queue priority for order-placing intents; lower values run first.
+    PRIORITY = 10
+    # Seconds an HTTP caller waits before the intent is cancelled; override via config 'intentTimeouts'.
+    TIMEOUT = 60
+
     def __init__(self, env: "Environment", **kwargs):
         self._env = env
-        hashstr = self._env.env.get('K_REVISION', 'localhost') + self.__class__.__name__ + json.dumps(kwargs, sort_keys=True)
-        self._signature = md5(hashstr.encode()).hexdigest()
+        self._signature = self.signature_for(env, **kwargs)
         self._activity_log = {
             'agent': self._env.env.get('K_REVISION', 'localhost'),
-            'config': self._env.config,
+            'configHash': self._env.config_hash,
+            'configVersion': self._env.config_version,
             'exception': None,
             'intent': self.__class__.__name__,
             'signature': self._signature,
             'tradingMode': self._env.trading_mode
         }
         self._activity_log.update(kwargs)
+        self._progress_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._pipeline: Optional["PipelineContext"] = None
+
+    @classmethod
+    def signature_for(cls, env: "Environment", **kwargs) -> str:
+        """md5 over revision, intent class and request body; identical requests share a signature."""
+        hashstr = env.env.get('K_REVISION', 'localhost') + cls.__name__ + json.dumps(kwargs, sort_keys=True)
+        return md5(hashstr.encode()).hexdigest()
 
     async def _core_async(self):
         """This is the main logic to be overridden by subclasses."""
         return {'currentTime': await self._env.ibgw.reqCurrentTimeAsync()}
 
+    def add_progress_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Registers a callback that receives progress events while the intent runs."""
+        self._progress_listeners.append(listener)
+
+    def attach_pipeline(self, pipeline: "PipelineContext") -> "Intent":
+        """Runs the intent as a stage of an Orchestrator pipeline."""
+        self._pipeline = pipeline
+        return self
+
+    def _nested(self, child: "Intent") -> "Intent":
+        """Lets a nested intent report progress to this intent's listeners and share its pipeline."""
+        for listener in self._progress_listeners:
+            child.add_progress_listener(listener)
+        if self._pipeline is not None:
+            child.attach_pipeline(self._pipeline)
+        return child
+
+    async def _persist(self, path: str, payload: Dict[str, Any], merge: bool = False):
+        """Queues a Firestore write; it is committed in the background by the environment's store."""
+        await self._env.store.write(path, payload, merge=merge)
+
+    async def _publish_strategy_intent(self, strategy_id: str, path: str, payload: Dict[str, Any]):
+        """
+        Publishes a strategy's target payload to `strategies/{id}/intent/latest` and the pipeline.
+        The parent strategy document carries a freshness index so Allocation can skip
+        stale or failed intents without fetching them. The index is queued as an update,
+        which only applies to an existing strategy document: creating one would register
+        the strategy, enabled by default, with every Allocation run that does not name
+        its strategies.
+        """
+        if self._pipeline is not None:
+            self._pipeline.publish_strategy_intent(strategy_id, path, payload)
+        await self._persist(path, payload)
+        index = {'intent_updated_at': payload.get('updated_at'), 'intent_status': payload.get('status')}
+        await self._env.store.update(f"strategies/{strategy_id}", index)
+
+    def _emit_progress(self, stage: str, **data):
+        if not self._progress_listeners:
+            return
+        event = {
+            'intent': self.__class__.__name__,
+            'stage': stage,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            **data
+        }
+        for listener in self._progress_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                self._env.logging.error(f"Progress listener failed: {e}", exc_info=True)
+
     def _log_activity(self):
         if self._activity_log:
             try:
                 self._activity_log.update(timestamp=datetime.utcnow())
-                self._env.db.collection('activity').document().set(self._activity_log)
+                self._env.store.write_nowait(self._env.store.new_path('activity'), self._activity_log)
             except Exception as e:
                 self._env.logging.error(f"Failed to log activity: {e}", exc_info=True)
 
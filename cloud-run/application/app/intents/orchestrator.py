@@ -1,7 +1,9 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import Any, Dict, List
 
 from intents.intent import Intent
+from intents.pipeline import PipelineContext
 from intents.reconcile import Reconcile
 from intents.allocation import Allocation
 from strategies.test_signal_generator import TestSignalGenerator
@@ -16,23 +18,39 @@ STRATEGY_INTENT_REGISTRY = {
 
 class Orchestrator(Intent):
     """
-    Single entrypoint that sequentially:
-    1. Executes enabled strategy intents to publish target positions.
-    2. Runs the reconcile intent to capture live portfolio state.
+    Single entrypoint that:
+    1. Executes enabled strategy intents concurrently to publish target positions.
+    2. Runs the reconcile intent alongside them to capture live portfolio state.
     3. Invokes the commander (allocation) intent to aggregate and place orders.
+
+    The stages share a PipelineContext, so the commander reads targets and the
+    portfolio from memory instead of reading back what the other stages wrote.
+
+    Strategy intents share a semaphore (`maxConcurrentStrategies`) so their
+    qualification and historical-data requests stay within IB pacing limits,
+    and each is cancelled after `strategyTimeout` seconds without affecting
+    the others.
     """
 
+    TIMEOUT = 300
+    DEFAULT_MAX_CONCURRENT_STRATEGIES = 3
+    DEFAULT_STRATEGY_TIMEOUT = 60
+
     def __init__(self, env, **kwargs):
         super().__init__(env, **kwargs)
         self._strategy_ids = [s.lower() for s in kwargs.get('strategies', [])]
         self._dry_run = kwargs.get('dryRun', False)
         self._fresh_minutes = kwargs.get('freshMinutes', 180)
         self._run_reconcile = kwargs.get('runReconcile', True)
+        self._max_concurrent_strategies = kwargs.get('maxConcurrentStrategies', self.DEFAULT_MAX_CONCURRENT_STRATEGIES)
+        self._strategy_timeout = kwargs.get('strategyTimeout', self.DEFAULT_STRATEGY_TIMEOUT)
         self._activity_log.update(
             dryRun=self._dry_run,
             strategies=self._strategy_ids,
             freshMinutes=self._fresh_minutes,
-            runReconcile=self._run_reconcile
+            runReconcile=self._run_reconcile,
+            maxConcurrentStrategies=self._max_concurrent_strategies,
+            strategyTimeout=self._strategy_timeout
         )
 
     async def _core_async(self) -> Dict[str, Any]:
@@ -44,53 +62,22 @@ class Orchestrator(Intent):
         }
 
         strategy_ids = self._strategy_ids or list(STRATEGY_INTENT_REGISTRY.keys())
+        # Stages hand targets and the portfolio snapshot to each other in memory.
+        self.attach_pipeline(PipelineContext())
 
-        for strategy_id in strategy_ids:
-            intent_cls = STRATEGY_INTENT_REGISTRY.get(strategy_id)
-            if not intent_cls:
-                error_msg = f"No registered strategy intent for '{strategy_id}'."
-                self._env.logging.error(error_msg)
-                pipeline_results['strategies'].append({
-                    'strategy_id': strategy_id,
-                    'status': 'error',
-                    'error': error_msg
-                })
-                continue
-
-            try:
-                intent_instance = intent_cls(self._env, strategy_id=strategy_id, dryRun=self._dry_run)
-                result = await intent_instance.run()
-                pipeline_results['strategies'].append({
-                    'strategy_id': strategy_id,
-                    'status': result.get('status', 'unknown'),
-                    'updated_at': result.get('updated_at'),
-                    'error': result.get('error_message'),
-                    'metadata': result.get('metadata')
-                })
-            except Exception as exc:  # noqa: BLE001
-                self._env.logging.error(f"Strategy '{strategy_id}' failed: {exc}", exc_info=True)
-                pipeline_results['strategies'].append({
-                    'strategy_id': strategy_id,
-                    'status': 'error',
-                    'error': str(exc)
-                })
-
-        if self._run_reconcile:
-            try:
-                reconcile_intent = Reconcile(self._env)
-                reconcile_result = await reconcile_intent.run()
-                pipeline_results['reconcile'] = {
-                    'status': 'success',
-                    'updated_at': reconcile_result.get('updated_at'),
-                    'holdings': len(reconcile_result.get('holdings', [])),
-                    'open_orders': len(reconcile_result.get('open_orders', []))
-                }
-            except Exception as exc:  # noqa: BLE001
-                self._env.logging.error(f"Reconcile failed: {exc}", exc_info=True)
-                pipeline_results['reconcile'] = {
-                    'status': 'error',
-                    'error': str(exc)
-                }
+        # Reconcile only reads broker state, so it overlaps with the strategy phase.
+        reconcile_task = asyncio.create_task(self._reconcile()) if self._run_reconcile else None
+        semaphore = asyncio.Semaphore(self._max_concurrent_strategies)
+        try:
+            pipeline_results['strategies'] = list(await asyncio.gather(
+                *[self._run_strategy(strategy_id, semaphore) for strategy_id in strategy_ids]
+            ))
+        except asyncio.CancelledError:
+            if reconcile_task is not None:
+                reconcile_task.cancel()
+            raise
+        if reconcile_task is not None:
+            pipeline_results['reconcile'] = await reconcile_task
 
         try:
             commander_kwargs = {
@@ -98,7 +85,7 @@ class Orchestrator(Intent):
                 'freshMinutes': self._fresh_minutes,
                 'strategies': strategy_ids
             }
-            commander_intent = Allocation(self._env, **commander_kwargs)
+            commander_intent = self._nested(Allocation(self._env, **commander_kwargs))
             commander_result = await commander_intent.run()
             pipeline_results['commander'] = {
                 'status': commander_result.get('status', 'unknown'),
@@ -114,6 +101,67 @@ class Orchestrator(Intent):
                 'status': 'error',
                 'error': str(exc)
             }
+        self._emit_progress('commander', result=pipeline_results['commander'])
 
         self._activity_log.update(status='success', pipeline=pipeline_results)
         return pipeline_results
+
+    async def _run_strategy(self, strategy_id: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        intent_cls = STRATEGY_INTENT_REGISTRY.get(strategy_id)
+        if not intent_cls:
+            error_msg = f"No registered strategy intent for '{strategy_id}'."
+            self._env.logging.error(error_msg)
+            outcome = {
+                'strategy_id': strategy_id,
+                'status': 'error',
+                'error': error_msg
+            }
+            self._emit_progress('strategy', result=outcome)
+            return outcome
+
+        async with semaphore:
+            try:
+                intent_instance = self._nested(intent_cls(self._env, strategy_id=strategy_id, dryRun=self._dry_run))
+                result = await asyncio.wait_for(intent_instance.run(), self._strategy_timeout)
+                outcome = {
+                    'strategy_id': strategy_id,
+                    'status': result.get('status', 'unknown'),
+                    'updated_at': result.get('updated_at'),
+                    'error': result.get('error_message'),
+                    'metadata': result.get('metadata')
+                }
+            except asyncio.TimeoutError:
+                self._env.logging.error(f"Strategy '{strategy_id}' timed out after {self._strategy_timeout}s.")
+                outcome = {
+                    'strategy_id': strategy_id,
+                    'status': 'error',
+                    'error': f"Timed out after {self._strategy_timeout}s"
+                }
+            except Exception as exc:  # noqa: BLE001
+                self._env.logging.error(f"Strategy '{strategy_id}' failed: {exc}", exc_info=True)
+                outcome = {
+                    'strategy_id': strategy_id,
+                    'status': 'error',
+                    'error': str(exc)
+                }
+        self._emit_progress('strategy', result=outcome)
+        return outcome
+
+    async def _reconcile(self) -> Dict[str, Any]:
+        try:
+            reconcile_intent = self._nested(Reconcile(self._env))
+            reconcile_result = await reconcile_intent.run()
+            outcome = {
+                'status': 'success',
+                'updated_at': reconcile_result.get('updated_at'),
+                'holdings': len(reconcile_result.get('holdings', [])),
+                'open_orders': len(reconcile_result.get('open_orders', []))
+            }
+        except Exception as exc:  # noqa: BLE001
+            self._env.logging.error(f"Reconcile failed: {exc}", exc_info=True)
+            outcome = {
+                'status': 'error',
+                'error': str(exc)
+            }
+        self._emit_progress('reconcile', result=outcome)
+        return outcome
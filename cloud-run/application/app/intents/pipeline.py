@@ -0,0 +1,24 @@
+from typing import Any, Dict, Optional
+
+
+class PipelineContext:
+    """
+    In-memory hand-off between the stages of one Orchestrator run.
+
+    Strategy intents publish their target payloads here and Reconcile
+    publishes the portfolio snapshot, so Allocation can consume both without
+    reading them back from Firestore. The Firestore copies are still written
+    through the environment's write-behind store.
+    """
+
+    def __init__(self):
+        self.strategy_intents: Dict[str, Dict[str, Any]] = {}
+        self.portfolio: Optional[Dict[str, Any]] = None
+        self.portfolio_path: Optional[str] = None
+
+    def publish_strategy_intent(self, strategy_id: str, path: str, payload: Dict[str, Any]):
+        self.strategy_intents[strategy_id] = {'path': path, 'data': payload}
+
+    def publish_portfolio(self, path: str, payload: Dict[str, Any]):
+        self.portfolio_path = path
+        self.portfolio = payload
@@ -12,6 +12,8 @@ class Reconcile(Intent):
     Acts as the single source of truth for Commander decisions.
     """
 
+    READ_ONLY = True
+
     async def _core_async(self) -> Dict[str, Any]:
         self._env.logging.info("Starting portfolio reconciliation against IB Gateway...")
         snapshot_ts = datetime.now(timezone.utc).isoformat()
@@ -66,8 +68,11 @@ class Reconcile(Intent):
             "open_orders": open_orders
         }
 
-        doc_ref = self._env.db.document(f"positions/{self._env.trading_mode}/latest_portfolio")
-        doc_ref.set(payload)
+        portfolio_path = f"positions/{self._env.trading_mode}/latest_portfolio"
+        if self._pipeline is not None:
+            self._pipeline.publish_portfolio(portfolio_path, payload)
+        await self._persist(portfolio_path, payload)
+        self._emit_progress('snapshot', holdings=holdings, open_orders=len(open_orders))
 
         self._activity_log.update(status="success", reconciledHoldings=len(holdings), openOrders=len(open_orders))
         return payload
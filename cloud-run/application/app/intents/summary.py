@@ -2,6 +2,9 @@ from intents.intent import Intent
 import asyncio
 
 class Summary(Intent):
+
+    READ_ONLY = True
+
     def __init__(self, env, **kwargs):
         super().__init__(env=env, **kwargs)
         self._activity_log = {}  # don't log summary requests
@@ -23,10 +23,9 @@ class TradeReconciliation(Intent):
             holdings_snapshot = {str(item.contract.conId): item.position for item in portfolio}
             self._env.logging.info(f"Constructed holdings snapshot: {holdings_snapshot}")
 
-            holdings_doc_ref = self._env.db.document(f'positions/{self._env.trading_mode}/holdings/all_positions')
-            # CORRECTED: .set() is a synchronous method.
-            holdings_doc_ref.set(holdings_snapshot, merge=False)
-            self._env.logging.info(f"Successfully wrote portfolio snapshot to {holdings_doc_ref.path}")
+            holdings_path = f'positions/{self._env.trading_mode}/holdings/all_positions'
+            await self._persist(holdings_path, holdings_snapshot)
+            self._env.logging.info(f"Queued portfolio snapshot write to {holdings_path}")
             self._activity_log.update(reconciled_holdings=holdings_snapshot)
 
         except Exception as e:
@@ -67,12 +66,12 @@ class TradeReconciliation(Intent):
         """Finds the corresponding activity log for an order and updates it with fill details."""
         # This sub-function remains the same as it correctly handles the audit part.
         activity_query = (
-            self._env.db.collection('activity')
+            self._env.store.collection('activity')
             .where('orders.permId', '==', perm_id)
             .limit(1)
         )
 
-        docs = list(activity_query.stream())
+        docs = [doc async for doc in activity_query.stream()]
 
         if not docs:
             logging.warning(f"Audit: Could not find activity log for order with permId {perm_id}.")
@@ -96,7 +95,7 @@ class TradeReconciliation(Intent):
         order_to_update['lastUpdateTime'] = datetime.utcnow().isoformat()
 
         try:
-            activity_doc_ref.update({'orders': activity_data['orders']})
+            await self._persist(activity_doc_ref.path, {'orders': activity_data['orders']}, merge=True)
             logging.info(
                 f"Audit success: Updated activity {activity_doc_ref.id} for order {perm_id}."
             )
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import tempfile
+import unittest
+
+import pandas as pd
+
+from lib.bar_store import BarStore
+from lib.market_data import BarCache, SeriesKey
+
+
+class FakeIBGW:
+    def __init__(self, days):
+        self.days = days
+        self.requests = []
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                                     timeout):
+        self.requests.append(durationStr)
+        count = int(durationStr.split()[0])
+        return [SimpleNamespace(date=day, close=float(day.toordinal())) for day in self.days[-count:]]
+
+
+class BarStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = BarStore(self.tmp.name)
+        today = datetime.now(timezone.utc).date()
+        self.days = [today - timedelta(days=n) for n in range(30, 0, -1)]
+        self.spy = SimpleNamespace(conId=756733, symbol='SPY')
+
+    def test_round_trip_keeps_bars_and_windows(self):
+        key = SeriesKey(756733, '1 day', 'TRADES', True)
+        bars = pd.DataFrame({'date': self.days, 'close': [float(n) for n in range(30)]})
+        self.store.write('SPY', key, bars, {'30 D': 30})
+
+        self.assertEqual('symbol=SPY/bar_size=1 day/756733-TRADES-rth.parquet',
+                         self.store.path('SPY', key).relative_to(self.tmp.name).as_posix())
+        loaded, windows, age = self.store.read('SPY', key)
+        self.assertTrue(bars.equals(loaded))
+        self.assertEqual({'30 D': 30}, windows)
+        self.assertLess(age, 60)
+        self.assertEqual(30, self.store.read_table('SPY', key).num_rows)
+        self.assertIsNone(self.store.read('VIXY', key))
+
+    def test_restarted_cache_resumes_from_disk(self):
+        async def run(ibgw, ttl):
+            return await BarCache(ibgw, ttl=ttl, store=self.store).get_bars(self.spy, '20 D', '1 day')
+
+        first = asyncio.run(run(FakeIBGW(self.days), 60))
+        warm_ibgw = FakeIBGW(self.days)
+        warm = asyncio.run(run(warm_ibgw, 60))
+        self.assertEqual([], warm_ibgw.requests)
+        self.assertTrue(first.equals(warm))
+
+        stale_ibgw = FakeIBGW(self.days)
+        asyncio.run(run(stale_ibgw, 0))
+        self.assertEqual(['3 D'], stale_ibgw.requests)
+
+    def test_invalidated_series_is_pulled_in_full(self):
+        cache = BarCache(FakeIBGW(self.days), store=self.store)
+        key = SeriesKey(756733, '1 day', 'TRADES', True)
+
+        async def scenario():
+            await cache.get_bars(self.spy, '20 D', '1 day')
+            await cache.invalidate(self.spy, '1 day')
+
+        asyncio.run(scenario())
+        self.assertIsNone(self.store.read('SPY', key))
+        self.assertEqual(0, cache.stats()['series'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock
+
+from lib.config import ConfigCache, config_hash
+
+
+def _doc(data, minute=0):
+    return SimpleNamespace(exists=data is not None, to_dict=lambda: dict(data),
+                           update_time=datetime(2026, 10, 18, 14, minute, tzinfo=timezone.utc))
+
+
+class FakeDB:
+    def __init__(self, docs):
+        self.docs = docs
+        self.callbacks = {}
+
+    def document(self, path):
+        def on_snapshot(callback):
+            self.callbacks[path] = callback
+            return MagicMock()
+        return SimpleNamespace(get=lambda: self.docs.get(path, _doc(None)), on_snapshot=on_snapshot)
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDB({
+            'config/common': _doc({'tradingEnabled': True, 'marketDataType': 3, 'account': 'DU1'}),
+            'config/paper': _doc({'account': 'DU2'}, minute=5)
+        })
+        self.cache = ConfigCache(self.db, 'paper', MagicMock())
+
+    def test_load_overlays_mode_on_common(self):
+        snapshot = self.cache.load()
+        self.assertEqual({'tradingEnabled': True, 'marketDataType': 3, 'account': 'DU2'}, self.cache.config)
+        self.assertEqual(config_hash(self.cache.config), snapshot.hash)
+        self.assertEqual('2026-10-18T14:05:00+00:00', snapshot.version)
+
+    def test_snapshot_updates_swap_config_and_notify(self):
+        self.cache.load()
+        self.cache.watch()
+        changes = []
+        self.cache.add_listener(lambda old, new: changes.append((old, new)))
+        before = self.cache.config
+
+        # Initial listener delivery repeats the loaded state: no change.
+        self.db.callbacks['config/common']([self.db.docs['config/common']], [], None)
+        self.assertEqual([], changes)
+
+        self.db.callbacks['config/common']([_doc({'tradingEnabled': False, 'marketDataType': 3}, minute=9)], [], None)
+        self.assertEqual(1, len(changes))
+        old, new = changes[0]
+        self.assertTrue(old.config['tradingEnabled'])
+        self.assertFalse(self.cache.config['tradingEnabled'])
+        self.assertEqual('DU2', self.cache.config['account'])
+        self.assertEqual('2026-10-18T14:09:00+00:00', new.version)
+        # Readers holding the previous dict keep a consistent view.
+        self.assertTrue(before['tradingEnabled'])
+
+        self.db.callbacks['config/paper']([_doc(None)], [], None)
+        self.assertNotIn('account', self.cache.config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ib_insync import Contract, Stock
+
+from lib.contracts import ContractRegistry
+
+
+class FakeIBGW:
+    CON_IDS = {'SPY': 756733, 'VIXY': 4215222}
+
+    def __init__(self):
+        self.calls = []
+
+    async def qualifyContractsAsync(self, *contracts):
+        self.calls.append([c.symbol or c.conId for c in contracts])
+        await asyncio.sleep(0.01)
+        qualified = []
+        for contract in contracts:
+            con_id = self.CON_IDS.get(contract.symbol)
+            if con_id:
+                contract.conId = con_id
+                contract.primaryExchange = 'ARCA'
+                qualified.append(contract)
+        return qualified
+
+
+def _stock(symbol):
+    return Stock(symbol=symbol, secType='STK', exchange='SMART', currency='USD', conId=0)
+
+
+class ContractRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'contracts.json')
+        self.ibgw = FakeIBGW()
+
+    def test_bulk_qualification_is_cached_and_shared(self):
+        registry = ContractRegistry(self.ibgw, path=self.path)
+
+        async def scenario():
+            first, concurrent = await asyncio.gather(
+                registry.qualify(_stock('SPY'), _stock('VIXY')),
+                registry.qualify_one(_stock('SPY')))
+            again = await registry.qualify(_stock('VIXY'), _stock('SPY'))
+            return first, concurrent, again
+
+        first, concurrent, again = asyncio.run(scenario())
+        self.assertEqual([['SPY', 'VIXY']], self.ibgw.calls)
+        self.assertEqual([756733, 4215222], [c.conId for c in first])
+        self.assertEqual(756733, concurrent.conId)
+        self.assertEqual([4215222, 756733], [c.conId for c in again])
+        self.assertIsNot(first[0], again[1])
+
+    def test_failures_are_negatively_cached(self):
+        registry = ContractRegistry(self.ibgw, path=self.path, negative_ttl=60)
+
+        async def scenario():
+            return await registry.qualify_one(_stock('NOPE')), await registry.qualify_one(_stock('NOPE'))
+
+        self.assertEqual((None, None), asyncio.run(scenario()))
+        self.assertEqual([['NOPE']], self.ibgw.calls)
+        self.assertEqual(1, registry.stats()['negativeHits'])
+
+    def test_registry_is_persisted_and_indexed_by_con_id(self):
+        asyncio.run(ContractRegistry(self.ibgw, path=self.path).qualify(_stock('SPY')))
+
+        restarted = ContractRegistry(FakeIBGW(), path=self.path)
+        by_con_id = restarted.lookup(Contract(conId=756733))
+        self.assertEqual('SPY', by_con_id.symbol)
+        self.assertEqual(756733, restarted.lookup(_stock('SPY')).conId)
+
+
+if __name__ == '__main__':
+    unittest.main()
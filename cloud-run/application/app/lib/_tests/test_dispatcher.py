@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+import unittest
+
+from intents.intent import Intent
+from lib.dispatcher import IntentDispatcher
+
+
+class FakeIntent:
+    READ_ONLY = False
+    PRIORITY = 10
+    started = []
+    finished = []
+    active = 0
+    peak = 0
+
+    def __init__(self, env, **kwargs):
+        self._kwargs = kwargs
+
+    async def run(self):
+        FakeIntent.started.append(self._kwargs.get('name'))
+        FakeIntent.active += 1
+        FakeIntent.peak = max(FakeIntent.peak, FakeIntent.active)
+        await asyncio.sleep(0.01)
+        FakeIntent.active -= 1
+        FakeIntent.finished.append(self._kwargs.get('name'))
+        if self._kwargs.get('fail'):
+            raise SystemExit("Trading disabled by kill switch.")
+        return {'intent': type(self).__name__, 'name': self._kwargs.get('name')}
+
+
+class FakeReadOnlyIntent(FakeIntent):
+    READ_ONLY = True
+
+
+class FakeUrgentIntent(FakeIntent):
+    PRIORITY = 0
+
+
+class ProgressIntent(Intent):
+    READ_ONLY = True
+
+    async def run(self):
+        child = self._nested(Intent(self._env, child=True))
+        child._emit_progress('order', order={'symbol': 'SPY'})
+        self._emit_progress('done')
+        return {}
+
+
+class IntentDispatcherTests(unittest.TestCase):
+    def setUp(self):
+        FakeIntent.started = []
+        FakeIntent.finished = []
+        FakeIntent.active = 0
+        FakeIntent.peak = 0
+        self.env = SimpleNamespace(config={'account': 'DU123'}, config_hash='cfg', config_version=None, env={},
+                                   trading_mode='paper')
+
+    def test_read_only_intents_run_concurrently(self):
+        async def scenario():
+            dispatcher = IntentDispatcher(self.env)
+            return await asyncio.gather(*[
+                dispatcher.execute(f'r{i}', FakeReadOnlyIntent, {'name': f'r{i}'}) for i in range(3)
+            ])
+
+        results = asyncio.run(scenario())
+        self.assertEqual(3, FakeIntent.peak)
+        self.assertEqual(['r0', 'r1', 'r2'], [data['name'] for data, _ in results])
+
+    def test_order_intents_are_serialized_by_priority(self):
+        async def scenario():
+            dispatcher = IntentDispatcher(self.env)
+            jobs = [
+                await dispatcher.submit('a', FakeIntent, {'name': 'a'}),
+                await dispatcher.submit('b', FakeIntent, {'name': 'b'}),
+                await dispatcher.submit('c', FakeUrgentIntent, {'name': 'c'})
+            ]
+            await asyncio.gather(*[job.future for job in jobs])
+
+        asyncio.run(scenario())
+        self.assertEqual(1, FakeIntent.peak)
+        self.assertEqual(['c', 'a', 'b'], FakeIntent.started)
+
+    def test_full_queue_and_kill_switch(self):
+        async def scenario():
+            dispatcher = IntentDispatcher(self.env, queue_depth=1)
+            job = await dispatcher.submit('a', FakeIntent, {'name': 'a', 'fail': True})
+            with self.assertRaises(asyncio.QueueFull):
+                await dispatcher.submit('b', FakeIntent, {'name': 'b'})
+            return await job.future
+
+        self.assertEqual(({}, 'SystemExit: Trading disabled by kill switch.'), asyncio.run(scenario()))
+
+    def test_timeout_cancels_running_intent(self):
+        async def scenario():
+            dispatcher = IntentDispatcher(self.env)
+            with self.assertRaises(asyncio.TimeoutError):
+                await dispatcher.execute('slow', FakeIntent, {'name': 'slow'}, timeout=0.001)
+            await asyncio.sleep(0.02)
+            return await dispatcher.execute('next', FakeIntent, {'name': 'next'}, timeout=1)
+
+        data, error = asyncio.run(scenario())
+        self.assertIsNone(error)
+        self.assertEqual('next', data['name'])
+        self.assertEqual(['slow', 'next'], FakeIntent.started)
+        self.assertEqual(['next'], FakeIntent.finished)
+
+    def test_progress_events_reach_listener(self):
+        events = []
+
+        async def scenario():
+            await IntentDispatcher(self.env).execute('p', ProgressIntent, {}, progress=events.append)
+
+        asyncio.run(scenario())
+        self.assertEqual([('Intent', 'order'), ('ProgressIntent', 'done')], [(e['intent'], e['stage']) for e in events])
+        self.assertEqual({'symbol': 'SPY'}, events[0]['order'])
+
+
+if __name__ == '__main__':
+    unittest.main()
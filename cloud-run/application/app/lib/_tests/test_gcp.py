@@ -1,6 +1,9 @@
+import asyncio
+import threading
+from types import SimpleNamespace
 import unittest
 from unittest.mock import MagicMock, patch
-from test_support import install_google_cloud_stub
+from test_support import FakeAsyncFirestore, install_google_cloud_stub
 
 install_google_cloud_stub()
 
@@ -9,7 +12,7 @@ from google.cloud.bigquery import ArrayQueryParameter, ScalarQueryParameter
 with patch('lib.gcp.bigquery'):
     with patch('lib.gcp.firestore'):
         with patch('lib.gcp.secretmanager'):
-            from lib.gcp import GcpModule
+            from lib.gcp import FirestoreStore, GcpModule
 
 
 class TestGcpModule(unittest.TestCase):
@@ -87,5 +90,99 @@ class TestGcpModule(unittest.TestCase):
         fake_bq.query.side_effect = None
 
 
+class TestFirestoreStore(unittest.TestCase):
+
+    def setUp(self):
+        self.firestore = FakeAsyncFirestore({'config/common': {'a': 1}})
+        self.logging = MagicMock()
+        self.gcp = SimpleNamespace(adb=self.firestore, logging=self.logging)
+
+    def test_writes_are_batched_and_coalesced(self):
+        store = FirestoreStore(self.gcp, batch_size=10, linger=0.01)
+
+        async def scenario():
+            await store.write('jobs/1', {'status': 'queued'})
+            await store.write('jobs/1', {'status': 'running'})
+            store.write_nowait('jobs/1', {'status': 'succeeded'})
+            await store.write('strategies/s1', {'intent_status': 'success'}, merge=True)
+            await store.flush()
+            return await store.get('jobs/1'), await store.get_all(['config/common', 'missing/doc'])
+
+        job, docs = asyncio.run(scenario())
+        self.assertEqual({'status': 'succeeded'}, job)
+        self.assertEqual({'config/common': {'a': 1}, 'missing/doc': None}, docs)
+        self.assertEqual([['jobs/1', 'strategies/s1']], self.firestore.commits)
+        self.assertEqual(2, store.stats()['coalesced'])
+        self.assertEqual(4, store.stats()['maxPending'])
+
+    def test_full_queue_applies_backpressure(self):
+        store = FirestoreStore(self.gcp, queue_size=2, batch_size=2, linger=0.01)
+
+        async def scenario():
+            for i in range(6):
+                await store.write(f'activity/{i}', {'i': i})
+            await store.close()
+
+        asyncio.run(scenario())
+        stats = store.stats()
+        self.assertEqual(6, stats['written'])
+        self.assertEqual(3, stats['batches'])
+        self.assertGreater(stats['throttled'], 0)
+        self.assertEqual(0, stats['pending'])
+
+    def test_failed_commits_are_retried(self):
+        self.firestore.fail_commits = 1
+        store = FirestoreStore(self.gcp, linger=0)
+        store.RETRY_DELAY = 0
+
+        async def scenario():
+            await store.write('activity/1', {'i': 1})
+            await store.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual({'i': 1}, self.firestore.docs['activity/1'])
+        self.assertEqual(0, store.stats()['failed'])
+
+    def test_updates_of_missing_documents_are_skipped_without_reads(self):
+        store = FirestoreStore(self.gcp, batch_size=10, linger=0.01)
+
+        async def scenario():
+            await store.write('activity/1', {'i': 1})
+            await store.update('config/common', {'b': 2})
+            await store.update('strategies/missing', {'intent_status': 'success'})
+            await store.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual({'a': 1, 'b': 2}, self.firestore.docs['config/common'])
+        self.assertEqual({'i': 1}, self.firestore.docs['activity/1'])
+        self.assertNotIn('strategies/missing', self.firestore.docs)
+        self.assertEqual(0, self.firestore.reads)
+        self.assertEqual((2, 1, 0), tuple(store.stats()[k] for k in ('written', 'skipped', 'failed')))
+
+    def test_bound_store_takes_writes_from_other_loops(self):
+        store = FirestoreStore(self.gcp, queue_size=2, batch_size=2, linger=0.01)
+        ib_loop = asyncio.new_event_loop()
+        # Bound before its loop runs, like the startup config write.
+        store.bind(ib_loop)
+        store.write_nowait('configVersions/abc', {'config': {}})
+        thread = threading.Thread(target=ib_loop.run_forever, daemon=True)
+        thread.start()
+
+        async def http_loop():
+            for i in range(6):
+                await store.write(f'activity/{i}', {'i': i})
+                store.write_nowait(f'jobs/{i}', {'i': i})
+
+        try:
+            asyncio.run(http_loop())
+            asyncio.run_coroutine_threadsafe(store.close(), ib_loop).result(5)
+        finally:
+            ib_loop.call_soon_threadsafe(ib_loop.stop)
+            thread.join(5)
+            ib_loop.close()
+        self.assertEqual(13, store.stats()['written'])
+        self.assertIn('configVersions/abc', self.firestore.docs)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+import unittest
+
+from lib.ib_simulator import PACING_VIOLATION, IBSimulator
+
+
+def _stock(symbol):
+    return SimpleNamespace(symbol=symbol, secType='STK', exchange='SMART', currency='USD', conId=0)
+
+
+def _order(action, quantity):
+    return SimpleNamespace(action=action, totalQuantity=quantity, orderType='MKT', orderId=0)
+
+
+class IBSimulatorTests(unittest.TestCase):
+
+    def _simulate(self, sim, scenario):
+        async def run():
+            await sim.connectAsync()
+            return await scenario()
+        return asyncio.run(run())
+
+    def test_same_seed_gives_same_bars_and_fills(self):
+        def session():
+            sim = IBSimulator(seed=11, latency=0, jitter=0, fill_latency=0)
+
+            async def scenario():
+                spy, = await sim.qualifyContractsAsync(_stock('SPY'))
+                bars = await sim.reqHistoricalDataAsync(spy, durationStr='10 D', barSizeSetting='1 day')
+                trade = sim.placeOrder(spy, _order('BUY', 10))
+                while not trade.isDone():
+                    await asyncio.sleep(0)
+                return [b.close for b in bars], trade.orderStatus.avgFillPrice, sim.positions()[0].position
+            return self._simulate(sim, scenario)
+
+        self.assertEqual(session(), session())
+        closes, fill_price, position = session()
+        self.assertEqual(7, len(closes))
+        self.assertGreater(fill_price, 0)
+        self.assertEqual(10, position)
+
+    def test_identical_history_request_is_a_pacing_violation(self):
+        sim = IBSimulator(latency=0, jitter=0)
+        errors = []
+        sim.errorEvent += lambda req_id, code, message, contract: errors.append(code)
+
+        async def scenario():
+            spy, = await sim.qualifyContractsAsync(_stock('SPY'))
+            first = await sim.reqHistoricalDataAsync(spy, durationStr='5 D', barSizeSetting='1 day')
+            second = await sim.reqHistoricalDataAsync(spy, durationStr='5 D', barSizeSetting='1 day')
+            return first, second
+
+        first, second = self._simulate(sim, scenario)
+        self.assertTrue(first)
+        self.assertEqual([], second)
+        self.assertEqual([PACING_VIOLATION], errors)
+        self.assertEqual(1, sim.stats()['pacingViolations'])
+
+    def test_disconnect_fails_in_flight_requests_until_reconnected(self):
+        sim = IBSimulator(latency=0.01, jitter=0, disconnect_every=2, connect_failures=0)
+        disconnects = []
+        sim.disconnectedEvent += lambda: disconnects.append(True)
+
+        async def scenario():
+            await sim.reqCurrentTimeAsync()
+            with self.assertRaises(ConnectionError):
+                await sim.reqCurrentTimeAsync()
+            self.assertFalse(sim.isConnected())
+            with self.assertRaises(ConnectionError):
+                await sim.reqPositionsAsync()
+            await sim.connectAsync()
+            return await sim.reqPositionsAsync()
+
+        self.assertEqual([], self._simulate(sim, scenario))
+        self.assertEqual([True], disconnects)
+
+    def test_order_lifecycle_emits_status_and_execution_events(self):
+        sim = IBSimulator(latency=0, jitter=0, fill_latency=0)
+        statuses, executions = [], []
+        sim.orderStatusEvent += lambda trade: statuses.append(trade.orderStatus.status)
+        sim.execDetailsEvent += lambda trade, fill: executions.append(fill.execution.shares)
+
+        async def scenario():
+            spy, = await sim.qualifyContractsAsync(_stock('SPY'))
+            trade = sim.placeOrder(spy, _order('SELL', 5))
+            while not trade.isDone():
+                await asyncio.sleep(0)
+            return await sim.reqExecutionsAsync()
+
+        fills = self._simulate(sim, scenario)
+        self.assertEqual(['Submitted', 'Filled'], statuses)
+        self.assertEqual([5], executions)
+        self.assertEqual('SLD', fills[0].execution.side)
+
+
+if __name__ == '__main__':
+    unittest.main()
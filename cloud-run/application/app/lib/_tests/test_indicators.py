@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lib import indicators
+
+
+class IndicatorTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.close = 100 + np.cumsum(rng.normal(size=(120, 3)), axis=0)
+        # Third symbol listed later than the others.
+        self.close[:20, 2] = np.nan
+
+    def test_macd_matches_pandas_per_symbol(self):
+        result = indicators.macd(self.close)
+        for column in range(3):
+            close = pd.Series(self.close[:, column]).dropna()
+            line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+            signal = line.ewm(span=9, adjust=False).mean()
+            np.testing.assert_allclose(line.to_numpy(), result.macd[close.index, column])
+            np.testing.assert_allclose(signal.to_numpy(), result.signal[close.index, column])
+
+    def test_incremental_updates_match_full_recompute(self):
+        high, low = self.close + 1, self.close - 1
+        full_macd = indicators.macd(self.close)
+        full_rsi, _ = indicators.rsi(self.close)
+        full_atr, _ = indicators.atr(high, low, self.close)
+
+        partial = indicators.macd(self.close[:-1])
+        _, rsi_state = indicators.rsi(self.close[:-1])
+        _, atr_state = indicators.atr(high[:-1], low[:-1], self.close[:-1])
+        step = indicators.macd(self.close[-1:], state=partial.state)
+        rsi, _ = indicators.rsi(self.close[-1:], state=rsi_state)
+        atr, _ = indicators.atr(high[-1:], low[-1:], self.close[-1:], state=atr_state)
+
+        np.testing.assert_allclose(full_macd.macd[-1], step.macd[0])
+        np.testing.assert_allclose(full_macd.signal[-1], step.signal[0])
+        np.testing.assert_allclose(full_rsi[-1], rsi[0])
+        np.testing.assert_allclose(full_atr[-1], atr[0])
+
+    def test_rsi_and_zscore_match_pandas(self):
+        close = pd.Series(self.close[:, 0])
+        change = close.diff()
+        gain = change.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+        loss = (-change).clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+        expected_rsi = 100 - 100 / (1 + gain / loss)
+        rsi, _ = indicators.rsi(self.close)
+        np.testing.assert_allclose(expected_rsi[1:].to_numpy(), rsi[1:, 0])
+
+        expected_z = (close - close.rolling(20).mean()) / close.rolling(20).std()
+        np.testing.assert_allclose(expected_z.to_numpy(), indicators.zscore(self.close, 20)[:, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
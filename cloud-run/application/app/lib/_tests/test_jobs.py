@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+import unittest
+
+from intents.intent import Intent
+from lib.dispatcher import IntentDispatcher
+from lib.gcp import FirestoreStore
+from lib.jobs import JobRegistry
+from test_support import FakeAsyncFirestore
+
+
+class CountingIntent(Intent):
+    runs = 0
+
+    async def run(self):
+        CountingIntent.runs += 1
+        await asyncio.sleep(0.01)
+        return {'runs': CountingIntent.runs}
+
+
+class FailingIntent(Intent):
+    runs = 0
+
+    async def run(self):
+        FailingIntent.runs += 1
+        raise RuntimeError("gateway unavailable")
+
+
+class HangingIntent(Intent):
+    async def run(self):
+        await asyncio.sleep(10)
+
+
+class JobRegistryTests(unittest.TestCase):
+    def setUp(self):
+        CountingIntent.runs = 0
+        FailingIntent.runs = 0
+        self.firestore = FakeAsyncFirestore()
+        logging = SimpleNamespace(warning=lambda *a, **k: None, error=lambda *a, **k: None)
+        self.env = SimpleNamespace(store=FirestoreStore(SimpleNamespace(adb=self.firestore, logging=logging), linger=0),
+                                   env={'K_REVISION': 'rev-1'}, config={'account': 'DU123'}, config_hash='cfg',
+                                   config_version=None, trading_mode='paper')
+
+    def test_retries_with_same_slot_execute_once(self):
+        async def scenario():
+            registry = JobRegistry(self.env, IntentDispatcher(self.env))
+            first = await registry.start('allocation', CountingIntent, {'dryRun': True}, slot='2026-10-18T14:00:00Z')
+            retry = await registry.start('allocation', CountingIntent, {'dryRun': True}, slot='2026-10-18T14:00:00Z')
+            updates = []
+            done = asyncio.Event()
+
+            def on_update(record):
+                updates.append(record)
+                if record is None:
+                    done.set()
+
+            await registry.subscribe(first['jobId'], on_update)
+            await done.wait()
+            await self.env.store.flush()
+            return first, retry, updates
+
+        first, retry, updates = asyncio.run(scenario())
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(retry['deduplicated'])
+        self.assertEqual(first['jobId'], retry['jobId'])
+        self.assertEqual(1, CountingIntent.runs)
+        self.assertEqual(['queued', 'running', 'succeeded'], [u['status'] for u in updates[:-1]])
+        self.assertEqual({'runs': 1}, self.firestore.docs[f"jobs/{first['jobId']}"]['result'])
+
+    def test_new_slot_runs_again_and_persisted_jobs_survive_restart(self):
+        async def scenario():
+            registry = JobRegistry(self.env, IntentDispatcher(self.env))
+            first = await registry.start('allocation', CountingIntent, {}, slot='slot-1')
+            second = await registry.start('allocation', CountingIntent, {}, slot='slot-2')
+            await asyncio.sleep(0.05)
+            await self.env.store.flush()
+            restarted = JobRegistry(self.env, IntentDispatcher(self.env))
+            return first, second, await restarted.get(first['jobId']), await restarted.start('allocation', CountingIntent, {}, slot='slot-1')
+
+        first, second, reloaded, retried = asyncio.run(scenario())
+        self.assertNotEqual(first['jobId'], second['jobId'])
+        self.assertEqual(2, CountingIntent.runs)
+        self.assertEqual('succeeded', reloaded['status'])
+        self.assertTrue(retried['deduplicated'])
+
+    def _finished(self, registry, job_id):
+        done = asyncio.Event()
+        return registry.subscribe(job_id, lambda record: record is None and done.set()), done
+
+    def test_failed_jobs_can_be_retried_and_hung_jobs_time_out(self):
+        async def scenario():
+            registry = JobRegistry(self.env, IntentDispatcher(self.env))
+            records = []
+            for intent_class, timeout in ((FailingIntent, None), (FailingIntent, None), (HangingIntent, 0.05)):
+                record = await registry.start('close-all', intent_class, {}, slot='slot-1', timeout=timeout)
+                subscribed, done = self._finished(registry, record['jobId'])
+                await subscribed
+                await done.wait()
+                records.append(await registry.get(record['jobId']))
+            # Finished jobs are forgotten once the dedup window has passed.
+            registry.dedup_window = 0
+            record = await registry.start('allocation', CountingIntent, {}, slot='slot-2')
+            subscribed, done = self._finished(registry, record['jobId'])
+            await subscribed
+            await done.wait()
+            await self.env.store.flush()
+            return records, registry
+
+        records, registry = asyncio.run(scenario())
+        self.assertEqual(2, FailingIntent.runs)
+        self.assertEqual(['failed', 'failed', 'failed'], [r['status'] for r in records])
+        self.assertIn('TimeoutError', records[2]['error'])
+        self.assertEqual(1, len(registry._jobs))
+
+    def test_concurrent_identical_requests_share_one_job(self):
+        get = self.env.store.get
+
+        async def slow_get(path):
+            # Firestore reads yield to the loop, which lets the other requests in.
+            await asyncio.sleep(0.01)
+            return await get(path)
+        self.env.store.get = slow_get
+
+        async def scenario():
+            registry = JobRegistry(self.env, IntentDispatcher(self.env))
+            started = await asyncio.gather(*[registry.start('allocation', CountingIntent, {}) for _ in range(3)])
+            subscribed, done = self._finished(registry, started[0]['jobId'])
+            await subscribed
+            await done.wait()
+            await self.env.store.flush()
+            return started
+
+        started = asyncio.run(scenario())
+        self.assertEqual(1, CountingIntent.runs)
+        self.assertEqual({started[0]['jobId']}, {record['jobId'] for record in started})
+        self.assertEqual([False, True, True], [record['deduplicated'] for record in started])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
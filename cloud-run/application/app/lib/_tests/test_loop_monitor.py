@@ -0,0 +1,61 @@
+import asyncio
+import time
+import unittest
+
+from lib.loop_monitor import LoopMonitor, MonitoredEventLoop, current_intent
+
+
+def _blocking_query():
+    time.sleep(0.08)
+
+
+class LoopMonitorTests(unittest.TestCase):
+
+    def _monitor(self, scenario):
+        loop = MonitoredEventLoop()
+        monitor = LoopMonitor(loop, interval=0.005, slow_callback=0.02)
+        try:
+            monitor.start()
+            loop.run_until_complete(scenario())
+        finally:
+            monitor.stop()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+        return monitor.stats()
+
+    def test_slow_callback_is_attributed_to_its_intent_with_a_stack(self):
+        async def intent():
+            current_intent.set('Reconcile')
+            await asyncio.sleep(0.01)
+            _blocking_query()
+            await asyncio.sleep(0.01)
+
+        async def scenario():
+            await asyncio.create_task(intent())
+            await asyncio.sleep(0.02)
+
+        stats = self._monitor(scenario)
+
+        self.assertEqual(1, stats['slowCallbacks'])
+        slow, = stats['recentSlowCallbacks']
+        self.assertEqual('Reconcile', slow['intent'])
+        self.assertGreaterEqual(slow['durationMs'], 80)
+        self.assertIn('_blocking_query', ''.join(slow['stack']))
+        self.assertGreaterEqual(stats['blockedByIntent']['Reconcile']['maxMs'], 80)
+        self.assertGreaterEqual(stats['lag']['maxMs'], 50)
+
+    def test_fast_callbacks_only_count_towards_the_histograms(self):
+        async def scenario():
+            for _ in range(10):
+                await asyncio.sleep(0.001)
+
+        stats = self._monitor(scenario)
+
+        self.assertEqual(0, stats['slowCallbacks'])
+        self.assertEqual([], stats['recentSlowCallbacks'])
+        self.assertGreater(stats['blockedByIntent']['other']['count'], 10)
+        self.assertIsNone(stats['blocking'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import unittest
+
+from lib.market_data import BarCache, TickerSubscriptions
+
+
+class FakeIBGW:
+    def __init__(self, days):
+        self.days = days
+        self.requests = []
+        self.adjustment = 1.0
+        # Simulates a timed-out request, for which ib_insync returns no bars.
+        self.timed_out = False
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                                     timeout):
+        self.requests.append(durationStr)
+        await asyncio.sleep(0)
+        if self.timed_out:
+            return []
+        count = int(durationStr.split()[0])
+        return [SimpleNamespace(date=day, close=float(day.toordinal()) * self.adjustment) for day in self.days[-count:]]
+
+
+class BarCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        today = datetime.now(timezone.utc).date()
+        self.ibgw = FakeIBGW([today - timedelta(days=n) for n in range(30, 0, -1)])
+        self.spy = SimpleNamespace(conId=756733)
+
+    def test_repeat_requests_are_served_from_cache_then_extended_incrementally(self):
+        cache = BarCache(self.ibgw, ttl=60)
+
+        async def scenario():
+            first = await cache.get_bars(self.spy, '20 D', '1 day')
+            cached = await cache.get_bars(self.spy, '20 D', '1 day')
+            cache.ttl = 0
+            self.ibgw.days.append(datetime.now(timezone.utc).date())
+            extended = await cache.get_bars(self.spy, '20 D', '1 day')
+            return first, cached, extended
+
+        first, cached, extended = asyncio.run(scenario())
+        # The incremental request overlaps the last complete bar.
+        self.assertEqual(['20 D', '3 D'], self.ibgw.requests)
+        self.assertTrue(first.equals(cached))
+        self.assertEqual(20, len(extended))
+        self.assertEqual(self.ibgw.days[-1], extended['date'].iloc[-1])
+        self.assertEqual(first['date'].iloc[1], extended['date'].iloc[0])
+        self.assertEqual({'hits': 1, 'incremental': 1, 'full': 1}, {k: cache.stats()[k] for k in ('hits', 'incremental', 'full')})
+
+    def test_concurrent_callers_share_one_request(self):
+        cache = BarCache(self.ibgw)
+
+        async def scenario():
+            return await asyncio.gather(*[cache.get_bars(self.spy, '10 D', '1 day') for _ in range(3)])
+
+        results = asyncio.run(scenario())
+        self.assertEqual(['10 D'], self.ibgw.requests)
+        self.assertTrue(all(len(bars) == 10 for bars in results))
+
+    def test_least_recently_used_series_is_evicted_over_memory_cap(self):
+        cache = BarCache(self.ibgw, max_bytes=1)
+
+        async def scenario():
+            await cache.get_bars(self.spy, '10 D', '1 day')
+            await cache.get_bars(SimpleNamespace(conId=1), '10 D', '1 day')
+            await cache.get_bars(self.spy, '10 D', '1 day')
+
+        asyncio.run(scenario())
+        self.assertEqual(['10 D'] * 3, self.ibgw.requests)
+        self.assertEqual(2, cache.stats()['evicted'])
+
+    def test_adjusted_history_is_pulled_again(self):
+        cache = BarCache(self.ibgw, ttl=0)
+
+        async def scenario():
+            await cache.get_bars(self.spy, '20 D', '1 day')
+            await cache.get_bars(self.spy, '10 D', '1 day')
+            # A 2:1 split halves every historical close.
+            self.ibgw.adjustment = 0.5
+            return await cache.get_bars(self.spy, '10 D', '1 day')
+
+        bars = asyncio.run(scenario())
+        self.assertEqual(['20 D', '10 D', '3 D', '20 D'], self.ibgw.requests)
+        self.assertEqual(self.ibgw.days[-1].toordinal() * 0.5, bars['close'].iloc[-1])
+        self.assertEqual(self.ibgw.days[-10].toordinal() * 0.5, bars['close'].iloc[0])
+        self.assertEqual(1, cache.stats()['refreshed'])
+
+    def test_timed_out_requests_return_no_bars_and_are_retried(self):
+        cache = BarCache(self.ibgw, ttl=0)
+
+        async def scenario():
+            first = await cache.get_bars(self.spy, '20 D', '1 day')
+            self.ibgw.timed_out = True
+            stale = await cache.get_bars(self.spy, '20 D', '1 day')
+            missing = await cache.get_bars(self.spy, '10 D', '1 day')
+            self.ibgw.timed_out = False
+            return first, stale, missing, await cache.get_bars(self.spy, '10 D', '1 day')
+
+        first, stale, missing, retried = asyncio.run(scenario())
+        # A failed incremental request serves the cached bars; a failed new window serves none.
+        self.assertTrue(first.equals(stale))
+        self.assertTrue(missing.empty)
+        self.assertEqual(10, len(retried))
+        self.assertEqual(['20 D', '3 D', '10 D', '10 D'], self.ibgw.requests)
+
+    def test_bars_since_are_served_from_the_series_without_adding_windows(self):
+        cache = BarCache(self.ibgw, ttl=0)
+
+        async def scenario():
+            uncached = await cache.get_bars_since(self.spy, self.ibgw.days[-3], '1 day')
+            await cache.get_bars(self.spy, '20 D', '1 day')
+            since = await cache.get_bars_since(self.spy, self.ibgw.days[-3], '1 day')
+            return uncached, since
+
+        uncached, since = asyncio.run(scenario())
+        self.assertEqual(self.ibgw.days[-3:], list(since['date']))
+        self.assertEqual(self.ibgw.days[-3:], list(uncached['date'][-3:]))
+        self.assertEqual({'20 D': 20}, cache._series[(756733, '1 day', 'TRADES', True)].windows)
+
+    def test_gap_duration(self):
+        self.assertEqual('1 D', BarCache._gap_duration(datetime.now(timezone.utc).date(), '1 day'))
+        self.assertEqual('4 D', BarCache._gap_duration(datetime.now(timezone.utc).date() - timedelta(days=3), '1 day'))
+        last = datetime.now(timezone.utc) - timedelta(hours=1)
+        self.assertEqual('5400 S', BarCache._gap_duration(last, '30 mins'))
+
+
+class FakeStreamingIBGW:
+    def __init__(self):
+        self.requested = []
+        self.cancelled = []
+
+    def reqMktData(self, contract, genericTickList, snapshot, regulatorySnapshot):
+        self.requested.append(contract.conId)
+        return SimpleNamespace(time=None, marketPrice=lambda: float('nan'))
+
+    def cancelMktData(self, contract):
+        self.cancelled.append(contract.conId)
+
+
+class TickerSubscriptionsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ibgw = FakeStreamingIBGW()
+        self.tickers = TickerSubscriptions(self.ibgw, stale_after=10)
+        self.spy = SimpleNamespace(conId=756733, symbol='SPY')
+
+    def test_stream_is_shared_and_cancelled_with_the_last_owner(self):
+        self.tickers.subscribe('a', self.spy)
+        self.tickers.subscribe('a', self.spy)
+        self.tickers.subscribe('b', self.spy)
+        self.tickers.release('a')
+        self.assertEqual([756733], self.ibgw.requested)
+        self.assertEqual([], self.ibgw.cancelled)
+        self.tickers.release('b', self.spy)
+        self.assertEqual([756733], self.ibgw.cancelled)
+        self.assertIsNone(self.tickers.quote(756733))
+
+    def test_price_is_only_served_while_fresh(self):
+        self.tickers.subscribe('a', self.spy)
+        self.assertTrue(self.tickers.quote(756733).stale)
+        ticker = self.tickers.quote(756733).ticker
+        ticker.marketPrice = lambda: 500.0
+        ticker.time = datetime.now(timezone.utc)
+        self.assertEqual(500.0, self.tickers.price(756733))
+        ticker.time -= timedelta(seconds=11)
+        self.assertIsNone(self.tickers.price(756733))
+        self.assertEqual({'streams': 1, 'stale': 1}, self.tickers.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
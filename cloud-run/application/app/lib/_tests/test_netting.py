@@ -0,0 +1,81 @@
+import unittest
+
+from lib.netting import NettingEngine, VirtualFill
+
+
+class NettingEngineTests(unittest.TestCase):
+
+    def test_opposing_strategy_deltas_are_crossed_pro_rata(self):
+        engine = NettingEngine(min_notional=0)
+        result = engine.net(
+            ['1', '2'],
+            targets={'a': {'1': 100}, 'b': {'1': -30}, 'c': {'1': -20, '2': 10}},
+            strategy_holdings={'a': {'1': 0}, 'b': {'1': 10}, 'c': {'1': 0}},
+            holdings={'1': 10},
+            inflight={},
+            prices={'1': 50.0},
+        )
+
+        # Strategies buy 100 and sell 40 + 20; only the account-level residual reaches the market.
+        order, other = result.orders
+        self.assertEqual(('1', 50, 40), (order.key, order.desired, order.delta))
+        self.assertEqual(60, order.crossed)
+        self.assertEqual(10, other.delta)
+        self.assertEqual(170, result.gross_quantity)
+        self.assertEqual(60, result.crossed_quantity)
+        self.assertCountEqual([
+            VirtualFill('a', '1', 60, 50.0),
+            VirtualFill('b', '1', -40, 50.0),
+            VirtualFill('c', '1', -20, 50.0),
+        ], result.virtual_fills)
+
+    def test_crossed_quantities_split_by_largest_remainder(self):
+        result = NettingEngine(min_notional=0).net(
+            ['1'],
+            targets={'a': {'1': 1}, 'b': {'1': 1}, 'c': {'1': 1}, 'd': {'1': -2}},
+            strategy_holdings={},
+            holdings={},
+            inflight={},
+        )
+
+        fills = {fill.strategy_id: fill.quantity for fill in result.virtual_fills}
+        self.assertEqual(-2, fills.pop('d'))
+        self.assertEqual(2, sum(fills.values()))
+        self.assertTrue(all(quantity in (0, 1) for quantity in fills.values()))
+        self.assertEqual(1, result.orders[0].delta)
+
+    def test_lot_size_and_minimum_notional_rounding(self):
+        engine = NettingEngine(lot_sizes={'1': 100, 'XYZ': 10}, min_notional=1000)
+        result = engine.net(
+            ['1', '2', '3', '4'],
+            targets={'a': {'1': 250, '2': 15, '3': 5, '4': 0}},
+            strategy_holdings={},
+            holdings={'4': 7},
+            inflight={},
+            prices={'1': 20.0, '2': 200.0, '3': 100.0, '4': 1.0},
+            symbols={'2': 'XYZ'},
+        )
+
+        orders = {order.key: order for order in result.orders}
+        suppressed = {order.key: order for order in result.suppressed}
+        self.assertEqual((200, 'lot'), (orders['1'].delta, orders['1'].adjustment))
+        self.assertEqual((10, 'lot'), (orders['2'].delta, orders['2'].adjustment))
+        self.assertEqual((0, 'notional'), (suppressed['3'].delta, suppressed['3'].adjustment))
+        # Flattening is exempt from rounding.
+        self.assertEqual((-7, None), (orders['4'].delta, orders['4'].adjustment))
+
+    def test_contracts_without_con_id_are_not_crossed(self):
+        result = NettingEngine(min_notional=0).net(
+            ['SPY:STK:SMART:USD'],
+            targets={'a': {'SPY:STK:SMART:USD': 10}, 'b': {'SPY:STK:SMART:USD': -10}},
+            strategy_holdings={},
+            holdings={},
+            inflight={},
+        )
+
+        self.assertEqual([], result.orders)
+        self.assertEqual([], result.virtual_fills)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import unittest
+
+from lib.ib_simulator import IBSimulator
+from lib.orders import OrderSubmitter, OrderTracker
+from lib.pacing import ORDER_LANE, TokenBucket
+
+
+def _stock(symbol):
+    return SimpleNamespace(symbol=symbol, secType='STK', exchange='SMART', currency='USD', conId=0)
+
+
+def _order(action, quantity):
+    return SimpleNamespace(action=action, totalQuantity=quantity, orderType='MKT', orderId=0)
+
+
+class OrderSubmitterTests(unittest.TestCase):
+
+    def test_large_batch_is_acknowledged_without_fixed_sleeps(self):
+        sim = IBSimulator(latency=0.01, jitter=0.005, fill_latency=3600)
+        submitter = OrderSubmitter(sim, rate=200, ack_timeout=1)
+        acked = []
+
+        async def scenario():
+            await sim.connectAsync()
+            started = time.monotonic()
+            acks = await submitter.submit([(_stock(f'S{i}'), _order('BUY', 10)) for i in range(50)],
+                                          on_ack=acked.append)
+            return acks, time.monotonic() - started
+
+        acks, elapsed = asyncio.run(scenario())
+
+        self.assertEqual(50, len(acks))
+        self.assertTrue(all(ack.acknowledged for ack in acks))
+        self.assertEqual('S7', acks[7].to_dict()['symbol'])
+        self.assertEqual('Submitted', acks[0].to_dict()['status'])
+        self.assertEqual(50, len(acked))
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(50, submitter.stats()['acknowledged'])
+
+    def test_rejects_carry_the_gateway_error(self):
+        sim = IBSimulator(latency=0, jitter=0, reject_rate=1.0)
+        submitter = OrderSubmitter(sim, ack_timeout=1)
+
+        async def scenario():
+            await sim.connectAsync()
+            return await submitter.submit([(_stock('SPY'), _order('SELL', 5))])
+
+        ack, = asyncio.run(scenario())
+
+        self.assertEqual('rejected', ack.result)
+        self.assertIn('201', ack.error)
+        self.assertEqual('Inactive', ack.to_dict()['status'])
+
+    def test_unanswered_order_times_out(self):
+        sim = IBSimulator(latency=0, jitter=0)
+
+        async def scenario():
+            await sim.connectAsync()
+            sim.latency = 1
+            return await OrderSubmitter(sim).submit([(_stock('SPY'), _order('BUY', 1))], ack_timeout=0.05)
+
+        ack, = asyncio.run(scenario())
+
+        self.assertEqual('timeout', ack.result)
+        self.assertEqual('PendingSubmit', ack.to_dict()['status'])
+
+    def test_cancels_take_order_lane_slots(self):
+        sim = IBSimulator(latency=0, jitter=0, fill_latency=3600)
+        lanes = []
+
+        async def acquire(lane):
+            lanes.append(lane)
+            return 0.0
+        sim.governor = SimpleNamespace(acquire=acquire)
+        submitter = OrderSubmitter(sim, ack_timeout=1)
+
+        async def scenario():
+            await sim.connectAsync()
+            acks = await submitter.submit([(_stock(f'S{i}'), _order('BUY', 1)) for i in range(3)])
+            trades = [ack.trade for ack in acks]
+            await submitter.cancel(trades)
+            return await submitter.tracker.all('cancelled', trades, timeout=1)
+
+        statuses = asyncio.run(scenario())
+
+        self.assertEqual(['Cancelled'] * 3, statuses)
+        self.assertEqual([ORDER_LANE] * 6, lanes)
+        self.assertEqual(3, submitter.stats()['cancelled'])
+
+    def test_tracker_resolves_on_fill_and_cancel_as_events_arrive(self):
+        sim = IBSimulator(latency=0.01, jitter=0, fill_latency=0.02)
+        tracker = OrderTracker(sim)
+
+        async def scenario():
+            await sim.connectAsync()
+            spy, qqq = await sim.qualifyContractsAsync(_stock('SPY'), _stock('QQQ'))
+            filling = sim.placeOrder(spy, _order('BUY', 10))
+            resting = sim.placeOrder(qqq, _order('SELL', 5))
+            self.assertEqual('Submitted', await tracker.submitted(resting, timeout=1))
+            sim.cancelOrder(resting.order)
+            started = asyncio.get_running_loop().time()
+            statuses = await asyncio.gather(tracker.filled(filling, timeout=1), tracker.cancelled(resting, timeout=1))
+            return statuses, asyncio.get_running_loop().time() - started
+
+        statuses, elapsed = asyncio.run(scenario())
+
+        self.assertEqual(['Filled', 'Cancelled'], statuses)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(0, tracker.stats()['waiting'])
+
+    def test_tracker_ends_wait_on_order_error(self):
+        sim = IBSimulator(latency=0, jitter=0)
+        tracker = OrderTracker(sim)
+        tracker.subscribe()
+
+        async def scenario():
+            await sim.connectAsync()
+            spy, = await sim.qualifyContractsAsync(_stock('SPY'))
+            sim.latency = 5
+            trade = sim.placeOrder(spy, _order('BUY', 1))
+            sim.errorEvent.emit(trade.order.orderId, 201, 'Order rejected - reason:margin', spy)
+            return trade, await tracker.submitted(trade, timeout=1)
+
+        trade, status = asyncio.run(scenario())
+
+        self.assertEqual('PendingSubmit', status)
+        self.assertTrue(tracker.ended(trade))
+        self.assertEqual('201: Order rejected - reason:margin', tracker.error_message(trade))
+        self.assertEqual(0, tracker.stats()['timeouts'])
+
+    def test_token_bucket_paces_beyond_the_burst(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+
+        async def scenario():
+            started = time.monotonic()
+            for _ in range(15):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+import unittest
+
+from lib.pacing import DATA_LANE, ORDER_LANE, RequestGovernor
+
+
+class RequestGovernorTests(unittest.TestCase):
+
+    def test_order_lane_preempts_queued_data_requests(self):
+        governor = RequestGovernor(rate=50)
+        served = []
+
+        async def request(lane, name):
+            await governor.acquire(lane)
+            served.append(name)
+
+        async def scenario():
+            governor.take(50)
+            data = [asyncio.create_task(request(DATA_LANE, f'data{i}')) for i in range(3)]
+            await asyncio.sleep(0)
+            order = asyncio.create_task(request(ORDER_LANE, 'order'))
+            await asyncio.gather(order, *data)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(['order', 'data0', 'data1', 'data2'], served)
+
+    def test_identical_historical_requests_are_deduplicated(self):
+        governor = RequestGovernor()
+        calls = []
+
+        async def fetch(duration):
+            calls.append(duration)
+            await asyncio.sleep(0.01)
+            return [duration]
+
+        async def scenario():
+            first = await asyncio.gather(*[
+                governor.historical(('SPY', '5 D'), 'SPY', lambda: fetch('5 D')) for _ in range(3)])
+            again = await governor.historical(('SPY', '5 D'), 'SPY', lambda: fetch('5 D'))
+            other = await governor.historical(('SPY', '1 M'), 'SPY', lambda: fetch('1 M'))
+            return first, again, other
+
+        first, again, other = asyncio.run(scenario())
+
+        self.assertEqual(['5 D', '1 M'], calls)
+        self.assertEqual([['5 D']] * 3, first)
+        self.assertEqual(['5 D'], again)
+        self.assertEqual(['1 M'], other)
+        self.assertEqual(3, governor.stats()['historicalDeduplicated'])
+
+    def test_historical_requests_wait_for_the_pacing_window(self):
+        governor = RequestGovernor(historical_limit=2, historical_period=0.2)
+
+        async def fetch():
+            return [time.monotonic()]
+
+        async def scenario():
+            return [(await governor.historical(i, i, fetch))[0] for i in range(3)]
+
+        started, _, third = asyncio.run(scenario())
+
+        self.assertGreaterEqual(third - started, 0.19)
+
+
+if __name__ == '__main__':
+    unittest.main()
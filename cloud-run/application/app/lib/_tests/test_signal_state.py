@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lib import indicators
+from lib.gcp import FirestoreStore
+from lib.signal_state import IncrementalMACD
+from test_support import FakeAsyncFirestore
+
+
+class IncrementalMACDTests(unittest.TestCase):
+
+    def setUp(self):
+        self.today = datetime.now(timezone.utc).date()
+        self.days = [self.today - timedelta(days=n) for n in range(62, 1, -1)]
+        self.closes = list(100 + np.cumsum(np.random.default_rng(3).normal(size=len(self.days))))
+        self.requests = []
+        logging = SimpleNamespace(info=lambda *args, **kwargs: None,
+                                  warning=lambda *args, **kwargs: None,
+                                  error=lambda *args, **kwargs: None)
+        self.firestore = FakeAsyncFirestore()
+        self.env = SimpleNamespace(store=FirestoreStore(SimpleNamespace(adb=self.firestore, logging=logging), linger=0),
+                                   get_bars=self._get_bars, get_bars_since=self._get_bars_since,
+                                   invalidate_bars=self._invalidate_bars)
+        self.spy = SimpleNamespace(conId=756733, symbol='SPY')
+
+    def _bars(self):
+        return pd.DataFrame({'date': self.days, 'close': self.closes})
+
+    async def _get_bars(self, contract, duration, bar_size):
+        self.requests.append(duration)
+        return self._bars().iloc[-int(duration.split()[0]):].reset_index(drop=True)
+
+    async def _get_bars_since(self, contract, since, bar_size):
+        self.requests.append(f'since {since.isoformat()}')
+        bars = self._bars()
+        return bars[bars['date'] >= since].reset_index(drop=True)
+
+    async def _invalidate_bars(self, contract, bar_size):
+        self.requests.append('invalidate')
+
+    def _run(self):
+        async def scenario():
+            reading = await IncrementalMACD(self.env, 'spy_macd_vixy').update(self.spy, full_duration='61 D')
+            await self.env.store.flush()
+            return reading
+        return asyncio.run(scenario())
+
+    def _expected(self):
+        return indicators.macd(self.closes)
+
+    def test_state_is_advanced_by_new_bars_only(self):
+        first = self._run()
+        self.assertFalse(first.incremental)
+        # The last bar was still forming; it gets revised and two more bars arrive.
+        self.closes[-1] += 1.5
+        self.days += [self.today - timedelta(days=1), self.today]
+        self.closes += [self.closes[-1] + 1, self.closes[-1] - 2]
+
+        second = self._run()
+        self.assertTrue(second.incremental)
+        self.assertEqual(['61 D', f'since {(self.today - timedelta(days=3)).isoformat()}'], self.requests)
+        expected = self._expected()
+        np.testing.assert_allclose(expected.macd[-4:, 0], second.macd.to_numpy()[-4:])
+        np.testing.assert_allclose(expected.signal[-4:, 0], second.signal.to_numpy()[-4:])
+        self.assertEqual(self.closes[-1], second.last_close)
+
+    def test_adjusted_history_triggers_full_recompute(self):
+        self._run()
+        # A 2:1 split rewrites every historical close.
+        self.closes = [close / 2 for close in self.closes]
+
+        reading = self._run()
+        self.assertFalse(reading.incremental)
+        self.assertEqual(['61 D', f'since {(self.today - timedelta(days=3)).isoformat()}', 'invalidate', '61 D'],
+                         self.requests)
+        np.testing.assert_allclose(self._expected().macd[-2:, 0], reading.macd.to_numpy()[-2:])
+
+
+if __name__ == '__main__':
+    unittest.main()
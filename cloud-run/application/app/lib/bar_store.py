@@ -0,0 +1,65 @@
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class BarStore:
+    """
+    Local Parquet files of historical bars that survive container restarts.
+
+    Files are partitioned by symbol and bar size:
+        {root}/symbol=SPY/bar_size=1 day/{conId}-{whatToShow}-{rth|all}.parquet
+    and read through a memory map, so `read_table` hands out Arrow tables
+    backed by the page cache without copying. The file's schema metadata
+    carries the bar-count windows the BarCache serves from the series.
+    Writes go to a temporary file that is renamed into place.
+    """
+
+    DEFAULT_ROOT = '/tmp/bars'
+
+    def __init__(self, root: str = None):
+        self.root = Path(root or os.environ.get('BAR_STORE_PATH', self.DEFAULT_ROOT))
+
+    def path(self, symbol: str, key) -> Path:
+        session = 'rth' if key.use_rth else 'all'
+        return self.root / f'symbol={symbol}' / f'bar_size={key.bar_size}' / f'{key.con_id}-{key.what_to_show}-{session}.parquet'
+
+    def read_table(self, symbol: str, key) -> Optional[pa.Table]:
+        path = self.path(symbol, key)
+        if not path.exists():
+            return None
+        return pq.read_table(path, memory_map=True)
+
+    def read(self, symbol: str, key) -> Optional[Tuple[pd.DataFrame, Dict[str, int], float]]:
+        """Returns (bars, windows, age in seconds) or None if nothing is stored."""
+        table = self.read_table(symbol, key)
+        if table is None:
+            return None
+        metadata = table.schema.metadata or {}
+        windows = json.loads(metadata.get(b'windows', b'{}'))
+        age = time.time() - self.path(symbol, key).stat().st_mtime
+        return table.to_pandas(), windows, age
+
+    def delete(self, symbol: str, key):
+        self.path(symbol, key).unlink(missing_ok=True)
+
+    def write(self, symbol: str, key, bars: pd.DataFrame, windows: Dict[str, int]):
+        path = self.path(symbol, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(bars, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'windows': json.dumps(windows).encode()})
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,106 @@
+from datetime import datetime
+from hashlib import md5
+import json
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+def config_hash(config: dict) -> str:
+    return md5(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ConfigSnapshot(NamedTuple):
+    config: Dict[str, Any]
+    hash: str
+    # Latest Firestore update time of the source documents (ISO format).
+    version: Optional[str]
+
+
+class ConfigCache:
+    """
+    In-memory copy of `config/common` overlaid with `config/{trading_mode}`.
+
+    After the initial synchronous load, Firestore snapshot listeners keep the
+    copy current. Every change builds a new ConfigSnapshot and swaps it in with
+    a single assignment, so readers see either the old or the new config, never
+    a mix, and reading it is free of I/O. Treat `config` as read-only.
+
+    Listeners are called with (old, new) snapshots on the Firestore watch
+    thread; anything touching an event loop must hop over with
+    call_soon_threadsafe.
+    """
+
+    def __init__(self, db, trading_mode: str, logging):
+        self._db = db
+        self._logging = logging
+        self._paths = ['config/common', f'config/{trading_mode}']
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._update_times: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[ConfigSnapshot, ConfigSnapshot], None]] = []
+        self._watches = []
+        self.snapshot = ConfigSnapshot({}, config_hash({}), None)
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.snapshot.config
+
+    def add_listener(self, listener: Callable[[ConfigSnapshot, ConfigSnapshot], None]):
+        self._listeners.append(listener)
+
+    def load(self) -> ConfigSnapshot:
+        """Reads the config documents synchronously; used at startup."""
+        for path in self._paths:
+            self._apply(path, self._db.document(path).get())
+        return self._publish()
+
+    def watch(self):
+        """Starts the snapshot listeners. Falls back to the loaded config if they cannot be started."""
+        try:
+            for path in self._paths:
+                self._watches.append(self._db.document(path).on_snapshot(self._on_snapshot(path)))
+        except Exception as e:
+            self._logging.warning(f"ConfigCache: Could not watch config documents ({e}); config will not hot-reload.")
+
+    def stop(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+
+    def _on_snapshot(self, path: str):
+        def callback(doc_snapshots, changes, read_time):
+            try:
+                for doc in doc_snapshots:
+                    self._apply(path, doc)
+                if not doc_snapshots:
+                    self._apply(path, None)
+                self._publish()
+            except Exception as e:
+                self._logging.error(f"ConfigCache: Failed to apply update to {path}: {e}", exc_info=True)
+        return callback
+
+    def _apply(self, path: str, doc):
+        with self._lock:
+            if doc is not None and doc.exists:
+                self._docs[path] = doc.to_dict() or {}
+                update_time = getattr(doc, 'update_time', None)
+                if isinstance(update_time, datetime):
+                    self._update_times[path] = update_time.isoformat()
+            else:
+                self._docs.pop(path, None)
+                self._update_times.pop(path, None)
+
+    def _publish(self) -> ConfigSnapshot:
+        with self._lock:
+            config = {}
+            for path in self._paths:
+                config.update(self._docs.get(path, {}))
+            new = ConfigSnapshot(config, config_hash(config), max(self._update_times.values(), default=None))
+            old, self.snapshot = self.snapshot, new
+        if new.hash != old.hash:
+            for listener in self._listeners:
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    self._logging.error(f"ConfigCache: Listener failed: {e}", exc_info=True)
+        return new
@@ -0,0 +1,139 @@
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ib_insync import Contract, util
+
+from lib.gcp import logger as logging
+
+
+def contract_key(contract: Contract) -> Tuple:
+    """(symbol, secType, exchange, currency) for contracts without a conId."""
+    return (contract.symbol, contract.secType, contract.exchange, contract.currency)
+
+
+class ContractRegistry:
+    """
+    Process-wide cache of qualified contracts, indexed by conId and by
+    (symbol, secType, exchange, currency).
+
+    `qualify` resolves any number of contracts with a single concurrent
+    `qualifyContractsAsync` call for the ones not cached yet; concurrent
+    requests for the same contract share that call. Contracts the gateway
+    cannot qualify are remembered for `negative_ttl` seconds so a bad symbol
+    is not retried on every run. Qualified contracts are persisted to a local
+    JSON file and reloaded on startup.
+
+    Callers receive copies, so mutating a returned contract never alters the cache.
+    """
+
+    DEFAULT_PATH = '/tmp/contracts.json'
+    DEFAULT_NEGATIVE_TTL = 300
+
+    def __init__(self, ibgw, path: str = None, negative_ttl: float = None):
+        self._ibgw = ibgw
+        self.path = path or os.environ.get('CONTRACT_REGISTRY_PATH', self.DEFAULT_PATH)
+        self.negative_ttl = float(os.environ.get('CONTRACT_NEGATIVE_TTL', self.DEFAULT_NEGATIVE_TTL)) \
+            if negative_ttl is None else negative_ttl
+        self._by_con_id: Dict[int, Contract] = {}
+        self._by_key: Dict[Tuple, Contract] = {}
+        self._failed: Dict[object, float] = {}
+        self._pending: Dict[object, asyncio.Future] = {}
+        self._metrics = {'hits': 0, 'misses': 0, 'negativeHits': 0, 'requests': 0}
+        self._load()
+
+    def lookup(self, contract: Contract) -> Optional[Contract]:
+        cached = self._by_con_id.get(contract.conId) if contract.conId else self._by_key.get(contract_key(contract))
+        return copy.copy(cached) if cached is not None else None
+
+    async def qualify_one(self, contract: Contract) -> Optional[Contract]:
+        return (await self.qualify(contract))[0]
+
+    async def qualify(self, *contracts: Contract) -> List[Optional[Contract]]:
+        """Returns a qualified copy of each contract, or None where qualification failed."""
+        waiting: Dict[object, asyncio.Future] = {}
+        to_request: Dict[object, Contract] = {}
+        now = time.monotonic()
+        for contract in contracts:
+            lookup_key = self._lookup_key(contract)
+            if lookup_key in waiting or self.lookup(contract) is not None:
+                continue
+            if self._failed.get(lookup_key, 0) > now:
+                self._metrics['negativeHits'] += 1
+                continue
+            if lookup_key not in self._pending:
+                self._pending[lookup_key] = asyncio.get_running_loop().create_future()
+                to_request[lookup_key] = copy.copy(contract)
+            waiting[lookup_key] = self._pending[lookup_key]
+
+        if to_request:
+            await self._request(to_request)
+        if waiting:
+            await asyncio.gather(*waiting.values())
+
+        results = []
+        for contract in contracts:
+            cached = self.lookup(contract)
+            self._metrics['hits' if cached is not None else 'misses'] += 1
+            results.append(cached)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {'contracts': len(self._by_con_id), 'failed': len(self._failed), **self._metrics}
+
+    @staticmethod
+    def _lookup_key(contract: Contract):
+        return contract.conId or contract_key(contract)
+
+    async def _request(self, to_request: Dict[object, Contract]):
+        self._metrics['requests'] += 1
+        added = False
+        try:
+            # qualifyContractsAsync requests all details concurrently and fills in the contracts in place.
+            await self._ibgw.qualifyContractsAsync(*to_request.values())
+            for lookup_key, contract in to_request.items():
+                if contract.conId:
+                    self._remember(lookup_key, contract)
+                    added = True
+                else:
+                    logging.warning(f"ContractRegistry: Could not qualify {lookup_key}; not retrying for {self.negative_ttl}s.")
+                    self._failed[lookup_key] = time.monotonic() + self.negative_ttl
+        except Exception as e:
+            # Not negative-cached: the gateway may just be unavailable.
+            logging.error(f"ContractRegistry: Qualification request failed: {e}", exc_info=True)
+        finally:
+            for lookup_key in to_request:
+                self._pending.pop(lookup_key).set_result(None)
+        if added:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, list(self._by_con_id.values()))
+
+    def _remember(self, lookup_key, contract: Contract):
+        self._by_con_id[contract.conId] = contract
+        self._by_key[contract_key(contract)] = contract
+        if not isinstance(lookup_key, int):
+            self._by_key[lookup_key] = contract
+        self._failed.pop(lookup_key, None)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for data in json.load(f):
+                    contract = util.dictToContract(data)
+                    self._remember(contract.conId, contract)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"ContractRegistry: Ignoring unreadable registry file {self.path}: {e}")
+
+    def _save(self, contracts: List[Contract]):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump([util.contractToDict(contract) for contract in contracts], f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.warning(f"ContractRegistry: Could not persist registry to {self.path}: {e}")
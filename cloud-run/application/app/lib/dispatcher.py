@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+from os import environ
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from lib.gcp import logger as logging
+from lib.loop_monitor import current_intent
+
+
+class IntentJob:
+    """
+    A submitted intent. `future` lives on the IB loop and resolves to a
+    (result_data, error_str) tuple once the intent has finished.
+    """
+
+    def __init__(self, request_id: str, intent_class, body: dict, future: asyncio.Future,
+                 progress: Callable[[Dict[str, Any]], None] = None, timeout: float = None):
+        self.request_id = request_id
+        self.intent_class = intent_class
+        self.body = body
+        self.progress = progress
+        # Seconds the intent may run once started; None for no limit.
+        self.timeout = timeout
+        self.future = future
+        self.task: Optional[asyncio.Task] = None
+        self.status = 'queued'
+        # Called with the new status whenever the job is picked up.
+        self.listeners: List[Callable[[str], None]] = []
+
+    def set_status(self, status: str):
+        self.status = status
+        for listener in self.listeners:
+            listener(status)
+
+    def cancel(self):
+        """Drops a queued job or cancels the running intent coroutine."""
+        self.future.cancel()
+        if self.task is not None:
+            self.task.cancel()
+
+
+class IntentDispatcher:
+    """
+    Schedules intents on the IB event loop.
+
+    Read-only intents (Intent.READ_ONLY) run concurrently as soon as they are
+    submitted. Everything else may place orders, so it is queued in a bounded
+    priority queue per account and executed one at a time by that account's
+    single worker. Lower Intent.PRIORITY values run first.
+    """
+
+    DEFAULT_QUEUE_DEPTH = 8
+
+    def __init__(self, env, queue_depth: int = None):
+        self._env = env
+        self.queue_depth = queue_depth or int(environ.get('INTENT_QUEUE_DEPTH', self.DEFAULT_QUEUE_DEPTH))
+        self._queues: Dict[str, asyncio.PriorityQueue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._running: Set[asyncio.Task] = set()
+        self._sequence = itertools.count()
+
+    async def submit(self, request_id: str, intent_class, body: dict, progress=None, timeout: float = None) -> IntentJob:
+        """
+        Accepts a request for execution. Must run on the IB loop.
+        `progress`, if given, receives the intent's progress events. An intent still
+        running `timeout` seconds after it started is cancelled and reported as failed,
+        so a hung intent cannot hold the account's order queue.
+        Raises asyncio.QueueFull if the account's order queue is at capacity.
+        """
+        job = IntentJob(request_id, intent_class, body, asyncio.get_running_loop().create_future(), progress, timeout)
+        if intent_class.READ_ONLY:
+            job.task = asyncio.create_task(self._execute(job))
+            self._running.add(job.task)
+            job.task.add_done_callback(self._running.discard)
+            return job
+
+        account = str(self._env.config.get('account', 'default'))
+        self._lane(account).put_nowait((intent_class.PRIORITY, next(self._sequence), job))
+        logging.info(f"Dispatcher: Queued {intent_class.__name__} ({request_id}) for account {account}.")
+        return job
+
+    async def execute(self, request_id: str, intent_class, body: dict, timeout: float = None, progress=None):
+        """
+        Submits an intent and waits for its (result_data, error_str) tuple.
+        Timing out, or being cancelled by the caller, cancels the intent.
+        """
+        job = await self.submit(request_id, intent_class, body, progress)
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            logging.warning(f"Dispatcher: Cancelling {intent_class.__name__} ({request_id}); caller gave up.")
+            job.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queueDepth': self.queue_depth,
+            'queued': {account: queue.qsize() for account, queue in self._queues.items()},
+            'readOnlyRunning': len(self._running)
+        }
+
+    def _lane(self, account: str) -> asyncio.PriorityQueue:
+        if account not in self._queues:
+            self._queues[account] = asyncio.PriorityQueue(maxsize=self.queue_depth)
+            self._workers[account] = asyncio.create_task(self._drain(account))
+        return self._queues[account]
+
+    async def _drain(self, account: str):
+        queue = self._queues[account]
+        while True:
+            _, _, job = await queue.get()
+            try:
+                if job.future.cancelled():
+                    continue
+                # Each job gets its own task so cancelling it leaves the worker alive.
+                job.task = asyncio.create_task(self._execute(job))
+                await asyncio.wait({job.task})
+            finally:
+                queue.task_done()
+
+    async def _execute(self, job: IntentJob):
+        logging.info(f"IB Thread: Running request {job.request_id} for {job.intent_class.__name__}")
+        job.set_status('running')
+        # Attributes the loop time of this task, and of every task it starts, to the intent.
+        current_intent.set(job.intent_class.__name__)
+        result_data, error_str = {}, None
+        try:
+            intent_instance = job.intent_class(env=self._env, **job.body)
+            if job.progress is not None:
+                intent_instance.add_progress_listener(job.progress)
+            result_data = await asyncio.wait_for(intent_instance.run(), job.timeout)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except asyncio.TimeoutError:
+            logging.error(f"IB Thread: {job.intent_class.__name__} ({job.request_id}) timed out after {job.timeout}s.")
+            error_str = f'TimeoutError: Intent did not finish within {job.timeout}s'
+        except (Exception, SystemExit) as e:
+            # SystemExit is raised by the kill switch and must not tear down the loop.
+            logging.error(f"IB Thread: Error running intent: {e}", exc_info=True)
+            error_str = f'{e.__class__.__name__}: {e}'
+        if not job.future.done():
+            job.future.set_result((result_data, error_str))
@@ -1,27 +1,91 @@
 import asyncio
 from os import environ
+from lib.bar_store import BarStore
+from lib.config import ConfigCache, ConfigSnapshot
+from lib.contracts import ContractRegistry
 from lib.gcp import GcpModule
 from lib.ibgw import IBGW
+from lib.market_data import BarCache, TickerSubscriptions
+from lib.orders import OrderSubmitter, OrderTracker
 
 class _EnvironmentImpl(GcpModule):
     def __init__(self, trading_mode, ibc_config=None):
         super().__init__()
         self.trading_mode = trading_mode
-        self.config = {}
         
         # --- FINAL FIX: Re-add the self.env attribute --- 
         self.env = {k: v for k, v in environ.items() if k in ['K_REVISION', 'PROJECT_ID']}
         # --- END FINAL FIX ---
 
-        common_doc = self.db.document('config/common').get()
-        if common_doc.exists:
-            self.config.update(common_doc.to_dict())
+        # Config is loaded once here and then kept current by Firestore snapshot listeners.
+        self._config = ConfigCache(self.db, self.trading_mode, self.logging)
+        self._config.load()
+        self._config.add_listener(self._on_config_change)
+        self._config.watch()
         
-        mode_doc = self.db.document(f'config/{self.trading_mode}').get()
-        if mode_doc.exists:
-            self.config.update(mode_doc.to_dict())
-        
-        self.ibgw = IBGW(ibc_config)
+        # IB_SIMULATOR=1 swaps the gateway for a deterministic local simulator, e.g. for load tests.
+        if environ.get('IB_SIMULATOR'):
+            from lib.ib_simulator import IBSimulator
+            self.ibgw = IBSimulator.from_env()
+        else:
+            self.ibgw = IBGW(ibc_config)
+        # Long histories can be read zero-copy via bar_store.read_table().
+        self.bar_store = BarStore()
+        self.bar_cache = BarCache(self.ibgw, store=self.bar_store)
+        self.contracts = ContractRegistry(self.ibgw)
+        self.tickers = TickerSubscriptions(self.ibgw)
+        self.order_tracker = OrderTracker(self.ibgw)
+        self.orders = OrderSubmitter(self.ibgw, tracker=self.order_tracker)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Binds the write-behind store to the IB loop, which every intent write runs on,
+        records the startup config through it and starts tracking order events.
+        """
+        self.store.bind(loop)
+        self._record_config(self._config.snapshot)
+        self.order_tracker.subscribe()
+
+    @property
+    def config(self):
+        return self._config.config
+
+    @property
+    def config_hash(self):
+        return self._config.snapshot.hash
+
+    @property
+    def config_version(self):
+        return self._config.snapshot.version
+
+    def add_config_listener(self, listener):
+        """Registers a callback(old, new) for config changes; it runs on the Firestore watch thread."""
+        self._config.add_listener(listener)
+
+    def stop_config_watch(self):
+        self._config.stop()
+
+    def _on_config_change(self, old: ConfigSnapshot, new: ConfigSnapshot):
+        self.logging.info(f"Environment: Config changed ({old.hash} -> {new.hash}, version {new.version}).")
+        if old.config.get('tradingEnabled', True) != new.config.get('tradingEnabled', True):
+            self.logging.warning(f"Environment: Kill switch {'released' if new.config.get('tradingEnabled', True) else 'engaged'}.")
+        self._record_config(new)
+
+    def _record_config(self, snapshot: ConfigSnapshot):
+        # Activity logs reference the config by hash; the body is stored once per hash.
+        self.store.write_nowait(f'configVersions/{snapshot.hash}', {'config': snapshot.config, 'version': snapshot.version})
+
+    async def get_bars(self, contract, duration: str, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        """Historical bars as a DataFrame, served from the shared bar cache where possible."""
+        return await self.bar_cache.get_bars(contract, duration, bar_size, what_to_show, use_rth)
+
+    async def get_bars_since(self, contract, since, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        """Historical bars from the one dated `since` onwards, from the shared bar cache where possible."""
+        return await self.bar_cache.get_bars_since(contract, since, bar_size, what_to_show, use_rth)
+
+    async def invalidate_bars(self, contract, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        """Drops the cached and stored bars of a series, e.g. after its history was adjusted."""
+        await self.bar_cache.invalidate(contract, bar_size, what_to_show, use_rth)
 
     async def get_account_values_async(self, account):
         """Asynchronously fetches account values."""
@@ -3,10 +3,14 @@
 # == Implements lazy initialization for all GCP clients.
 # ===================================================================
 
+import asyncio
 import json
 import logging
 from os import environ
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import uuid
 
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery, firestore_v1 as firestore, logging as gcp_logging, secretmanager_v1 as secretmanager
 
 # Set up Cloud Logging robustly
@@ -50,7 +54,9 @@ class GcpModule:
         # Clients are initialized to None and will be created on first access.
         self.__bq = None
         self.__db = None
+        self.__adb = None
         self.__sm = None
+        self.__store = None
         self._logging = logger
 
     @property
@@ -67,6 +73,21 @@ class GcpModule:
             self.__db = firestore.Client(project=self._project_id)
         return self.__db
 
+    @property
+    def adb(self):
+        """Async Firestore client, for reads issued from inside the IB event loop."""
+        if self.__adb is None:
+            self._logging.info(f"Initializing async Firestore client for project '{self._project_id}'...")
+            self.__adb = firestore.AsyncClient(project=self._project_id)
+        return self.__adb
+
+    @property
+    def store(self):
+        """Non-blocking Firestore access (async reads, write-behind queue) for code on an event loop."""
+        if self.__store is None:
+            self.__store = FirestoreStore(self)
+        return self.__store
+
     @property
     def sm(self):
         if self.__sm is None:
@@ -147,4 +168,217 @@ class GcpModule:
             raise e
         except Exception as e:
             self._logging.error(f'Error reading BigQuery result: {e}')
-            raise e
\ No newline at end of file
+            raise e
+
+
+# A queued write: (path, data, merge, must_exist).
+_Write = Tuple[str, Dict[str, Any], bool, bool]
+
+
+class FirestoreStore:
+    """
+    Firestore access that never blocks the calling event loop.
+
+    Reads go through the async client. Writes are put on a bounded queue and
+    committed in batches by a background task, so callers only wait when the
+    queue is full (backpressure). Consecutive full writes to the same document
+    within a batch are coalesced. `update` writes are only applied to documents
+    that exist; missing ones are skipped without a read beforehand. `flush`
+    waits until everything queued so far is committed, `close` does the same
+    and stops the writer; call it on shutdown.
+
+    The queue and writer task belong to the loop passed to `bind` (the IB
+    loop in the service), or else to the loop of the first write. Once bound,
+    writes from other threads and loops are handed over to the bound loop, so
+    the queue is only ever touched from its own loop.
+    """
+
+    DEFAULT_QUEUE_SIZE = 1000
+    DEFAULT_BATCH_SIZE = 100
+    DEFAULT_LINGER = 0.05
+    MAX_ATTEMPTS = 3
+    RETRY_DELAY = 0.5
+
+    def __init__(self, gcp, queue_size: int = None, batch_size: int = None, linger: float = None):
+        self._gcp = gcp
+        self.queue_size = queue_size or int(environ.get('FIRESTORE_WRITE_QUEUE', self.DEFAULT_QUEUE_SIZE))
+        # A Firestore batch holds at most 500 writes.
+        self.batch_size = min(batch_size or int(environ.get('FIRESTORE_WRITE_BATCH', self.DEFAULT_BATCH_SIZE)), 500)
+        self.linger = float(environ.get('FIRESTORE_WRITE_LINGER', self.DEFAULT_LINGER)) if linger is None else linger
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._overflow: Set[asyncio.Task] = set()
+        self._metrics = {'written': 0, 'batches': 0, 'coalesced': 0, 'failed': 0, 'skipped': 0, 'throttled': 0,
+                         'overflowed': 0, 'maxPending': 0}
+
+    @property
+    def _client(self):
+        return self._gcp.adb
+
+    def collection(self, name: str):
+        """Async collection reference, for queries (`async for doc in ....stream()`)."""
+        return self._client.collection(name)
+
+    def new_path(self, collection: str) -> str:
+        """Path for a new document with a generated id, e.g. for append-only logs."""
+        return f'{collection}/{uuid.uuid4().hex}'
+
+    async def get(self, path: str) -> Optional[Dict[str, Any]]:
+        doc = await self._client.document(path).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def get_all(self, paths: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Fetches several documents in one round trip; missing documents map to None."""
+        results = {path: None for path in paths}
+        if results:
+            async for doc in self._client.get_all([self._client.document(path) for path in results]):
+                results[doc.reference.path] = doc.to_dict() if doc.exists else None
+        return results
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Runs the write-behind queue on `loop`, which need not be running yet."""
+        self._loop = loop
+
+    async def write(self, path: str, data: Dict[str, Any], merge: bool = False):
+        """Queues a write, waiting for room if the queue is full."""
+        await self._put((path, dict(data), merge, False))
+
+    async def update(self, path: str, data: Dict[str, Any]):
+        """Queues a merge into an existing document; if the document does not exist, nothing is written."""
+        await self._put((path, dict(data), True, True))
+
+    def write_nowait(self, path: str, data: Dict[str, Any], merge: bool = False):
+        """
+        Queues a write from synchronous code (e.g. a done callback). Outside an event
+        loop, and with no bound loop to hand it to, the document is written directly
+        with the synchronous client.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._foreign(running):
+            self._loop.call_soon_threadsafe(self.write_nowait, path, dict(data), merge)
+            return
+        if running is None:
+            self._gcp.db.document(path).set(data, merge=merge)
+            return
+        queue = self._ensure_writer()
+        try:
+            queue.put_nowait((path, dict(data), merge, False))
+            self._metrics['maxPending'] = max(self._metrics['maxPending'], queue.qsize())
+        except asyncio.QueueFull:
+            self._metrics['overflowed'] += 1
+            task = asyncio.create_task(self.write(path, data, merge))
+            self._overflow.add(task)
+            task.add_done_callback(self._overflow.discard)
+
+    async def flush(self):
+        """Waits until every write queued so far has been committed (or given up on)."""
+        if self._overflow:
+            await asyncio.gather(*list(self._overflow), return_exceptions=True)
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+            self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        pending = self._queue.qsize() if self._queue is not None else 0
+        return {'pending': pending + len(self._overflow), 'capacity': self.queue_size, **self._metrics}
+
+    async def _put(self, write: _Write):
+        if self._foreign(asyncio.get_running_loop()):
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._put(write), self._loop))
+            return
+        queue = self._ensure_writer()
+        if queue.full():
+            self._metrics['throttled'] += 1
+            self._gcp.logging.warning(
+                f"FirestoreStore: Write queue full ({self.queue_size}); waiting to enqueue {write[0]}.")
+        await queue.put(write)
+        self._metrics['maxPending'] = max(self._metrics['maxPending'], queue.qsize())
+
+    def _foreign(self, running: Optional[asyncio.AbstractEventLoop]) -> bool:
+        """True if the caller runs outside the bound loop, which is still usable."""
+        return self._loop is not None and running is not self._loop and not self._loop.is_closed()
+
+    def _ensure_writer(self) -> asyncio.Queue:
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._writer = asyncio.create_task(self._drain())
+        return self._queue
+
+    async def _drain(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            # Give concurrent writers a moment to join the batch.
+            await asyncio.sleep(self.linger)
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._commit(self._coalesce(batch))
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _coalesce(self, batch: List[_Write]) -> List[_Write]:
+        """Drops writes that a later full (non-merge) write to the same document replaces."""
+        writes: List[_Write] = []
+        for path, data, merge, must_exist in batch:
+            if not merge:
+                kept = [write for write in writes if write[0] != path]
+                self._metrics['coalesced'] += len(writes) - len(kept)
+                writes = kept
+            writes.append((path, data, merge, must_exist))
+        return writes
+
+    async def _commit(self, writes: List[_Write]):
+        attempt = 1
+        while writes:
+            try:
+                batch = self._client.batch()
+                for path, data, merge, must_exist in writes:
+                    if must_exist:
+                        batch.update(self._client.document(path), data)
+                    else:
+                        batch.set(self._client.document(path), data, merge=merge)
+                await batch.commit()
+                self._metrics['written'] += len(writes)
+                self._metrics['batches'] += 1
+                return
+            except Exception as e:
+                if isinstance(e, NotFound) and any(must_exist for *_, must_exist in writes):
+                    # The batch is atomic, so one missing document fails it: apply the updates one
+                    # at a time, skipping missing documents, and commit the rest again.
+                    writes = await self._update_existing(writes)
+                    continue
+                if attempt == self.MAX_ATTEMPTS:
+                    self._metrics['failed'] += len(writes)
+                    self._gcp.logging.error(
+                        f"FirestoreStore: Dropping {len(writes)} writes after {attempt} attempts: {e}", exc_info=True)
+                    return
+                self._gcp.logging.warning(f"FirestoreStore: Batch commit failed ({e}); retrying.")
+                await asyncio.sleep(self.RETRY_DELAY * 2 ** (attempt - 1))
+                attempt += 1
+
+    async def _update_existing(self, writes: List[_Write]) -> List[_Write]:
+        """Applies the `update` writes individually and returns the others."""
+        for path, data, _, must_exist in writes:
+            if not must_exist:
+                continue
+            try:
+                await self._client.document(path).update(data)
+                self._metrics['written'] += 1
+            except NotFound:
+                self._metrics['skipped'] += 1
+            except Exception as e:
+                self._metrics['failed'] += 1
+                self._gcp.logging.error(f"FirestoreStore: Dropping update of {path}: {e}", exc_info=True)
+        return [write for write in writes if not write[3]]
@@ -0,0 +1,515 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import itertools
+import math
+from os import environ
+import random
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import zlib
+
+from lib.gcp import logger as logging
+from lib.market_data import bar_size_seconds
+
+_DURATION_SECONDS = {'S': 1, 'D': 86400, 'W': 7 * 86400, 'M': 30 * 86400, 'Y': 365 * 86400}
+
+# IB error codes the simulator reports.
+PACING_VIOLATION = 162
+NO_SECURITY_DEFINITION = 200
+ORDER_REJECTED = 201
+NOT_CONNECTED = 504
+
+
+class SimEvent:
+    """Minimal stand-in for an eventkit Event: `+=` to connect, `-=` to disconnect, `emit` to call."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._handlers: List[Callable] = []
+
+    def connect(self, handler: Callable):
+        self._handlers.append(handler)
+        return self
+
+    def disconnect(self, handler: Callable):
+        if handler in self._handlers:
+            self._handlers.remove(handler)
+        return self
+
+    __iadd__ = connect
+    __isub__ = disconnect
+
+    def emit(self, *args):
+        for handler in list(self._handlers):
+            try:
+                handler(*args)
+            except Exception as e:
+                logging.error(f"IBSimulator: {self.name} handler failed: {e}", exc_info=True)
+
+
+class RequestError(Exception):
+    def __init__(self, req_id: int, code: int, message: str):
+        super().__init__(f'API error: {code}: {message}')
+        self.reqId = req_id
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class BarData:
+    date: Any
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class SimTicker:
+    def __init__(self, contract):
+        self.contract = contract
+        self.time: Optional[datetime] = None
+        self.bid = self.ask = self.last = self.close = math.nan
+        self.bidSize = self.askSize = self.lastSize = 0
+
+    def marketPrice(self) -> float:
+        mid = self.midpoint()
+        return self.last if self.bid <= self.last <= self.ask else mid
+
+    def midpoint(self) -> float:
+        return (self.bid + self.ask) / 2
+
+
+class SimTrade:
+    def __init__(self, contract, order):
+        self.contract = contract
+        self.order = order
+        self.orderStatus = SimpleNamespace(orderId=order.orderId, status='PendingSubmit', filled=0.0,
+                                           remaining=float(order.totalQuantity), avgFillPrice=0.0)
+        self.fills: List[SimpleNamespace] = []
+        self.log: List[SimpleNamespace] = []
+        self.statusEvent = SimEvent('statusEvent')
+        self.fillEvent = SimEvent('fillEvent')
+        self.filledEvent = SimEvent('filledEvent')
+        self.cancelledEvent = SimEvent('cancelledEvent')
+
+    def remaining(self) -> float:
+        return self.orderStatus.remaining
+
+    def filled(self) -> float:
+        return self.orderStatus.filled
+
+    def isActive(self) -> bool:
+        return self.orderStatus.status in ('PendingSubmit', 'PreSubmitted', 'Submitted')
+
+    def isDone(self) -> bool:
+        return self.orderStatus.status in ('Filled', 'Cancelled', 'Inactive')
+
+
+class IBSimulator:
+    """
+    Deterministic in-process stand-in for an IB Gateway connection, exposing
+    the subset of the `ib_insync.IB` API this service uses: connecting,
+    contract qualification, historical bars, streaming and snapshot tickers,
+    account values, positions, order placement with fills, and executions.
+
+    Every request waits `latency` seconds plus seeded jitter. Historical data
+    requests are paced like the gateway: an identical request within
+    `identical_window` seconds, or more than `pacing_limit` requests within
+    `pacing_window` seconds, is answered with error 162 and no bars (or a
+    RequestError when RaiseRequestErrors is set, as in ib_insync). With
+    `disconnect_every` the connection drops after that many requests, failing
+    in-flight requests with ConnectionError; the first `connect_failures`
+    connection attempts time out.
+
+    Prices follow a random walk seeded per contract, so a given seed and
+    request sequence produce the same bars, quotes and fills on every run.
+
+    Set IB_SIMULATOR=1 to have the Environment use it instead of the gateway.
+    """
+
+    DEFAULT_SEED = 7
+    DEFAULT_LATENCY = 0.02
+    DEFAULT_JITTER = 0.01
+    DEFAULT_PACING_LIMIT = 60
+    DEFAULT_PACING_WINDOW = 600
+    DEFAULT_IDENTICAL_WINDOW = 15
+    DEFAULT_FILL_LATENCY = 0.05
+    DEFAULT_TICK_INTERVAL = 0.25
+
+    RaiseRequestErrors = False
+
+    def __init__(self, seed: int = DEFAULT_SEED, latency: float = DEFAULT_LATENCY, jitter: float = DEFAULT_JITTER,
+                 pacing_limit: int = DEFAULT_PACING_LIMIT, pacing_window: float = DEFAULT_PACING_WINDOW,
+                 identical_window: float = DEFAULT_IDENTICAL_WINDOW, fill_latency: float = DEFAULT_FILL_LATENCY,
+                 tick_interval: float = DEFAULT_TICK_INTERVAL, disconnect_every: int = 0, connect_failures: int = 0,
+                 reject_rate: float = 0.0, slippage_bps: float = 1.0, net_liquidation: float = 1_000_000.0,
+                 account: str = 'DU0000000', unknown_symbols: Tuple[str, ...] = ()):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.pacing_limit = pacing_limit
+        self.pacing_window = pacing_window
+        self.identical_window = identical_window
+        self.fill_latency = fill_latency
+        self.tick_interval = tick_interval
+        self.disconnect_every = disconnect_every
+        self.connect_failures = connect_failures
+        self.reject_rate = reject_rate
+        self.slippage_bps = slippage_bps
+        self.account = account
+        self.unknown_symbols = set(unknown_symbols)
+        self.cash = net_liquidation
+
+        self._random = random.Random(seed)
+        self._connected = False
+        self._in_flight: List[asyncio.Future] = []
+        self._history_log: List[Tuple[float, tuple]] = []
+        self._req_ids = itertools.count(1)
+        self._order_ids = itertools.count(1)
+        self._contracts: Dict[int, Any] = {}
+        self._prices: Dict[int, float] = {}
+        self._walks: Dict[int, random.Random] = {}
+        self._tickers: Dict[int, SimTicker] = {}
+        self._ticker_task: Optional[asyncio.Task] = None
+        self._positions: Dict[int, float] = {}
+        self._trades: List[SimTrade] = []
+        self._fills: List[SimpleNamespace] = []
+        self._calls: Dict[str, int] = {}
+        self._metrics = {'requests': 0, 'pacingViolations': 0, 'disconnects': 0, 'connectFailures': 0,
+                         'orders': 0, 'fills': 0, 'rejects': 0}
+
+        self.connectedEvent = SimEvent('connectedEvent')
+        self.disconnectedEvent = SimEvent('disconnectedEvent')
+        self.errorEvent = SimEvent('errorEvent')
+        self.orderStatusEvent = SimEvent('orderStatusEvent')
+        self.execDetailsEvent = SimEvent('execDetailsEvent')
+        self.newOrderEvent = SimEvent('newOrderEvent')
+        self.pendingTickersEvent = SimEvent('pendingTickersEvent')
+
+    @classmethod
+    def from_env(cls) -> "IBSimulator":
+        return cls(seed=int(environ.get('IB_SIM_SEED', cls.DEFAULT_SEED)),
+                   latency=float(environ.get('IB_SIM_LATENCY', cls.DEFAULT_LATENCY)),
+                   jitter=float(environ.get('IB_SIM_JITTER', cls.DEFAULT_JITTER)),
+                   pacing_limit=int(environ.get('IB_SIM_PACING_LIMIT', cls.DEFAULT_PACING_LIMIT)),
+                   disconnect_every=int(environ.get('IB_SIM_DISCONNECT_EVERY', 0)),
+                   reject_rate=float(environ.get('IB_SIM_REJECT_RATE', 0.0)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'connected': self._connected, 'openTrades': len(self.openTrades()), 'calls': dict(self._calls),
+                **self._metrics}
+
+    # --- Connection ---
+
+    def isConnected(self) -> bool:
+        return self._connected
+
+    async def connectAsync(self, host: str = '127.0.0.1', port: int = 4002, clientId: int = 1, timeout: float = 4,
+                           **kwargs):
+        await asyncio.sleep(self._delay())
+        if self.connect_failures > 0:
+            self.connect_failures -= 1
+            self._metrics['connectFailures'] += 1
+            raise asyncio.TimeoutError()
+        self._connected = True
+        self.connectedEvent.emit()
+        return self
+
+    def disconnect(self):
+        if not self._connected:
+            return
+        self._connected = False
+        self._metrics['disconnects'] += 1
+        for future in self._in_flight:
+            if not future.done():
+                future.set_exception(ConnectionError('Socket disconnect'))
+        self._in_flight = []
+        if self._ticker_task is not None:
+            self._ticker_task.cancel()
+            self._ticker_task = None
+        self.disconnectedEvent.emit()
+
+    async def _request(self, name: str, result: Callable[[], Any] = lambda: None, delay: float = None):
+        """Completes after the simulated round trip unless the connection drops first."""
+        if not self._connected:
+            self.errorEvent.emit(-1, NOT_CONNECTED, 'Not connected', None)
+            raise ConnectionError('Not connected')
+        self._metrics['requests'] += 1
+        self._calls[name] = self._calls.get(name, 0) + 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight.append(future)
+        asyncio.get_running_loop().call_later(self._delay() if delay is None else delay,
+                                              lambda: future.done() or future.set_result(None))
+        if self.disconnect_every and self._metrics['requests'] % self.disconnect_every == 0:
+            asyncio.get_running_loop().call_soon(self.disconnect)
+        try:
+            await future
+        finally:
+            if future in self._in_flight:
+                self._in_flight.remove(future)
+        return result()
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    # --- Contracts and market data ---
+
+    def _con_id(self, contract) -> int:
+        key = f"{contract.symbol}|{getattr(contract, 'secType', 'STK')}|{getattr(contract, 'currency', 'USD')}"
+        return zlib.crc32(key.encode()) % 9_000_000 + 1_000_000
+
+    async def qualifyContractsAsync(self, *contracts):
+        await self._request('qualifyContracts')
+        qualified = []
+        for contract in contracts:
+            known = self._contracts.get(getattr(contract, 'conId', 0))
+            if known is not None and not getattr(contract, 'symbol', ''):
+                # Qualifying by conId alone, as for positions read back from storage.
+                for field in ('symbol', 'secType', 'exchange', 'currency', 'localSymbol', 'primaryExchange'):
+                    setattr(contract, field, getattr(known, field, ''))
+            if contract.symbol in self.unknown_symbols:
+                self.errorEvent.emit(next(self._req_ids), NO_SECURITY_DEFINITION,
+                                     'No security definition has been found for the request', contract)
+                continue
+            contract.conId = getattr(contract, 'conId', 0) or self._con_id(contract)
+            contract.localSymbol = getattr(contract, 'localSymbol', '') or contract.symbol
+            contract.primaryExchange = getattr(contract, 'primaryExchange', '') or 'ARCA'
+            self._contracts[contract.conId] = contract
+            qualified.append(contract)
+        return qualified
+
+    async def reqContractDetailsAsync(self, contract):
+        qualified = await self.qualifyContractsAsync(contract)
+        return [SimpleNamespace(contract=c, minTick=0.01, longName=c.symbol) for c in qualified]
+
+    def _price(self, con_id: int) -> float:
+        if con_id not in self._prices:
+            walk = self._walks[con_id] = random.Random(f'{self.seed}-{con_id}')
+            self._prices[con_id] = walk.uniform(20, 500)
+        return self._prices[con_id]
+
+    def _step_price(self, con_id: int) -> float:
+        price = self._price(con_id)
+        self._prices[con_id] = price * math.exp(self._walks[con_id].gauss(0, 0.001))
+        return self._prices[con_id]
+
+    def _paced(self, key: tuple) -> Optional[str]:
+        now = asyncio.get_running_loop().time()
+        self._history_log = [(t, k) for t, k in self._history_log if now - t < self.pacing_window]
+        violation = None
+        if any(k == key and now - t < self.identical_window for t, k in self._history_log):
+            violation = 'Historical Market Data Service error message:Pacing violation (identical request)'
+        elif len(self._history_log) >= self.pacing_limit:
+            violation = 'Historical Market Data Service error message:Pacing violation'
+        self._history_log.append((now, key))
+        return violation
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 day',
+                                     whatToShow='TRADES', useRTH=True, formatDate=1, keepUpToDate=False,
+                                     chartOptions=None, timeout=60):
+        req_id = next(self._req_ids)
+        await self._request('reqHistoricalData')
+        violation = self._paced((contract.conId, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH))
+        if violation:
+            self._metrics['pacingViolations'] += 1
+            self.errorEvent.emit(req_id, PACING_VIOLATION, violation, contract)
+            if self.RaiseRequestErrors:
+                raise RequestError(req_id, PACING_VIOLATION, violation)
+            return []
+        return self._bars(contract.conId, durationStr, barSizeSetting)
+
+    def _bars(self, con_id: int, duration: str, bar_size: str) -> List[BarData]:
+        count, unit = duration.split()
+        step = bar_size_seconds(bar_size)
+        n = max(1, int(count) * _DURATION_SECONDS[unit] // step)
+        if step >= 86400:
+            n = max(1, n * 5 // 7)
+        walk = random.Random(f'{self.seed}-{con_id}-{bar_size}')
+        close = self._price(con_id)
+        end = datetime.now(timezone.utc)
+        bars = []
+        for i in range(n):
+            change = math.exp(walk.gauss(0, 0.01))
+            open_ = close / change
+            when = end - timedelta(seconds=step * i)
+            stamp = when.date() if step >= 86400 else when.replace(second=0, microsecond=0)
+            bars.append(BarData(stamp, open_, max(open_, close) * 1.002, min(open_, close) * 0.998, close,
+                                float(walk.randint(1_000, 100_000))))
+            close = open_
+        return bars[::-1]
+
+    def reqMarketDataType(self, market_data_type: int):
+        self.market_data_type = market_data_type
+
+    def reqMktData(self, contract, genericTickList: str = '', snapshot: bool = False,
+                   regulatorySnapshot: bool = False, mktDataOptions=None) -> SimTicker:
+        ticker = self._tickers.get(contract.conId)
+        if ticker is None:
+            ticker = self._tickers[contract.conId] = SimTicker(contract)
+        if self._connected and self._ticker_task is None:
+            self._ticker_task = asyncio.get_running_loop().create_task(self._stream_tickers())
+        return ticker
+
+    def cancelMktData(self, contract):
+        self._tickers.pop(contract.conId, None)
+
+    def _quote(self, ticker: SimTicker):
+        price = self._step_price(ticker.contract.conId)
+        spread = price * 0.0002
+        ticker.bid, ticker.ask, ticker.last = price - spread, price + spread, price
+        ticker.bidSize = ticker.askSize = 100
+        ticker.time = datetime.now(timezone.utc)
+
+    async def _stream_tickers(self):
+        while self._connected:
+            for ticker in self._tickers.values():
+                self._quote(ticker)
+            if self._tickers:
+                self.pendingTickersEvent.emit(set(self._tickers.values()))
+            await asyncio.sleep(self.tick_interval)
+
+    async def reqTickersAsync(self, *contracts, regulatorySnapshot: bool = False):
+        await self._request('reqTickers')
+        tickers = []
+        for contract in contracts:
+            ticker = SimTicker(contract)
+            self._quote(ticker)
+            tickers.append(ticker)
+        return tickers
+
+    async def reqCurrentTimeAsync(self) -> datetime:
+        await self._request('reqCurrentTime')
+        return datetime.now(timezone.utc)
+
+    # --- Account ---
+
+    def seed_position(self, contract, quantity: float):
+        """Starts the account with a position, e.g. to set up a load test."""
+        contract.conId = getattr(contract, 'conId', 0) or self._con_id(contract)
+        self._contracts[contract.conId] = contract
+        self._positions[contract.conId] = quantity
+
+    def _account_values(self):
+        net_liquidation = self.cash + sum(q * self._price(c) for c, q in self._positions.items())
+        return [SimpleNamespace(account=self.account, tag=tag, value=str(value), currency='USD', modelCode='')
+                for tag, value in (('NetLiquidation', net_liquidation), ('TotalCashValue', self.cash))]
+
+    def accountValues(self, account: str = ''):
+        return self._account_values()
+
+    async def accountSummaryAsync(self, account: str = ''):
+        return await self._request('accountSummary', self._account_values)
+
+    def positions(self, account: str = ''):
+        return [SimpleNamespace(account=self.account, contract=self._contracts[c], position=q, avgCost=0.0)
+                for c, q in self._positions.items() if q]
+
+    async def reqPositionsAsync(self):
+        return await self._request('reqPositions', self.positions)
+
+    def portfolio(self, account: str = ''):
+        return [SimpleNamespace(account=self.account, contract=p.contract, position=p.position,
+                                marketPrice=self._price(p.contract.conId),
+                                marketValue=p.position * self._price(p.contract.conId),
+                                averageCost=0.0, unrealizedPNL=0.0, realizedPNL=0.0)
+                for p in self.positions()]
+
+    # --- Orders ---
+
+    def trades(self) -> List[SimTrade]:
+        return list(self._trades)
+
+    def openTrades(self) -> List[SimTrade]:
+        return [t for t in self._trades if not t.isDone()]
+
+    def openOrders(self):
+        return [t.order for t in self.openTrades()]
+
+    async def reqOpenOrdersAsync(self):
+        return await self._request('reqOpenOrders', self.openOrders)
+
+    def fills(self):
+        return list(self._fills)
+
+    async def reqExecutionsAsync(self, execFilter=None):
+        return await self._request('reqExecutions', self.fills)
+
+    def placeOrder(self, contract, order) -> SimTrade:
+        if not getattr(order, 'orderId', 0):
+            order.orderId = next(self._order_ids)
+            order.permId = 1_000_000 + order.orderId
+        trade = SimTrade(contract, order)
+        self._trades.append(trade)
+        self._metrics['orders'] += 1
+        self.newOrderEvent.emit(trade)
+        loop = asyncio.get_running_loop()
+        if not self._connected:
+            loop.call_soon(self.errorEvent.emit, order.orderId, NOT_CONNECTED, 'Not connected', contract)
+            loop.call_soon(self._set_status, trade, 'Cancelled', 'Not connected', NOT_CONNECTED)
+        elif self._random.random() < self.reject_rate:
+            self._metrics['rejects'] += 1
+            loop.call_later(self._delay(), self._reject, trade)
+        else:
+            loop.call_later(self._delay(), self._set_status, trade, 'Submitted')
+            loop.call_later(self._delay() + self.fill_latency, self._fill, trade)
+        return trade
+
+    def cancelOrder(self, order):
+        trade = next((t for t in self._trades if t.order is order or t.order.orderId == order.orderId), None)
+        if trade is not None and not trade.isDone():
+            asyncio.get_running_loop().call_later(self._delay(), self._set_status, trade, 'Cancelled')
+        return trade
+
+    def reqGlobalCancel(self):
+        for trade in self.openTrades():
+            asyncio.get_running_loop().call_later(self._delay(), self._set_status, trade, 'Cancelled')
+
+    def _set_status(self, trade: SimTrade, status: str, message: str = '', error_code: int = 0):
+        if trade.isDone():
+            return
+        trade.orderStatus.status = status
+        if status == 'Cancelled':
+            trade.orderStatus.remaining = 0.0
+        trade.log.append(SimpleNamespace(time=datetime.now(timezone.utc), status=status, message=message,
+                                         errorCode=error_code))
+        trade.statusEvent.emit(trade)
+        self.orderStatusEvent.emit(trade)
+        if status == 'Cancelled':
+            trade.cancelledEvent.emit(trade)
+
+    def _reject(self, trade: SimTrade):
+        message = 'Order rejected - reason:simulated'
+        self.errorEvent.emit(trade.order.orderId, ORDER_REJECTED, message, trade.contract)
+        self._set_status(trade, 'Inactive', message, ORDER_REJECTED)
+
+    def _fill(self, trade: SimTrade):
+        if trade.isDone() or not self._connected:
+            return
+        con_id = trade.contract.conId
+        self._contracts.setdefault(con_id, trade.contract)
+        sign = 1 if trade.order.action == 'BUY' else -1
+        quantity = trade.remaining()
+        price = self._step_price(con_id) * (1 + sign * self.slippage_bps / 10_000)
+        self._positions[con_id] = self._positions.get(con_id, 0) + sign * quantity
+        self.cash -= sign * quantity * price
+        now = datetime.now(timezone.utc)
+        execution = SimpleNamespace(execId=f'sim.{trade.order.orderId}.{len(self._fills)}', time=now,
+                                    acctNumber=self.account, side='BOT' if sign > 0 else 'SLD', shares=quantity,
+                                    price=price, orderId=trade.order.orderId,
+                                    permId=getattr(trade.order, 'permId', 0), cumQty=quantity, avgPrice=price,
+                                    orderRef=getattr(trade.order, 'orderRef', ''))
+        fill = SimpleNamespace(contract=trade.contract, execution=execution, time=now,
+                               commissionReport=SimpleNamespace(execId=execution.execId, commission=0.005 * quantity,
+                                                                currency='USD', realizedPNL=0.0))
+        trade.fills.append(fill)
+        self._fills.append(fill)
+        self._metrics['fills'] += 1
+        trade.orderStatus.filled += quantity
+        trade.orderStatus.remaining = 0.0
+        trade.orderStatus.avgFillPrice = price
+        self.execDetailsEvent.emit(trade, fill)
+        trade.fillEvent.emit(trade, fill)
+        self._set_status(trade, 'Filled')
+        trade.filledEvent.emit(trade)
@@ -1,6 +1,7 @@
 import asyncio
 from ib_insync import IB, IBC
 from lib.gcp import logger as logging
+from lib.pacing import ACCOUNT_LANE, DATA_LANE, RequestGovernor
 
 class IBGW(IB):
 
@@ -14,6 +15,8 @@ class IBGW(IB):
         self.connection_timeout = connection_timeout
         self.timeout_sleep = timeout_sleep
         self.ibc = IBC(**self.ibc_config)
+        # Paces the requests below; OrderSubmitter takes its order slots from the same governor.
+        self.governor = RequestGovernor()
 
     async def start_and_connect_async(self):
         """Asynchronously connects to an already running IB gateway with robust retries."""
@@ -40,3 +43,44 @@ class IBGW(IB):
         logging.info('Terminating IBC...')
         # In a container, we might not need to terminate IBC, but it's good practice
         # await self.ibc.terminateAsync()
+
+    def stats(self):
+        return {'connected': self.isConnected(), 'governor': self.governor.stats()}
+
+    # --- Governed requests ---
+    # qualifyContractsAsync and accountSummaryAsync go through reqContractDetailsAsync and reqAccountSummaryAsync.
+
+    async def reqHistoricalDataAsync(self, contract, *args, **kwargs):
+        what_to_show = kwargs.get('whatToShow', args[3] if len(args) > 3 else '')
+        contract_key = (contract.conId or contract.symbol, getattr(contract, 'exchange', ''), what_to_show)
+        key = (contract_key, repr(args), repr(sorted(kwargs.items())))
+        return await self.governor.historical(
+            key, contract_key, lambda: super(IBGW, self).reqHistoricalDataAsync(contract, *args, **kwargs))
+
+    async def reqContractDetailsAsync(self, contract):
+        await self.governor.acquire(DATA_LANE)
+        return await super().reqContractDetailsAsync(contract)
+
+    async def reqTickersAsync(self, *contracts, **kwargs):
+        await self.governor.acquire(DATA_LANE, max(1, len(contracts)))
+        return await super().reqTickersAsync(*contracts, **kwargs)
+
+    def reqMktData(self, contract, *args, **kwargs):
+        self.governor.take()
+        return super().reqMktData(contract, *args, **kwargs)
+
+    async def reqAccountSummaryAsync(self, *args, **kwargs):
+        await self.governor.acquire(ACCOUNT_LANE)
+        return await super().reqAccountSummaryAsync(*args, **kwargs)
+
+    async def reqPositionsAsync(self):
+        await self.governor.acquire(ACCOUNT_LANE)
+        return await super().reqPositionsAsync()
+
+    async def reqOpenOrdersAsync(self):
+        await self.governor.acquire(ACCOUNT_LANE)
+        return await super().reqOpenOrdersAsync()
+
+    async def reqExecutionsAsync(self, *args, **kwargs):
+        await self.governor.acquire(ACCOUNT_LANE)
+        return await super().reqExecutionsAsync(*args, **kwargs)
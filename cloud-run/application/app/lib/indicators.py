@@ -0,0 +1,127 @@
+"""
+Technical indicators over a whole universe at once.
+
+Inputs are 2-D arrays of shape (bars, symbols), oldest bar first; 1-D arrays
+are treated as a single symbol. Symbols with a shorter history are padded
+with leading NaNs and their indicators start at their first valid bar.
+
+The recursive indicators (EMA, MACD, RSI, ATR) return their terminal state
+alongside the values. Passing that state back in with only the new bars
+continues the recursion, so appending one bar costs O(symbols) instead of
+recomputing the full history. EMAs follow pandas' `ewm(span=n, adjust=False)`.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def as_universe(frames: Dict[str, pd.DataFrame], column: str = 'close') -> Tuple[List[str], pd.Index, np.ndarray]:
+    """Aligns per-symbol bar DataFrames on their dates: (symbols, dates, values of shape (bars, symbols))."""
+    wide = pd.concat({symbol: df.set_index('date')[column] for symbol, df in frames.items()}, axis=1).sort_index()
+    return list(wide.columns), wide.index, wide.to_numpy(dtype=float)
+
+
+def _2d(values) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    return values[:, None] if values.ndim == 1 else values
+
+
+def _ewm(values: np.ndarray, alpha: float, prev: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """y[t] = alpha * x[t] + (1 - alpha) * y[t-1]; a missing x[t] carries y[t-1] forward."""
+    prev = np.full(values.shape[1], np.nan) if prev is None else np.asarray(prev, dtype=float)
+    out = np.empty_like(values)
+    for t, row in enumerate(values):
+        prev = np.where(np.isnan(prev), row, np.where(np.isnan(row), prev, alpha * row + (1 - alpha) * prev))
+        out[t] = prev
+    return out, prev
+
+
+def ema(values, span: int, state: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (ema, state), where state is the last EMA of each symbol."""
+    return _ewm(_2d(values), 2 / (span + 1), state)
+
+
+class MACDState(NamedTuple):
+    fast: np.ndarray
+    slow: np.ndarray
+    signal: np.ndarray
+
+
+class MACD(NamedTuple):
+    macd: np.ndarray
+    signal: np.ndarray
+    histogram: np.ndarray
+    state: MACDState
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9, state: MACDState = None) -> MACD:
+    close = _2d(close)
+    fast_ema, fast_state = ema(close, fast, state and state.fast)
+    slow_ema, slow_state = ema(close, slow, state and state.slow)
+    line = fast_ema - slow_ema
+    signal_line, signal_state = ema(line, signal, state and state.signal)
+    return MACD(line, signal_line, line - signal_line, MACDState(fast_state, slow_state, signal_state))
+
+
+class RSIState(NamedTuple):
+    close: np.ndarray
+    gain: np.ndarray
+    loss: np.ndarray
+
+
+def rsi(close, period: int = 14, state: RSIState = None) -> Tuple[np.ndarray, RSIState]:
+    """Wilder's RSI; the first bar of a series without state has no value."""
+    close = _2d(close)
+    prev = np.full(close.shape[1], np.nan) if state is None else state.close
+    change = np.diff(np.vstack([prev, close]), axis=0)
+    gain, gain_state = _ewm(np.where(np.isnan(change), np.nan, np.clip(change, 0, None)), 1 / period,
+                            state and state.gain)
+    loss, loss_state = _ewm(np.where(np.isnan(change), np.nan, np.clip(-change, 0, None)), 1 / period,
+                            state and state.loss)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), 100 - 100 / (1 + gain / loss))
+    values[np.isnan(gain) | np.isnan(loss)] = np.nan
+    return values, RSIState(_last_valid(close, prev), gain_state, loss_state)
+
+
+class ATRState(NamedTuple):
+    close: np.ndarray
+    atr: np.ndarray
+
+
+def atr(high, low, close, period: int = 14, state: ATRState = None) -> Tuple[np.ndarray, ATRState]:
+    """Wilder's average true range; without state the first bar's range is high - low."""
+    high, low, close = _2d(high), _2d(low), _2d(close)
+    prev = np.full(close.shape[1], np.nan) if state is None else state.close
+    prev_close = np.vstack([prev, close[:-1]])
+    # fmax ignores NaN, so a missing previous close falls back to high - low.
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    values, atr_state = _ewm(true_range, 1 / period, state and state.atr)
+    return values, ATRState(_last_valid(close, prev), atr_state)
+
+
+def zscore(values, window: int) -> np.ndarray:
+    """
+    Rolling z-score of each symbol over `window` bars (sample standard
+    deviation, as pandas' rolling std). The first window - 1 bars are NaN.
+    Not recursive: to update with a new bar, pass the last `window` bars.
+    """
+    values = _2d(values)
+    out = np.full_like(values, np.nan)
+    if len(values) < window:
+        return out
+    windows = sliding_window_view(values, window, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[window - 1:] = (values[window - 1:] - windows.mean(axis=-1)) / windows.std(axis=-1, ddof=1)
+    return out
+
+
+def _last_valid(values: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    """Last non-NaN row value per column, or `prev` where the column has none."""
+    last = prev.copy()
+    for row in values:
+        last = np.where(np.isnan(row), last, row)
+    return last
@@ -0,0 +1,182 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from hashlib import md5
+from os import environ
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lib.gcp import logger as logging
+
+TERMINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobRegistry:
+    """
+    Runs intents as background jobs and persists their status to Firestore.
+
+    Jobs are stored under an idempotency key derived from the intent
+    signature, so a retried submission (e.g. a Cloud Scheduler retry) returns
+    the original job instead of executing the intent a second time. When the
+    caller provides a slot (Idempotency-Key or X-CloudScheduler-ScheduleTime
+    header) the key is unique per slot; otherwise identical requests are
+    deduplicated while running and for `dedup_window` seconds after they
+    succeeded. Failed and cancelled jobs are never deduplicated, so they can
+    be retried right away. Identical requests arriving together share one job.
+    """
+
+    COLLECTION = 'jobs'
+    DEFAULT_DEDUP_WINDOW = 900
+
+    def __init__(self, env, dispatcher, dedup_window: int = None):
+        self._env = env
+        self._dispatcher = dispatcher
+        self.dedup_window = dedup_window or int(environ.get('JOB_DEDUP_SECONDS', self.DEFAULT_DEDUP_WINDOW))
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # Keys of jobs being started, resolved with their record once started.
+        self._starting: Dict[str, asyncio.Future] = {}
+        self._subscribers: Dict[str, List[Callable[[Optional[Dict[str, Any]]], None]]] = {}
+
+    @staticmethod
+    def idempotency_key(signature: str, slot: str = None) -> str:
+        return md5(f'{signature}:{slot}'.encode()).hexdigest() if slot else signature
+
+    async def start(self, intent_name: str, intent_class, body: dict, slot: str = None,
+                    timeout: float = None) -> Dict[str, Any]:
+        """
+        Submits an intent as a job, or returns the existing job for a retried request.
+        A job still running `timeout` seconds after it started is cancelled and marked failed.
+        Raises asyncio.QueueFull if the dispatcher cannot accept it.
+        """
+        self._evict()
+        key = self.idempotency_key(intent_class.signature_for(self._env, **body), slot)
+        starting = self._starting.get(key)
+        if starting is not None:
+            # An identical request is being started right now; join its job rather than racing it.
+            record = await asyncio.shield(starting)
+            if record is None:
+                return await self.start(intent_name, intent_class, body, slot, timeout)
+            logging.info(f"Jobs: Request for {intent_name} joins job {key} being started; not executing again.")
+            return {**record, 'deduplicated': True}
+
+        # The key is reserved before the first await, so concurrent duplicates see it.
+        starting = self._starting[key] = asyncio.get_running_loop().create_future()
+        record = None
+        try:
+            record, deduplicated = await self._start(key, intent_name, intent_class, body, slot, timeout)
+            return {**record, 'deduplicated': deduplicated}
+        finally:
+            del self._starting[key]
+            # None lets joiners try again themselves if this start failed.
+            starting.set_result(dict(record) if record else None)
+
+    async def _start(self, key: str, intent_name: str, intent_class, body: dict, slot: Optional[str],
+                     timeout: Optional[float]) -> Tuple[Dict[str, Any], bool]:
+        existing = self._jobs.get(key) or await self._load(key)
+        if existing and self._is_duplicate(existing, slot):
+            logging.info(f"Jobs: Request for {intent_name} matches job {key} ({existing['status']}); not executing again.")
+            return existing, True
+
+        job = await self._dispatcher.submit(key, intent_class, body, timeout=timeout)
+        now = _now()
+        self._jobs[key] = {
+            'jobId': key,
+            'intent': intent_name,
+            'slot': slot,
+            'status': job.status,
+            'created_at': now,
+            'updated_at': now,
+            'result': None,
+            'error': None
+        }
+        job.listeners.append(lambda status: self._update(key, status=status))
+        job.future.add_done_callback(lambda future: self._finish(key, future))
+        self._persist(self._jobs[key])
+        return self._jobs[key], False
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        record = self._jobs.get(job_id) or await self._load(job_id)
+        return dict(record) if record else None
+
+    async def subscribe(self, job_id: str, callback: Callable[[Optional[Dict[str, Any]]], None]) -> Optional[Callable[[], None]]:
+        """
+        Calls `callback` with the current record and again on every status change.
+        `None` is delivered when no further updates will follow. Returns an
+        unsubscribe function, or None if the job is unknown.
+        """
+        record = self._jobs.get(job_id)
+        if record is None:
+            persisted = await self._load(job_id)
+            if persisted is None:
+                return None
+            # Known only from Firestore (earlier revision or another instance): no live updates.
+            callback(persisted)
+            callback(None)
+            return lambda: None
+
+        callback(dict(record))
+        if record['status'] in TERMINAL_STATES:
+            callback(None)
+            return lambda: None
+        self._subscribers.setdefault(job_id, []).append(callback)
+
+        def unsubscribe():
+            if callback in self._subscribers.get(job_id, []):
+                self._subscribers[job_id].remove(callback)
+        return unsubscribe
+
+    def _is_duplicate(self, record: Dict[str, Any], slot: Optional[str]) -> bool:
+        status = record['status']
+        if status in ('failed', 'cancelled'):
+            return False
+        if status == 'succeeded' and slot:
+            return True
+        if status not in TERMINAL_STATES and record['jobId'] in self._jobs:
+            return True
+        # Persisted records age out, so a job orphaned by a crashed instance does not block forever.
+        return self._age(record) < self.dedup_window
+
+    def _evict(self):
+        """Forgets finished jobs older than the dedup window; their Firestore records remain."""
+        expired = [key for key, record in self._jobs.items()
+                   if record['status'] in TERMINAL_STATES and self._age(record) >= self.dedup_window]
+        for key in expired:
+            del self._jobs[key]
+
+    @staticmethod
+    def _age(record: Dict[str, Any]) -> float:
+        return (datetime.now(timezone.utc) - datetime.fromisoformat(record['updated_at'])).total_seconds()
+
+    def _finish(self, key: str, future):
+        if future.cancelled():
+            self._update(key, status='cancelled')
+            return
+        result_data, error_str = future.result()
+        # Round-trip through JSON so the stored result matches what the HTTP API returns.
+        result = json.loads(json.dumps(result_data, default=str)) if result_data else None
+        self._update(key, status='failed' if error_str else 'succeeded', result=result, error=error_str)
+
+    def _update(self, key: str, **changes):
+        record = self._jobs[key]
+        record.update(changes, updated_at=_now())
+        self._persist(record)
+        terminal = record['status'] in TERMINAL_STATES
+        subscribers = self._subscribers.pop(key, []) if terminal else self._subscribers.get(key, [])
+        for callback in list(subscribers):
+            callback(dict(record))
+            if terminal:
+                callback(None)
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self._env.store.get(f'{self.COLLECTION}/{key}')
+        except Exception as e:
+            logging.error(f"Jobs: Failed to load job {key}: {e}", exc_info=True)
+            return None
+
+    def _persist(self, record: Dict[str, Any]):
+        # Status changes arrive from done callbacks, so the write is queued without waiting.
+        self._env.store.write_nowait(f"{self.COLLECTION}/{record['jobId']}", record)
@@ -0,0 +1,206 @@
+import asyncio
+from bisect import bisect_left
+from collections import deque
+import contextvars
+from datetime import datetime, timezone
+from os import environ
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from lib.gcp import logger as logging
+
+# Name of the intent whose code is running; set by the dispatcher and inherited by every task the intent starts.
+current_intent: contextvars.ContextVar = contextvars.ContextVar('current_intent', default=None)
+
+
+
+class MonitoredEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop that lets a LoopMonitor time the callbacks it schedules.
+
+    Callbacks scheduled through call_soon, call_at (and so call_later) and
+    call_soon_threadsafe, which include every task step and future callback,
+    run wrapped in the monitor's timer. I/O callbacks of transports do not
+    pass through these methods; time they block the loop still shows up as
+    loop lag.
+    """
+
+    monitor: Optional['LoopMonitor'] = None
+
+    def call_soon(self, callback, *args, context=None):
+        if self.monitor is None:
+            return super().call_soon(callback, *args, context=context)
+        return super().call_soon(self.monitor._run, callback, args, context=context)
+
+    def call_at(self, when, callback, *args, context=None):
+        if self.monitor is None:
+            return super().call_at(when, callback, *args, context=context)
+        return super().call_at(when, self.monitor._run, callback, args, context=context)
+
+    def call_soon_threadsafe(self, callback, *args, context=None):
+        if self.monitor is None:
+            return super().call_soon_threadsafe(callback, *args, context=context)
+        return super().call_soon_threadsafe(self.monitor._run, callback, args, context=context)
+
+
+class Histogram:
+    """Cumulative histogram of durations, bucketed in milliseconds."""
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f'le{bound}ms': count for bound, count in zip(self.BUCKETS_MS, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {'count': self.count, 'sumMs': round(self.total, 3), 'maxMs': round(self.max, 3), 'buckets': buckets}
+
+
+class LoopMonitor:
+    """
+    Watches an event loop for stalls.
+
+    Every callback a MonitoredEventLoop schedules is timed, and its duration
+    is attributed to the intent it belongs to (see `current_intent`) so
+    blocking time shows up
+    per intent. Callbacks running longer than `slow_callback` seconds are
+    recorded with the stack of the loop thread, which a watchdog thread samples
+    while the callback is still running. A heartbeat task additionally
+    measures how late the loop wakes up (loop lag), which is what every other
+    coroutine on the loop, including ib_insync's message handling, experiences.
+    """
+
+    DEFAULT_INTERVAL = 0.25
+    DEFAULT_SLOW_CALLBACK_MS = 100
+    RECENT_SLOW_CALLBACKS = 20
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = None, slow_callback: float = None):
+        self.loop = loop
+        self.interval = float(environ.get('LOOP_MONITOR_INTERVAL', self.DEFAULT_INTERVAL)) if interval is None else interval
+        self.slow_callback = float(environ.get('SLOW_CALLBACK_MS', self.DEFAULT_SLOW_CALLBACK_MS)) / 1000 \
+            if slow_callback is None else slow_callback
+        self._lock = threading.Lock()
+        self._lag = Histogram()
+        self._by_intent: Dict[str, Histogram] = {}
+        self._slow: deque = deque(maxlen=self.RECENT_SLOW_CALLBACKS)
+        self._metrics = {'callbacks': 0, 'slowCallbacks': 0}
+        # (callback, started, intent) of the callback in progress, and the stack sampled for it.
+        self._running: Optional[tuple] = None
+        self._sampled: Optional[tuple] = None
+        self._thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts monitoring. Must be called on the monitored loop's thread."""
+        self._thread_id = threading.get_ident()
+        if isinstance(self.loop, MonitoredEventLoop):
+            self.loop.monitor = self
+        else:
+            logging.warning("LoopMonitor: Not a MonitoredEventLoop; only loop lag is measured.")
+        self._heartbeat = self.loop.create_task(self._beat())
+        threading.Thread(target=self._watch, name='loop-monitor', daemon=True).start()
+        logging.info(f"LoopMonitor: Watching the IB loop (slow callbacks > {self.slow_callback * 1000:.0f}ms).")
+
+    def stop(self):
+        if getattr(self.loop, 'monitor', None) is self:
+            self.loop.monitor = None
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Safe to call from any thread, including while the monitored loop is blocked."""
+        with self._lock:
+            stats = {
+                'slowCallbackMs': self.slow_callback * 1000,
+                **self._metrics,
+                'lag': self._lag.snapshot(),
+                'blockedByIntent': {intent: h.snapshot() for intent, h in self._by_intent.items()},
+                'recentSlowCallbacks': list(self._slow),
+                'blocking': None,
+            }
+        running, sampled = self._running, self._sampled
+        if running is not None:
+            elapsed = time.perf_counter() - running[1]
+            if elapsed >= self.slow_callback:
+                stats['blocking'] = {
+                    'callback': self._describe(running[0]),
+                    'intent': running[2],
+                    'runningMs': round(elapsed * 1000, 3),
+                    'stack': sampled[1] if sampled and sampled[0] is running else None,
+                }
+        return stats
+
+    def _run(self, callback, args):
+        # Runs inside the callback's context, so the intent is simply the context variable's value.
+        running = self._running = (callback, time.perf_counter(), current_intent.get())
+        try:
+            return callback(*args)
+        finally:
+            elapsed = time.perf_counter() - running[1]
+            self._running = None
+            self._record(running, elapsed)
+
+    def _record(self, running: tuple, elapsed: float):
+        callback, _, intent = running
+        with self._lock:
+            self._metrics['callbacks'] += 1
+            self._by_intent.setdefault(intent or 'other', Histogram()).observe(elapsed)
+            if elapsed < self.slow_callback:
+                return
+            self._metrics['slowCallbacks'] += 1
+            sampled = self._sampled
+            stack = sampled[1] if sampled and sampled[0] is running else None
+            entry = {
+                'at': datetime.now(timezone.utc).isoformat(),
+                'callback': self._describe(callback),
+                'intent': intent,
+                'durationMs': round(elapsed * 1000, 3),
+                'stack': stack,
+            }
+            self._slow.append(entry)
+        logging.warning(f"LoopMonitor: {entry['callback']} ({intent or 'no intent'}) blocked the IB loop for "
+                        f"{entry['durationMs']:.0f}ms" + (f":\n{''.join(stack)}" if stack else "."))
+
+    def _watch(self):
+        # Sampling twice per threshold catches every callback that runs for 1.5x the threshold or longer.
+        while not self._stopped.wait(self.slow_callback / 2):
+            running, sampled = self._running, self._sampled
+            if running is None or (sampled is not None and sampled[0] is running):
+                continue
+            if time.perf_counter() - running[1] < self.slow_callback:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None and self._running is running:
+                self._sampled = (running, traceback.format_stack(frame))
+
+    async def _beat(self):
+        while True:
+            started = self.loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - started - self.interval)
+            with self._lock:
+                self._lag.observe(lag)
+
+    @staticmethod
+    def _describe(callback) -> str:
+        owner = getattr(callback, '__self__', None)
+        if isinstance(owner, asyncio.Task):
+            coro = owner.get_coro()
+            return f"Task {owner.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        return repr(callback)[:200]
@@ -0,0 +1,328 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+import math
+from os import environ
+import time
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+import numpy as np
+import pandas as pd
+from ib_insync import util
+
+from lib.gcp import logger as logging
+
+_BAR_SIZE_SECONDS = {
+    'sec': 1, 'secs': 1,
+    'min': 60, 'mins': 60,
+    'hour': 3600, 'hours': 3600,
+    'day': 86400, 'days': 86400,
+    'week': 7 * 86400, 'weeks': 7 * 86400,
+    'month': 30 * 86400, 'months': 30 * 86400,
+}
+
+
+def bar_size_seconds(bar_size: str) -> int:
+    """'30 mins' -> 1800, '1 day' -> 86400."""
+    count, unit = bar_size.split()
+    return int(count) * _BAR_SIZE_SECONDS[unit]
+
+
+class SeriesKey(NamedTuple):
+    con_id: int
+    bar_size: str
+    what_to_show: str
+    use_rth: bool
+
+
+class _Series:
+    def __init__(self, bars: pd.DataFrame):
+        self.bars = bars
+        # Bar count returned by the full pull for each requested duration.
+        self.windows: Dict[str, int] = {}
+        self.fetched_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.bars.memory_usage(deep=True).sum())
+
+    def merge(self, recent: pd.DataFrame):
+        """Appends newer bars; a re-fetched bar replaces the cached one, which may have been incomplete."""
+        merged = pd.concat([self.bars, recent], ignore_index=True)
+        merged = merged.drop_duplicates(subset='date', keep='last').sort_values('date', ignore_index=True)
+        # Keep no more history than the largest window anyone asked for.
+        self.bars = merged.iloc[-max(self.windows.values()):].reset_index(drop=True)
+        self.fetched_at = time.monotonic()
+
+    def adjusted(self, recent: pd.DataFrame, tolerance: float) -> bool:
+        """
+        True if a re-fetched bar that was already complete when cached (any but the
+        last) closes differently now, i.e. a split or dividend adjusted the history.
+        """
+        overlap = self.bars.iloc[:-1][['date', 'close']].merge(recent[['date', 'close']], on='date',
+                                                               suffixes=('', '_recent'))
+        return not np.allclose(overlap['close'], overlap['close_recent'], rtol=tolerance, atol=0)
+
+
+class BarCache:
+    """
+    Process-wide cache of historical bars, one series per
+    (conId, barSize, whatToShow, useRTH).
+
+    The first request for a series and duration pulls the full history. Later
+    requests only fetch the bars since the last complete cached one and return
+    as many bars as the full pull did, so callers see a rolling window. Within
+    `ttl` seconds of a fetch the cached bars are returned without contacting
+    the gateway. Series are evicted least recently used first once the cache
+    exceeds `max_bytes`.
+
+    The gateway adjusts history for splits and dividends. When a re-fetched
+    bar that was complete when cached closes differently, the cached history
+    is stale, so the series is pulled again in full.
+
+    With a BarStore, series are also written to disk after every fetch and
+    loaded from it on first use, so a restarted container resumes with an
+    incremental request instead of a full history pull.
+    """
+
+    DEFAULT_TTL = 60
+    DEFAULT_MAX_MB = 64
+    # Relative close difference treated as adjusted history.
+    ADJUSTMENT_TOLERANCE = 1e-6
+
+    def __init__(self, ibgw, ttl: float = None, max_bytes: int = None, store=None):
+        self._ibgw = ibgw
+        self._bar_store = store
+        self.ttl = float(environ.get('BAR_CACHE_TTL', self.DEFAULT_TTL)) if ttl is None else ttl
+        self.max_bytes = max_bytes or int(environ.get('BAR_CACHE_MB', self.DEFAULT_MAX_MB)) * 1024 * 1024
+        self._series: "OrderedDict[SeriesKey, _Series]" = OrderedDict()
+        self._locks: Dict[SeriesKey, asyncio.Lock] = {}
+        self._metrics = {'hits': 0, 'incremental': 0, 'full': 0, 'refreshed': 0, 'evicted': 0, 'loaded': 0}
+
+    async def get_bars(self, contract, duration: str, bar_size: str, what_to_show: str = 'TRADES',
+                       use_rth: bool = True) -> pd.DataFrame:
+        """Returns bars as a DataFrame (as util.df would), empty if none are available."""
+        key = SeriesKey(contract.conId, bar_size, what_to_show, use_rth)
+        # Concurrent callers of the same series share one gateway request.
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            series = await self._update(contract, key, self._series.get(key) or await self._load(contract, key),
+                                        duration)
+            # The window is missing if the gateway returned no bars for it, e.g. on a timeout.
+            if series is None or duration not in series.windows:
+                return pd.DataFrame()
+            return series.bars.iloc[-series.windows[duration]:].reset_index(drop=True)
+
+    async def get_bars_since(self, contract, since, bar_size: str, what_to_show: str = 'TRADES',
+                             use_rth: bool = True) -> pd.DataFrame:
+        """
+        Bars from the one dated `since` onwards, for callers that keep their own state up
+        to a bar. Served from the cached series if it reaches back that far, otherwise
+        fetched directly; either way the ad-hoc duration is not kept as a window.
+        """
+        key = SeriesKey(contract.conId, bar_size, what_to_show, use_rth)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            series = self._series.get(key) or await self._load(contract, key)
+            if series is not None and series.bars['date'].iloc[0] <= since:
+                bars = (await self._update(contract, key, series)).bars
+                return bars[bars['date'] >= since].reset_index(drop=True)
+        return await self._fetch(contract, self._gap_duration(since, bar_size), key)
+
+    async def invalidate(self, contract, bar_size: str, what_to_show: str = 'TRADES', use_rth: bool = True):
+        """Forgets the cached and stored bars of a series, so the next request pulls it in full."""
+        key = SeriesKey(contract.conId, bar_size, what_to_show, use_rth)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            self._series.pop(key, None)
+            if self._bar_store is not None:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._bar_store.delete, contract.symbol, key)
+                except Exception as e:
+                    logging.warning(f"BarCache: Could not delete stored bars for {key}: {e}")
+
+    async def _update(self, contract, key: SeriesKey, series: Optional[_Series],
+                      duration: str = None) -> Optional[_Series]:
+        """
+        Brings `series` up to date for `duration` (any window if None); None if there are no bars.
+        An empty response leaves the series as it is, so the next request tries again.
+        """
+        fetched = True
+        if series is None or (duration is not None and duration not in series.windows):
+            bars = await self._fetch(contract, duration, key)
+            if bars.empty:
+                return series
+            if series is None:
+                series = _Series(bars)
+                series.windows[duration] = len(bars)
+            elif series.adjusted(bars, self.ADJUSTMENT_TOLERANCE):
+                logging.info(f"BarCache: History of {key} was adjusted; dropping the cached bars.")
+                # Longer windows are pulled again when they are next requested.
+                windows = {d: n for d, n in series.windows.items() if n <= len(bars)}
+                series = _Series(bars)
+                series.windows = {**windows, duration: len(bars)}
+                self._metrics['refreshed'] += 1
+            else:
+                series.windows[duration] = len(bars)
+                series.merge(bars)
+            self._metrics['full'] += 1
+        elif time.monotonic() - series.fetched_at < self.ttl:
+            fetched = False
+            self._metrics['hits'] += 1
+        else:
+            # The overlap includes the last complete bar, whose close reveals adjusted history.
+            overlap = series.bars['date'].iloc[-min(2, len(series.bars))]
+            recent = await self._fetch(contract, self._gap_duration(overlap, key.bar_size), key)
+            if recent.empty:
+                fetched = False
+            elif series.adjusted(recent, self.ADJUSTMENT_TOLERANCE):
+                logging.info(f"BarCache: History of {key} was adjusted; pulling it again.")
+                windows = series.windows
+                longest = max(windows, key=windows.get)
+                bars = await self._fetch(contract, longest, key)
+                if not bars.empty:
+                    series = _Series(bars)
+                    series.windows = {**windows, longest: len(bars)}
+                self._metrics['refreshed'] += 1
+            else:
+                series.merge(recent)
+                self._metrics['incremental'] += 1
+        if fetched:
+            await self._save(contract, key, series)
+        self._remember(key, series)
+        return series
+
+    def stats(self) -> Dict[str, int]:
+        return {'series': len(self._series), 'bytes': sum(s.nbytes for s in self._series.values()), **self._metrics}
+
+    async def _load(self, contract, key: SeriesKey) -> Optional[_Series]:
+        if self._bar_store is None:
+            return None
+        try:
+            stored = await asyncio.get_running_loop().run_in_executor(
+                None, self._bar_store.read, contract.symbol, key)
+        except Exception as e:
+            logging.warning(f"BarCache: Could not read stored bars for {key}: {e}")
+            return None
+        if stored is None:
+            return None
+        bars, windows, age = stored
+        series = _Series(bars)
+        series.windows = windows
+        series.fetched_at = time.monotonic() - age
+        self._metrics['loaded'] += 1
+        return series
+
+    async def _save(self, contract, key: SeriesKey, series: _Series):
+        if self._bar_store is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._bar_store.write, contract.symbol, key, series.bars, dict(series.windows))
+        except Exception as e:
+            logging.warning(f"BarCache: Could not store bars for {key}: {e}")
+
+    async def _fetch(self, contract, duration: str, key: SeriesKey) -> pd.DataFrame:
+        bars = await self._ibgw.reqHistoricalDataAsync(
+            contract,
+            endDateTime='',
+            durationStr=duration,
+            barSizeSetting=key.bar_size,
+            whatToShow=key.what_to_show,
+            useRTH=key.use_rth,
+            timeout=30,
+        )
+        return util.df(bars) if bars else pd.DataFrame()
+
+    @staticmethod
+    def _gap_duration(last, bar_size: str) -> str:
+        """Smallest IB duration string covering the last cached bar and everything after it."""
+        step = bar_size_seconds(bar_size)
+        if isinstance(last, datetime):
+            seconds = (datetime.now(last.tzinfo) - last).total_seconds() + step
+        else:
+            seconds = ((datetime.now(timezone.utc).date() - last).days + 1) * 86400
+        if step < 86400 and seconds <= 86400:
+            return f'{max(int(seconds), 60)} S'
+        return f'{math.ceil(seconds / 86400)} D'
+
+    def _remember(self, key: SeriesKey, series: _Series):
+        self._series[key] = series
+        self._series.move_to_end(key)
+        total = sum(s.nbytes for s in self._series.values())
+        while total > self.max_bytes and len(self._series) > 1:
+            evicted_key, evicted = self._series.popitem(last=False)
+            total -= evicted.nbytes
+            self._metrics['evicted'] += 1
+            logging.info(f"BarCache: Evicted {evicted_key} to stay under {self.max_bytes} bytes.")
+
+
+class TickerQuote(NamedTuple):
+    ticker: Any
+    price: Optional[float]
+    # Seconds since the last tick; None before the first one arrives.
+    age: Optional[float]
+    stale: bool
+
+
+class TickerSubscriptions:
+    """
+    Streaming market data for the working instrument universe.
+
+    Each contract gets one `reqMktData` stream, kept open for as long as at
+    least one owner (e.g. a strategy id) holds it. Subscribing again under the
+    same owner is a no-op, so an intent can declare its universe on every run
+    and pay for the subscription only once. `quote` and `price` read the live
+    Ticker from memory and report how old its last tick is.
+    """
+
+    DEFAULT_STALE_AFTER = 10
+
+    def __init__(self, ibgw, stale_after: float = None):
+        self._ibgw = ibgw
+        self.stale_after = float(environ.get('TICKER_STALE_SECONDS', self.DEFAULT_STALE_AFTER)) \
+            if stale_after is None else stale_after
+        self._tickers: Dict[int, Any] = {}
+        self._contracts: Dict[int, Any] = {}
+        self._owners: Dict[int, Set[str]] = {}
+
+    def subscribe(self, owner: str, *contracts):
+        for contract in contracts:
+            owners = self._owners.setdefault(contract.conId, set())
+            if not owners:
+                self._contracts[contract.conId] = contract
+                self._tickers[contract.conId] = self._ibgw.reqMktData(contract, '', False, False)
+                logging.info(f"TickerSubscriptions: Streaming {contract.symbol} ({contract.conId}).")
+            owners.add(owner)
+
+    def release(self, owner: str, *contracts):
+        """Drops the owner's hold on the given contracts (all of them if none are given)."""
+        con_ids = [c.conId for c in contracts] if contracts else [k for k, v in self._owners.items() if owner in v]
+        for con_id in con_ids:
+            owners = self._owners.get(con_id, set())
+            owners.discard(owner)
+            if not owners and con_id in self._tickers:
+                self._ibgw.cancelMktData(self._contracts.pop(con_id))
+                del self._tickers[con_id]
+                del self._owners[con_id]
+
+    def resubscribe(self):
+        """Re-opens every stream; the gateway drops them when the connection is lost."""
+        for con_id, contract in self._contracts.items():
+            self._tickers[con_id] = self._ibgw.reqMktData(contract, '', False, False)
+
+    def quote(self, con_id: int) -> Optional[TickerQuote]:
+        ticker = self._tickers.get(con_id)
+        if ticker is None:
+            return None
+        age = (datetime.now(timezone.utc) - ticker.time).total_seconds() if ticker.time else None
+        price = ticker.marketPrice()
+        price = None if price is None or math.isnan(price) else price
+        return TickerQuote(ticker, price, age, age is None or age > self.stale_after or price is None)
+
+    def price(self, con_id: int) -> Optional[float]:
+        """The live price, or None if there is no fresh one."""
+        quote = self.quote(con_id)
+        return quote.price if quote is not None and not quote.stale else None
+
+    def stats(self) -> Dict[str, int]:
+        quotes = [self.quote(con_id) for con_id in self._tickers]
+        return {'streams': len(quotes), 'stale': sum(1 for q in quotes if q.stale)}
@@ -0,0 +1,159 @@
+from os import environ
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+import numpy as np
+
+
+class NetOrder(NamedTuple):
+    key: str
+    desired: int
+    current: int
+    inflight: int
+    # Net delta before rounding, and what is left of it after lot-size and minimum-notional rounding.
+    raw_delta: int
+    delta: int
+    # Quantity the contributing strategies exchange between themselves instead of trading it.
+    crossed: int
+    # Why `delta` differs from `raw_delta`: 'lot' or 'notional'; None if it does not.
+    adjustment: Optional[str]
+
+
+class VirtualFill(NamedTuple):
+    strategy_id: str
+    key: str
+    # Signed: positive for the buying side of the cross, negative for the selling side.
+    quantity: int
+    price: Optional[float]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'strategy_id': self.strategy_id, 'conId': self.key, 'quantity': self.quantity, 'price': self.price}
+
+
+class NettingResult(NamedTuple):
+    # Contracts whose rounded delta is non-zero, in key order.
+    orders: List[NetOrder]
+    # Contracts with a net delta that rounding reduced to zero.
+    suppressed: List[NetOrder]
+    virtual_fills: List[VirtualFill]
+    # Total size of the per-strategy deltas, i.e. what the strategies would trade on their own.
+    gross_quantity: int
+    crossed_quantity: int
+
+
+class NettingEngine:
+    """
+    Nets the targets of all strategies into one order per contract.
+
+    Targets and strategy holdings are laid out as strategies × contracts
+    matrices. The account-level delta per contract is the summed target minus
+    the account's holdings and in-flight orders. Per-strategy
+    deltas (target minus the strategy's own holdings) additionally show how
+    much of the strategies' trading cancels out: where some strategies buy
+    what others sell, the overlap is crossed internally and attributed to them
+    as virtual fills, pro rata on each side, instead of reaching the market as
+    two opposing orders. Only the residual is sent.
+
+    The residual is rounded towards zero to the contract's lot size and
+    dropped if it is worth less than `min_notional`. Deltas that flatten a
+    contract (target 0) are never rounded, so odd lots can still be closed.
+    """
+
+    DEFAULT_LOT_SIZE = 1
+    DEFAULT_MIN_NOTIONAL = 0.0
+
+    def __init__(self, lot_sizes: Mapping[str, int] = None, min_notional: float = None):
+        # Lot sizes by contract key (conId) or symbol.
+        self.lot_sizes = dict(lot_sizes or {})
+        self.min_notional = float(environ.get('MIN_ORDER_NOTIONAL', self.DEFAULT_MIN_NOTIONAL)) \
+            if min_notional is None else min_notional
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> 'NettingEngine':
+        return cls(config.get('lotSizes'), config.get('minOrderNotional'))
+
+    def lot_size(self, key: str, symbol: Optional[str] = None) -> int:
+        lot = self.lot_sizes.get(key) or (self.lot_sizes.get(symbol) if symbol else None)
+        return max(1, int(lot or self.DEFAULT_LOT_SIZE))
+
+    def net(
+        self,
+        keys: Iterable[str],
+        targets: Mapping[str, Mapping[str, int]],
+        strategy_holdings: Mapping[str, Mapping[str, float]],
+        holdings: Mapping[str, int],
+        inflight: Mapping[str, int],
+        prices: Mapping[str, float] = None,
+        symbols: Mapping[str, str] = None,
+    ) -> NettingResult:
+        """
+        `targets` maps strategy id -> contract key -> target quantity, `strategy_holdings`
+        strategy id -> contract key -> quantity held for that strategy. `prices` are per unit
+        of quantity, i.e. including the contract multiplier; contracts without a price are
+        not subject to the minimum notional.
+        """
+        keys = list(keys)
+        strategies = list(targets)
+        prices = prices or {}
+        symbols = symbols or {}
+        shape = (len(strategies), len(keys))
+        target = np.zeros(shape, dtype=np.int64)
+        published = np.zeros(shape, dtype=bool)
+        held = np.zeros(shape, dtype=np.int64)
+        column = {key: j for j, key in enumerate(keys)}
+        for i, strategy_id in enumerate(strategies):
+            for key, quantity in targets[strategy_id].items():
+                target[i, column[key]] += int(quantity)
+                published[i, column[key]] = True
+            for key, quantity in (strategy_holdings.get(strategy_id) or {}).items():
+                if key in column:
+                    held[i, column[key]] = int(round(float(quantity)))
+
+        desired = target.sum(axis=0)
+        current = np.array([int(holdings.get(key, 0)) for key in keys], dtype=np.int64)
+        pending = np.array([int(inflight.get(key, 0)) for key in keys], dtype=np.int64)
+        raw = desired - current - pending
+
+        # A strategy only takes part in a contract it publishes a target for, and strategy holdings
+        # are only kept for conId-keyed contracts.
+        crossable = published & np.array([key.isdigit() for key in keys], dtype=bool)[None, :]
+        per_strategy = np.where(crossable, target - held, 0)
+        buys = np.clip(per_strategy, 0, None)
+        sells = np.clip(-per_strategy, 0, None)
+        crossed = np.minimum(buys.sum(axis=0), sells.sum(axis=0))
+        fills = _pro_rata(buys, crossed) - _pro_rata(sells, crossed)
+
+        lots = np.array([self.lot_size(key, symbols.get(key)) for key in keys], dtype=np.int64)
+        price = np.array([float(prices.get(key) or np.nan) for key in keys])
+        flatten = desired == 0
+        rounded = np.where(flatten, raw, np.sign(raw) * (np.abs(raw) // lots * lots))
+        notional = np.where(np.isnan(price), np.inf, np.abs(rounded) * price)
+        small = ~flatten & (notional < self.min_notional)
+        delta = np.where(small, 0, rounded)
+        adjustment = np.where(small & (rounded != 0), 'notional', np.where(rounded != raw, 'lot', ''))
+
+        orders: List[NetOrder] = []
+        suppressed: List[NetOrder] = []
+        for j in np.flatnonzero(raw):
+            order = NetOrder(keys[j], int(desired[j]), int(current[j]), int(pending[j]), int(raw[j]), int(delta[j]),
+                             int(crossed[j]), adjustment[j] or None)
+            (orders if delta[j] else suppressed).append(order)
+        virtual_fills = [
+            VirtualFill(strategies[i], keys[j], int(fills[i, j]),
+                        None if np.isnan(price[j]) else float(price[j]))
+            for i, j in zip(*np.nonzero(fills))
+        ]
+        return NettingResult(orders, suppressed, virtual_fills, int(np.abs(per_strategy).sum()), int(crossed.sum()))
+
+
+def _pro_rata(weights: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """
+    Splits each column total over the rows in proportion to `weights` (non-negative integers
+    whose column sums are at least the total), in integers, by largest remainder.
+    """
+    column_sums = weights.sum(axis=0)
+    exact = weights * np.divide(totals, column_sums, out=np.zeros(totals.shape), where=column_sums > 0)[None, :]
+    shares = np.floor(exact).astype(np.int64)
+    remainders = totals - shares.sum(axis=0)
+    # Rank of every row's fractional part within its column, largest first.
+    ranks = np.argsort(np.argsort(shares - exact, axis=0, kind='stable'), axis=0, kind='stable')
+    return shares + (ranks < remainders[None, :])
@@ -0,0 +1,246 @@
+import asyncio
+from collections import OrderedDict
+import time
+from os import environ
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from lib.gcp import logger as logging
+from lib.pacing import ORDER_LANE, TokenBucket
+
+# Statuses of an order the gateway has not acknowledged yet.
+PENDING_STATUSES = {'', 'PendingSubmit', 'ApiPending'}
+REJECTED_STATUSES = {'Cancelled', 'ApiCancelled', 'Inactive'}
+DONE_STATUSES = REJECTED_STATUSES | {'Filled'}
+# Errors that end an order whatever its last status: rejected, cancelled, or not found when cancelling.
+ORDER_ENDING_ERRORS = {201, 202, 10147, 10148}
+
+
+class OrderAck(NamedTuple):
+    contract: Any
+    order: Any
+    trade: Any
+    # 'acknowledged', 'rejected', 'timeout' (no answer within the ack timeout) or 'failed' (not sent).
+    result: str
+    error: Optional[str]
+    latency: float
+
+    @property
+    def acknowledged(self) -> bool:
+        return self.result == 'acknowledged'
+
+    def to_dict(self) -> Dict[str, Any]:
+        order = self.trade.order if self.trade is not None else self.order
+        return {
+            'orderId': getattr(order, 'orderId', None),
+            'symbol': getattr(self.contract, 'symbol', None),
+            'action': order.action,
+            'quantity': order.totalQuantity,
+            'status': self.trade.orderStatus.status if self.trade is not None else None,
+            'ack': self.result,
+            'error': self.error,
+            'ackMs': round(self.latency * 1000, 1),
+        }
+
+
+class OrderTracker:
+    """
+    Follows orders through the gateway's orderStatusEvent, execDetailsEvent
+    and errorEvent, so callers can await a state transition (acknowledged,
+    filled, cancelled) instead of sleeping and then polling openTrades().
+
+    Each wait returns the order status at the moment it resolves. A wait
+    also resolves when the order ends some other way, e.g. a fill that wins
+    the race against a cancel. If `timeout` expires first, the wait returns
+    the status the order has at that point.
+
+    The tracker only subscribes to the gateway's events in `subscribe()` (or
+    on its first wait), so it can be created before the gateway is set up.
+    """
+
+    MAX_REMEMBERED_ERRORS = 1000
+
+    def __init__(self, ibgw):
+        self._ibgw = ibgw
+        self._subscribed = False
+        self._waiters: Dict[int, List[Tuple[Any, Callable[[Any], bool], asyncio.Future]]] = {}
+        # orderId -> [(errorCode, message)], for the most recent orders with errors.
+        self._errors: OrderedDict = OrderedDict()
+        self._metrics = {'waits': 0, 'timeouts': 0, 'errors': 0}
+
+    async def submitted(self, trade, timeout: float = None) -> str:
+        """Resolves once the gateway has acknowledged (or rejected) the order."""
+        return await self._wait(trade, lambda t: t.orderStatus.status not in PENDING_STATUSES, timeout)
+
+    async def filled(self, trade, timeout: float = None) -> str:
+        """Resolves once the whole quantity has been executed, or the order has ended without it."""
+        return await self._wait(trade, lambda t: t.orderStatus.status in DONE_STATUSES
+                                or (t.filled() > 0 and t.remaining() == 0), timeout)
+
+    async def cancelled(self, trade, timeout: float = None) -> str:
+        """Resolves once the order is no longer working, whether cancelled, rejected or filled."""
+        return await self._wait(trade, lambda t: t.orderStatus.status in DONE_STATUSES, timeout)
+
+    async def all(self, transition: str, trades: Iterable[Any], timeout: float = None) -> List[str]:
+        """Waits for `transition` ('submitted', 'filled' or 'cancelled') on every trade concurrently."""
+        wait = getattr(self, transition)
+        return list(await asyncio.gather(*(wait(trade, timeout) for trade in trades)))
+
+    def ended(self, trade) -> bool:
+        return any(code in ORDER_ENDING_ERRORS for code, _ in self._errors.get(trade.order.orderId, ()))
+
+    def error_message(self, trade) -> Optional[str]:
+        """The most recent gateway error for the order, if any."""
+        errors = self._errors.get(trade.order.orderId)
+        if errors:
+            return f"{errors[-1][0]}: {errors[-1][1]}"
+        for entry in reversed(getattr(trade, 'log', None) or []):
+            if getattr(entry, 'errorCode', 0):
+                return f"{entry.errorCode}: {entry.message}"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'waiting': sum(len(waiters) for waiters in self._waiters.values()), **self._metrics}
+
+    def subscribe(self):
+        if self._subscribed:
+            return
+        self._ibgw.orderStatusEvent += self._on_update
+        self._ibgw.execDetailsEvent += self._on_update
+        self._ibgw.errorEvent += self._on_error
+        self._subscribed = True
+
+    async def _wait(self, trade, reached: Callable[[Any], bool], timeout: Optional[float]) -> str:
+        self.subscribe()
+        self._metrics['waits'] += 1
+        if reached(trade) or self.ended(trade):
+            return trade.orderStatus.status
+        order_id = trade.order.orderId
+        entry = (trade, reached, asyncio.get_running_loop().create_future())
+        self._waiters.setdefault(order_id, []).append(entry)
+        try:
+            await asyncio.wait_for(entry[2], timeout)
+        except asyncio.TimeoutError:
+            self._metrics['timeouts'] += 1
+        finally:
+            waiters = self._waiters.get(order_id, [])
+            if entry in waiters:
+                waiters.remove(entry)
+            if not waiters:
+                self._waiters.pop(order_id, None)
+        return trade.orderStatus.status
+
+    def _on_update(self, trade, *_):
+        self._resolve(trade.order.orderId)
+
+    def _on_error(self, req_id: int, error_code: int, message: str, *_):
+        if req_id <= 0:
+            return
+        self._metrics['errors'] += 1
+        self._errors.setdefault(req_id, []).append((error_code, message))
+        self._errors.move_to_end(req_id)
+        while len(self._errors) > self.MAX_REMEMBERED_ERRORS:
+            self._errors.popitem(last=False)
+        self._resolve(req_id)
+
+    def _resolve(self, order_id: int):
+        for trade, reached, future in self._waiters.get(order_id, ()):
+            if not future.done() and (reached(trade) or self.ended(trade)):
+                future.set_result(None)
+
+
+class OrderSubmitter:
+    """
+    Places a batch of orders back to back, paced by a token bucket that keeps
+    us under the gateway's message-rate limit (50 messages per second), and
+    then waits for the gateway to acknowledge or reject each order
+    concurrently through the OrderTracker. An order is acknowledged as soon
+    as its status leaves PendingSubmit; `ack_timeout` bounds the wait per
+    order.
+
+    If the gateway has a RequestGovernor (IBGW does), orders take their slots
+    from its order lane, ahead of any queued data requests; otherwise the
+    submitter paces them with a bucket of its own. Cancellations are paced
+    the same way.
+    """
+
+    DEFAULT_RATE = 45
+    DEFAULT_ACK_TIMEOUT = 5
+
+    def __init__(self, ibgw, rate: float = None, ack_timeout: float = None, tracker: OrderTracker = None):
+        self._ibgw = ibgw
+        self.tracker = tracker or OrderTracker(ibgw)
+        self.rate = rate or float(environ.get('ORDER_RATE_LIMIT', self.DEFAULT_RATE))
+        self.ack_timeout = float(environ.get('ORDER_ACK_TIMEOUT', self.DEFAULT_ACK_TIMEOUT)) \
+            if ack_timeout is None else ack_timeout
+        self._governor = getattr(ibgw, 'governor', None)
+        self._bucket = TokenBucket(self.rate)
+        self._metrics = {'submitted': 0, 'acknowledged': 0, 'rejected': 0, 'timeout': 0, 'failed': 0,
+                         'cancelled': 0, 'throttledMs': 0.0}
+
+    async def submit(self, orders: Iterable[Tuple[Any, Any]], ack_timeout: float = None,
+                     on_ack: Callable[[OrderAck], None] = None) -> List[OrderAck]:
+        """
+        Places each (contract, order) pair and returns their OrderAcks in the
+        same order. `on_ack`, if given, is called as each order is settled.
+        """
+        timeout = self.ack_timeout if ack_timeout is None else ack_timeout
+        pending = []
+        for contract, order in orders:
+            await self._pace()
+            pending.append(asyncio.ensure_future(self._place(contract, order, timeout, on_ack)))
+        return list(await asyncio.gather(*pending))
+
+    async def cancel(self, trades: Iterable[Any]):
+        """
+        Requests the cancellation of each trade's order, paced like order placement.
+        Await the confirmations through the tracker's `cancelled` transition.
+        """
+        for trade in trades:
+            await self._pace()
+            try:
+                self._ibgw.cancelOrder(trade.order)
+                self._metrics['cancelled'] += 1
+            except Exception as e:
+                logging.error(f"OrderSubmitter: Could not cancel order {trade.order.orderId}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'rate': self.rate, 'ackTimeout': self.ack_timeout,
+                **self._metrics, 'throttledMs': round(self._metrics['throttledMs'], 1)}
+
+    async def _pace(self):
+        if self._governor is not None:
+            waited = await self._governor.acquire(ORDER_LANE)
+        else:
+            waited = await self._bucket.acquire()
+        self._metrics['throttledMs'] += waited * 1000
+
+    async def _place(self, contract, order, timeout: float, on_ack) -> OrderAck:
+        placed_at = time.monotonic()
+        self._metrics['submitted'] += 1
+        try:
+            trade = self._ibgw.placeOrder(contract, order)
+        except Exception as e:
+            logging.error(f"OrderSubmitter: Could not place {order.action} {order.totalQuantity} "
+                          f"{getattr(contract, 'symbol', contract)}: {e}")
+            trade, error = None, str(e)
+        else:
+            error = None if trade else 'placeOrder returned no trade'
+        ack = await self._await_ack(contract, order, trade, error, placed_at, timeout)
+        self._metrics[ack.result] += 1
+        if ack.result != 'acknowledged':
+            logging.warning(f"OrderSubmitter: {order.action} {order.totalQuantity} "
+                            f"{getattr(contract, 'symbol', contract)} {ack.result}: {ack.error}")
+        if on_ack is not None:
+            on_ack(ack)
+        return ack
+
+    async def _await_ack(self, contract, order, trade, error, placed_at: float, timeout: float) -> OrderAck:
+        if not trade:
+            return OrderAck(contract, order, None, 'failed', error, time.monotonic() - placed_at)
+        status = await self.tracker.submitted(trade, timeout)
+        latency = time.monotonic() - placed_at
+        if status in REJECTED_STATUSES or (self.tracker.ended(trade) and status != 'Filled'):
+            return OrderAck(contract, order, trade, 'rejected', self.tracker.error_message(trade) or status, latency)
+        if status in PENDING_STATUSES:
+            return OrderAck(contract, order, trade, 'timeout', f"No acknowledgement within {timeout}s", latency)
+        return OrderAck(contract, order, trade, 'acknowledged', None, latency)
@@ -0,0 +1,231 @@
+import asyncio
+from collections import OrderedDict, deque
+import heapq
+import itertools
+from os import environ
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from lib.gcp import logger as logging
+
+# Priority lanes of the request governor; lower values are served first.
+ORDER_LANE = 0
+ACCOUNT_LANE = 1
+DATA_LANE = 2
+_LANE_NAMES = {ORDER_LANE: 'order', ACCOUNT_LANE: 'account', DATA_LANE: 'data'}
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to
+    `capacity` (one second's worth by default).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def take(self, tokens: float = 1):
+        """Takes `tokens` without waiting; the balance may go negative, which delays later acquisitions."""
+        self._refill()
+        self._tokens -= tokens
+
+    def deficit(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` will be available."""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Waits until `tokens` are available and takes them. Returns the seconds spent waiting."""
+        started = time.monotonic()
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.deficit(tokens))
+        return time.monotonic() - started
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class SlidingWindow:
+    """At most `limit` events in any `period` seconds."""
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self._events: deque = deque()
+
+    def delay(self) -> float:
+        """Seconds until another event fits in the window."""
+        now = time.monotonic()
+        while self._events and now - self._events[0] >= self.period:
+            self._events.popleft()
+        if len(self._events) < self.limit:
+            return 0.0
+        return self._events[0] + self.period - now
+
+    def record(self):
+        self._events.append(time.monotonic())
+
+    def __len__(self):
+        return len(self._events)
+
+
+class RequestGovernor:
+    """
+    Paces everything this process sends to the gateway so that concurrent
+    intents stay within IB's limits instead of each sleeping defensively.
+
+    Messages draw from one token bucket (IB allows 50 per second). Waiting
+    requests are served by lane, so order traffic preempts account and
+    market data requests; within a lane they are served first come, first
+    served. Historical data requests additionally follow IB's pacing rules:
+    no more than `historical_limit` per `historical_period` seconds, at most
+    CONTRACT_LIMIT per contract and data type within CONTRACT_PERIOD seconds,
+    and no identical request within `identical_window` seconds.
+    Identical requests are deduplicated instead: concurrent callers share one
+    in-flight request and later ones within the window get its result.
+    """
+
+    DEFAULT_RATE = 45
+    HISTORICAL_LIMIT = 60
+    HISTORICAL_PERIOD = 600
+    CONTRACT_LIMIT = 5
+    CONTRACT_PERIOD = 2
+    IDENTICAL_WINDOW = 15
+    MAX_REMEMBERED = 256
+
+    def __init__(self, rate: float = None, historical_limit: int = None, historical_period: float = None,
+                 identical_window: float = None):
+        self.rate = rate or float(environ.get('IB_MESSAGE_RATE', self.DEFAULT_RATE))
+        self.identical_window = self.IDENTICAL_WINDOW if identical_window is None else identical_window
+        self._bucket = TokenBucket(self.rate)
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._historical = SlidingWindow(historical_limit or self.HISTORICAL_LIMIT,
+                                         historical_period or self.HISTORICAL_PERIOD)
+        self._per_contract: Dict[Hashable, SlidingWindow] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Request key -> (completed at, result) for the identical-request window.
+        self._recent: OrderedDict = OrderedDict()
+        self._metrics = {'granted': 0, 'waitedMs': 0.0, 'historical': 0, 'historicalDeduplicated': 0,
+                         'historicalDelayedMs': 0.0}
+
+    async def acquire(self, lane: int = DATA_LANE, tokens: float = 1) -> float:
+        """Waits for a send slot in `lane`. Returns the seconds spent waiting."""
+        self._metrics['granted'] += 1
+        # A batch larger than a full bucket waits for a full bucket and borrows the rest.
+        excess = max(0.0, tokens - self._bucket.capacity)
+        tokens -= excess
+        if not self._waiters and self._bucket.try_acquire(tokens):
+            self._bucket.take(excess)
+            return 0.0
+        started = time.monotonic()
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._sequence), tokens, granted))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._serve())
+        await granted
+        self._bucket.take(excess)
+        waited = time.monotonic() - started
+        self._metrics['waitedMs'] += waited * 1000
+        return waited
+
+    def take(self, tokens: float = 1):
+        """Accounts for a message sent without waiting, e.g. from a synchronous API."""
+        self._metrics['granted'] += 1
+        self._bucket.take(tokens)
+
+    async def historical(self, key: Hashable, contract_key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `request()` (a historical data request identified by `key`) within
+        the pacing rules, or returns the result of an identical request.
+        """
+        recent = self._recent.get(key)
+        if recent is not None and time.monotonic() - recent[0] < self.identical_window:
+            self._metrics['historicalDeduplicated'] += 1
+            return recent[1]
+        if key in self._inflight:
+            self._metrics['historicalDeduplicated'] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._paced_historical(contract_key, request)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Waiters re-raise it; retrieving it here keeps the loop from logging it as unhandled.
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if result:
+                self._remember(key, result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {name: 0 for name in _LANE_NAMES.values()}
+        for lane, _, _, granted in self._waiters:
+            if not granted.done():
+                queued[_LANE_NAMES.get(lane, str(lane))] += 1
+        return {
+            'rate': self.rate,
+            'queued': queued,
+            'historicalInWindow': len(self._historical),
+            **self._metrics,
+            'waitedMs': round(self._metrics['waitedMs'], 1),
+            'historicalDelayedMs': round(self._metrics['historicalDelayedMs'], 1),
+        }
+
+    async def _paced_historical(self, contract_key: Hashable, request):
+        window = self._per_contract.get(contract_key)
+        if window is None:
+            window = self._per_contract[contract_key] = SlidingWindow(self.CONTRACT_LIMIT, self.CONTRACT_PERIOD)
+        # Checking and recording happen without an await in between, so concurrent requests cannot overshoot.
+        while (delay := max(self._historical.delay(), window.delay())) > 0:
+            if delay > 1:
+                logging.info(f"RequestGovernor: Historical data pacing; waiting {delay:.1f}s.")
+            self._metrics['historicalDelayedMs'] += delay * 1000
+            await asyncio.sleep(delay)
+        self._historical.record()
+        window.record()
+        self._metrics['historical'] += 1
+        await self.acquire(DATA_LANE)
+        return await request()
+
+    def _remember(self, key: Hashable, result):
+        now = time.monotonic()
+        self._recent[key] = (now, result)
+        self._recent.move_to_end(key)
+        while self._recent and (len(self._recent) > self.MAX_REMEMBERED
+                                or now - next(iter(self._recent.values()))[0] >= self.identical_window):
+            self._recent.popitem(last=False)
+
+    async def _serve(self):
+        while self._waiters:
+            lane, _, tokens, granted = self._waiters[0]
+            if granted.done():
+                # The waiter was cancelled.
+                heapq.heappop(self._waiters)
+                continue
+            if self._bucket.try_acquire(tokens):
+                heapq.heappop(self._waiters)
+                granted.set_result(None)
+                continue
+            await asyncio.sleep(self._bucket.deficit(tokens))
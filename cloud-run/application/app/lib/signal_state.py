@@ -0,0 +1,123 @@
+from datetime import date, datetime, timezone
+import math
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from lib import indicators
+from lib.gcp import logger as logging
+
+
+class MACDReading(NamedTuple):
+    # MACD and signal line for the most recent bars (at least the last two).
+    macd: pd.Series
+    signal: pd.Series
+    last_close: float
+    incremental: bool
+
+
+def _bar_key(value) -> str:
+    return value.isoformat()
+
+
+def _parse_bar_key(text: str):
+    return datetime.fromisoformat(text) if 'T' in text else date.fromisoformat(text)
+
+
+class IncrementalMACD:
+    """
+    MACD for one strategy that survives between runs.
+
+    After each run the EMA recursion state (fast, slow and signal EMAs) at the
+    last complete bar is stored at `strategies/{id}/indicators/macd-{conId}`.
+    The next run fetches only the bars since then and advances the state by
+    them. The newest bar may still be forming, so it is evaluated but never
+    folded into the stored state.
+
+    The history is pulled and recomputed in full when there is no usable state,
+    when the fetched bars no longer include the stored bar (a gap), or when that
+    bar's close has changed (a split or other adjustment rewrote history).
+    """
+
+    # Relative close difference treated as rewritten history.
+    ADJUSTMENT_TOLERANCE = 1e-6
+
+    def __init__(self, env, strategy_id: str, bar_size: str = '1 day', fast: int = 12, slow: int = 26,
+                 signal: int = 9):
+        self._env = env
+        self._strategy_id = strategy_id
+        self.bar_size = bar_size
+        self.params = [fast, slow, signal]
+
+    def path(self, con_id: int) -> str:
+        return f'strategies/{self._strategy_id}/indicators/macd-{con_id}'
+
+    async def update(self, contract, full_duration: str = '200 D') -> Optional[MACDReading]:
+        """Advances the stored state with the latest bars; None if there are fewer than two bars."""
+        state = await self._env.store.get(self.path(contract.conId))
+        if self._usable(state):
+            bars = await self._env.get_bars_since(contract, _parse_bar_key(state['last_bar']), self.bar_size)
+            reason = self._check_continuity(state, bars)
+            if reason is None:
+                return await self._advance(contract, state, bars)
+            logging.info(f"IncrementalMACD: Recomputing {contract.symbol} for {self._strategy_id} ({reason}).")
+            # The cached history may predate the adjustment, so the recompute pulls it from the gateway.
+            await self._env.invalidate_bars(contract, self.bar_size)
+
+        bars = await self._env.get_bars(contract, full_duration, self.bar_size)
+        if len(bars) < 2:
+            return None
+        complete = indicators.macd(bars['close'].to_numpy()[:-1], *self.params)
+        forming = indicators.macd(bars['close'].to_numpy()[-1:], *self.params, state=complete.state)
+        await self._save(contract, bars.iloc[-2], complete.state, complete.macd[-2:, 0], complete.signal[-2:, 0])
+        return MACDReading(pd.Series(np.append(complete.macd[:, 0], forming.macd[0, 0])),
+                           pd.Series(np.append(complete.signal[:, 0], forming.signal[0, 0])),
+                           float(bars['close'].iloc[-1]), False)
+
+    def _usable(self, state: Optional[Dict[str, Any]]) -> bool:
+        return bool(state) and state.get('params') == self.params and state.get('bar_size') == self.bar_size
+
+    def _check_continuity(self, state: Dict[str, Any], bars: pd.DataFrame) -> Optional[str]:
+        """Why the stored state cannot be advanced with `bars`, or None if it can."""
+        if bars.empty:
+            return 'no recent bars'
+        keys = bars['date'].map(_bar_key)
+        stored = bars[keys == state['last_bar']]
+        if stored.empty:
+            return f"gap after {state['last_bar']}"
+        close = float(stored['close'].iloc[0])
+        if not math.isclose(close, state['last_close'], rel_tol=self.ADJUSTMENT_TOLERANCE):
+            return f"close on {state['last_bar']} changed from {state['last_close']} to {close}"
+        return None
+
+    async def _advance(self, contract, state: Dict[str, Any], bars: pd.DataFrame) -> MACDReading:
+        stored = indicators.MACDState(*[np.array([state[k]]) for k in ('ema_fast', 'ema_slow', 'ema_signal')])
+        recent_macd, recent_signal = state['recent_macd'], state['recent_signal']
+        new = bars[bars['date'].map(_bar_key) > state['last_bar']]
+        if new.empty:
+            return MACDReading(pd.Series(recent_macd), pd.Series(recent_signal), state['last_close'], True)
+
+        closes = new['close'].to_numpy()
+        complete = indicators.macd(closes[:-1], *self.params, state=stored)
+        forming = indicators.macd(closes[-1:], *self.params, state=complete.state)
+        macd = np.concatenate([recent_macd, complete.macd[:, 0], forming.macd[:, 0]])
+        signal = np.concatenate([recent_signal, complete.signal[:, 0], forming.signal[:, 0]])
+        if len(new) > 1:
+            await self._save(contract, new.iloc[-2], complete.state, macd[-3:-1], signal[-3:-1])
+        return MACDReading(pd.Series(macd), pd.Series(signal), float(closes[-1]), True)
+
+    async def _save(self, contract, bar: pd.Series, state: indicators.MACDState, macd, signal):
+        await self._env.store.write(self.path(contract.conId), {
+            'symbol': contract.symbol,
+            'params': self.params,
+            'bar_size': self.bar_size,
+            'last_bar': _bar_key(bar['date']),
+            'last_close': float(bar['close']),
+            'ema_fast': float(state.fast[0]),
+            'ema_slow': float(state.slow[0]),
+            'ema_signal': float(state.signal[0]),
+            'recent_macd': [float(v) for v in macd],
+            'recent_signal': [float(v) for v in signal],
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+        })
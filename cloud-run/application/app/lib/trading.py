@@ -2,7 +2,6 @@
 
 from ib_insync import Contract, Stock, Forex, Future, Option, Order, TagValue
 from lib.environment import Environment
-import asyncio
 
 class Instrument:
     """
@@ -28,10 +27,22 @@ class Instrument:
 
     async def get_contract_details_async(self):
         if not self.contract.conId:
-            try:
-                await self._env.ibgw.qualifyContractsAsync(self.contract)
-            except Exception as e:
-                self._env.logging.error(f"Error qualifying contract {self.contract.symbol}: {e}")
+            qualified = await self._env.contracts.qualify_one(self.contract)
+            if qualified is None:
+                self._env.logging.error(f"Error qualifying contract {self.contract.symbol}.")
+            else:
+                self.contract = qualified
+
+    @property
+    def tickers(self):
+        """The live Ticker once `get_tickers` has subscribed, otherwise None."""
+        quote = self._env.tickers.quote(self.contract.conId)
+        return quote.ticker if quote is not None else None
+
+    def get_tickers(self, owner: str = 'instrument'):
+        """Opens (or joins) the streaming subscription for this contract."""
+        self._env.tickers.subscribe(owner, self.contract)
+        return self.tickers
 
 class Stock(Instrument):
     IB_CLS = Stock
@@ -90,17 +101,8 @@ class Trade:
             order = OrderClass(action, quantity, **order_params)
             for prop, value in order_properties.items():
                 setattr(order, prop, value)
+            orders.append((trade_info['contract'], order))
 
-            trade = self._env.ibgw.placeOrder(trade_info['contract'], order)
-            
-            if trade:
-                # --- FINAL FIX: Use asyncio.sleep() instead of ib.sleep() ---
-                await asyncio.sleep(0.1) # Yield control to the event loop to process status updates
-                orders.append({
-                    'orderId': trade.order.orderId,
-                    'symbol': trade.contract.symbol,
-                    'action': trade.order.action,
-                    'quantity': trade.order.totalQuantity,
-                    'status': trade.orderStatus.status
-                })
-        return orders
\ No newline at end of file
+        # Orders go out back to back within the gateway's rate limit; each entry reports its ack or reject.
+        acks = await self._env.orders.submit(orders)
+        return [ack.to_dict() for ack in acks if ack.trade is not None]
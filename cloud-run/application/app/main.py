@@ -10,9 +10,9 @@ import json
 import logging
 from os import environ
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
 import threading
 import uuid
-from queue import Queue, Empty, Full
 
 from intents.allocation import Allocation
 from intents.cash_balancer import CashBalancer
@@ -24,15 +24,15 @@ from intents.trade_reconciliation import TradeReconciliation
 from intents.reconcile import Reconcile
 from intents.orchestrator import Orchestrator
 from strategies.test_signal_generator import TestSignalGenerator
+from lib.dispatcher import IntentDispatcher
 from lib.environment import Environment
+from lib.jobs import JobRegistry
+from lib.loop_monitor import LoopMonitor, MonitoredEventLoop
 
-# --- 1. Thread Communication Setup ---
-request_queue = Queue(maxsize=1)
-results = {}
-
-# --- 2. IB Background Thread with Auto-Reconnect ---
-def ib_thread_loop(env, loop, queue, results_dict):
+# --- 1. IB Background Thread with Auto-Reconnect ---
+def ib_thread_loop(env, loop, monitor):
     asyncio.set_event_loop(loop)
+    monitor.start()
 
     async def resilient_main_logic():
         """Wraps the main logic in a perpetual auto-reconnect loop."""
@@ -41,30 +41,14 @@ def ib_thread_loop(env, loop, queue, results_dict):
                 logging.info("IB Thread (Outer Loop): Attempting to connect...")
                 await env.ibgw.connectAsync(host='127.0.0.1', port=4002, clientId=1, timeout=15)
                 logging.info("IB Thread (Outer Loop): Successfully connected.")
+                env.tickers.resubscribe()
 
-                # --- Inner loop for processing requests ---
+                # --- Inner loop: requests are executed by the dispatcher, we only watch the connection ---
                 while True:
-                    try:
-                        request_id, intent_class, body = queue.get(timeout=1.0)
-                    except Empty:
-                        await asyncio.sleep(0.01)
-                        # Check connection status periodically in the inner loop
-                        if not env.ibgw.isConnected():
-                            logging.warning("IB Thread (Inner Loop): Connection lost. Breaking to reconnect.")
-                            break # Break inner loop to trigger reconnection
-                        continue
-
-                    logging.info(f"IB Thread: Received request {request_id} for {intent_class.__name__}")
-                    result_data, error_str = {}, None
-                    try:
-                        intent_instance = intent_class(env=env, **body)
-                        result_data = await intent_instance.run()
-                    except Exception as e:
-                        logging.error(f"IB Thread: Error running intent: {e}", exc_info=True)
-                        error_str = f'{e.__class__.__name__}: {e}'
-                    
-                    results_dict[request_id] = (result_data, error_str)
-                    queue.task_done()
+                    await asyncio.sleep(1.0)
+                    if not env.ibgw.isConnected():
+                        logging.warning("IB Thread (Inner Loop): Connection lost. Breaking to reconnect.")
+                        break # Break inner loop to trigger reconnection
 
             except asyncio.TimeoutError:
                  logging.warning("IB Thread: Connection attempt timed out. Retrying in 15s...")
@@ -79,26 +63,40 @@ def ib_thread_loop(env, loop, queue, results_dict):
 
     loop.run_until_complete(resilient_main_logic())
 
-# --- 3. Lifespan Manager ---
+# --- 2. Lifespan Manager ---
+STORE_FLUSH_TIMEOUT = float(environ.get('STORE_FLUSH_TIMEOUT', 8))
+METRICS_TIMEOUT = float(environ.get('METRICS_TIMEOUT', 2))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.info("Lifespan: Startup...")
     app.state.env = Environment()
-    app.state.request_queue = request_queue
-    app.state.results = results
+    app.state.dispatcher = IntentDispatcher(app.state.env)
+    app.state.jobs = JobRegistry(app.state.env, app.state.dispatcher)
 
-    ib_loop = asyncio.new_event_loop()
+    # Callbacks on the IB loop are timed by the loop monitor; other loops are left alone.
+    ib_loop = MonitoredEventLoop()
+    app.state.ib_loop = ib_loop
+    app.state.env.start(ib_loop)
+    app.state.loop_monitor = LoopMonitor(ib_loop)
     thread = threading.Thread(
         target=ib_thread_loop, 
-        args=(app.state.env, ib_loop, app.state.request_queue, app.state.results), 
+        args=(app.state.env, ib_loop, app.state.loop_monitor), 
         daemon=True
     )
     thread.start()
     logging.info("Lifespan: IB background thread started.")
     yield
     logging.info("Lifespan: Shutdown.")
+    app.state.env.stop_config_watch()
+    # Commit Firestore writes still waiting in the write-behind queue before the instance goes away.
+    try:
+        flush = asyncio.run_coroutine_threadsafe(app.state.env.store.close(), ib_loop)
+        await asyncio.wait_for(asyncio.wrap_future(flush), STORE_FLUSH_TIMEOUT)
+    except Exception as e:
+        logging.error(f"Lifespan: Failed to flush pending Firestore writes: {e}", exc_info=True)
 
-# --- 4. FastAPI App & Routes ---
+# --- 3. FastAPI App & Routes ---
 logging.basicConfig(level=logging.INFO)
 app = FastAPI(lifespan=lifespan)
 
@@ -114,32 +112,189 @@ INTENTS = {
     'orchestrator': Orchestrator
 }
 
+def _intent_timeout(env, intent: str) -> float:
+    return float(env.config.get('intentTimeouts', {}).get(intent, INTENTS[intent].TIMEOUT))
+
+async def _on_ib_loop(request: Request, coro):
+    """Runs a coroutine on the IB loop and awaits its result from the HTTP loop."""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, request.app.state.ib_loop))
+
+def _json_response(content, status_code=200):
+    return Response(content=json.dumps(content, default=str), media_type="application/json", status_code=status_code)
+
+async def _read_body(request: Request):
+    """Returns the JSON body of a POST (empty dict if there is none), or None if it is invalid."""
+    if request.method == 'POST' and int(request.headers.get('content-length') or 0):
+        try:
+            return await request.json()
+        except json.JSONDecodeError:
+            return None
+    return {}
+
+def _outcome(result_future):
+    """Maps a finished execution onto (result_data, error_str). asyncio.QueueFull propagates."""
+    try:
+        return result_future.result()
+    except asyncio.TimeoutError:
+        return {}, "Request timed out"
+    except asyncio.CancelledError:
+        return {}, "Request cancelled"
+
+def _stream_event(event: str, data, ndjson: bool) -> str:
+    if ndjson:
+        return json.dumps({'event': event, 'data': data}, default=str) + '\n'
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _wait_for_disconnect(request: Request):
+    """Resolves when the ASGI server reports that the client has gone away."""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def _component_stats(env, dispatcher):
+    stats = {
+        'dispatcher': dispatcher.stats(),
+        'store': env.store.stats(),
+        'barCache': env.bar_cache.stats(),
+        'contracts': env.contracts.stats(),
+        'tickers': env.tickers.stats(),
+        'orders': env.orders.stats(),
+        'orderTracker': env.order_tracker.stats(),
+    }
+    if hasattr(env.ibgw, 'stats'):
+        stats['gateway'] = env.ibgw.stats()
+    return stats
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """
+    IB loop health (lag, slow callbacks with stacks, blocking time per intent)
+    plus the stats of the shared services. The loop metrics are read directly
+    so they are still served while the IB loop is stalled.
+    """
+    state = request.app.state
+    result = {'loop': state.loop_monitor.stats()}
+    try:
+        result.update(await asyncio.wait_for(_on_ib_loop(request, _component_stats(state.env, state.dispatcher)),
+                                             METRICS_TIMEOUT))
+    except asyncio.TimeoutError:
+        result['error'] = f"IB loop did not respond within {METRICS_TIMEOUT}s"
+    return _json_response(result)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Returns a job's status; with ?stream=1 streams NDJSON status updates until the job finishes."""
+    registry = request.app.state.jobs
+    if request.query_params.get('stream') not in ('1', 'true'):
+        record = await _on_ib_loop(request, registry.get(job_id))
+        if record is None:
+            return _json_response({'error': f'Unknown job: {job_id}'}, 404)
+        return _json_response(record)
+
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    unsubscribe = await _on_ib_loop(
+        request, registry.subscribe(job_id, lambda record: loop.call_soon_threadsafe(updates.put_nowait, record)))
+    if unsubscribe is None:
+        return _json_response({'error': f'Unknown job: {job_id}'}, 404)
+
+    async def status_stream():
+        try:
+            while (record := await updates.get()) is not None:
+                yield json.dumps(record, default=str) + '\n'
+        finally:
+            request.app.state.ib_loop.call_soon_threadsafe(unsubscribe)
+
+    return StreamingResponse(status_stream(), media_type="application/x-ndjson")
+
+@app.get("/stream/{intent}")
+@app.post("/stream/{intent}")
+async def stream_intent(intent: str, request: Request):
+    """
+    Runs an intent and streams its progress events (strategy results, the
+    reconcile snapshot, orders) as they happen, followed by a final 'result'
+    or 'error' event. Server-sent events by default, NDJSON with ?format=ndjson.
+    """
+    body = await _read_body(request)
+    if body is None:
+        return _json_response({"error": "Invalid JSON body"}, 400)
+    if intent not in INTENTS:
+        raise ValueError(f"Unknown intent received: {intent}")
+    ndjson = request.query_params.get('format') == 'ndjson'
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    request_id = str(uuid.uuid4())
+    execution = asyncio.run_coroutine_threadsafe(
+        request.app.state.dispatcher.execute(
+            request_id, INTENTS[intent], body, _intent_timeout(request.app.state.env, intent),
+            progress=lambda event: loop.call_soon_threadsafe(events.put_nowait, event)),
+        request.app.state.ib_loop)
+    result_future = asyncio.wrap_future(execution)
+    result_future.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def event_stream():
+        try:
+            while (event := await events.get()) is not None:
+                yield _stream_event('progress', event, ndjson)
+            try:
+                result_data, error_str = _outcome(result_future)
+            except asyncio.QueueFull:
+                result_data, error_str = {}, "Service is busy"
+            if error_str:
+                yield _stream_event('error', {'error': error_str}, ndjson)
+            else:
+                yield _stream_event('result', result_data, ndjson)
+        finally:
+            # Runs when the client disconnects mid-stream as well.
+            if not execution.done():
+                logging.warning(f"Stream for {intent} ({request_id}) closed early; cancelling intent.")
+                execution.cancel()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson" if ndjson else "text/event-stream")
+
 @app.get("/{intent}")
 @app.post("/{intent}")
 async def handle_intent(intent: str, request: Request):
-    body = {}
-    if request.method == 'POST' and request.headers.get('content-length'):
-        try:
-            body = await request.json()
-        except json.JSONDecodeError:
-            return Response(content=json.dumps({"error": "Invalid JSON body"}), media_type="application/json", status_code=400)
+    body = await _read_body(request)
+    if body is None:
+        return _json_response({"error": "Invalid JSON body"}, 400)
     if intent not in INTENTS:
         raise ValueError(f"Unknown intent received: {intent}")
+    if request.query_params.get('async') in ('1', 'true'):
+        # Scheduler retries carry the same schedule time, so they map onto the same job.
+        slot = request.headers.get('Idempotency-Key') or request.headers.get('X-CloudScheduler-ScheduleTime')
+        try:
+            record = await _on_ib_loop(request, request.app.state.jobs.start(
+                intent, INTENTS[intent], body, slot, _intent_timeout(request.app.state.env, intent)))
+        except asyncio.QueueFull:
+            return _json_response({"error": "Service is busy"}, 503)
+        return _json_response(record, 200 if record['deduplicated'] else 202)
+
     request_id = str(uuid.uuid4())
+    execution = asyncio.run_coroutine_threadsafe(
+        request.app.state.dispatcher.execute(request_id, INTENTS[intent], body, _intent_timeout(request.app.state.env, intent)),
+        request.app.state.ib_loop)
+    # wrap_future bridges the IB loop's result onto this loop via call_soon_threadsafe.
+    result_future = asyncio.wrap_future(execution)
+    disconnect = asyncio.create_task(_wait_for_disconnect(request))
     try:
-        request.app.state.request_queue.put_nowait((request_id, INTENTS[intent], body))
-    except Full:
+        await asyncio.wait({result_future, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+
+    if not result_future.done():
+        # The client hung up; cancelling the bridge cancels the intent coroutine on the IB loop.
+        logging.warning(f"Client disconnected from {intent} ({request_id}); cancelling intent.")
+        execution.cancel()
+        return Response(status_code=499)
+
+    try:
+        result_data, error_str = _outcome(result_future)
+    except asyncio.QueueFull:
         return Response(content=json.dumps({"error": "Service is busy"}), status_code=503)
 
-    results_dict = request.app.state.results
-    for _ in range(600): # 60s timeout
-        if request_id in results_dict:
-            result_data, error_str = results_dict.pop(request_id)
-            break
-        await asyncio.sleep(0.1)
-    else:
-        error_str = "Request timed out"
-    
     if error_str:
         result = {'error': error_str}
         status_code = 500
@@ -5,7 +5,8 @@ import pandas as pd
 from ib_insync import Stock, util
 
 from intents.intent import Intent
-from lib.trading import Stock as StockInstrument
+from lib import indicators
+from lib.signal_state import IncrementalMACD
 from strategies.strategy import Strategy
 
 
@@ -41,10 +42,7 @@ class SpyMacdVixy(Strategy):
             self._signals = {}
             return
 
-        exp12 = df['close'].ewm(span=12, adjust=False).mean()
-        exp26 = df['close'].ewm(span=26, adjust=False).mean()
-        macd = exp12 - exp26
-        signal = macd.ewm(span=9, adjust=False).mean()
+        macd, signal = SpyMacdVixyIntent._calculate_macd(df)
 
         if macd.iloc[-1] > signal.iloc[-1] and macd.iloc[-2] < signal.iloc[-2]:
             self._signals = {spy_contract.conId: 1.0, vixy_contract.conId: 0.0}
@@ -81,21 +79,22 @@ class SpyMacdVixyIntent(Intent):
         self._dry_run = kwargs.get('dryRun', False)
 
     async def _core_async(self) -> Dict[str, Any]:
-        doc_ref = self._env.db.document(f"strategies/{self.id}/intent/latest")
+        intent_path = f"strategies/{self.id}/intent/latest"
         now_iso = datetime.now(timezone.utc).isoformat()
         try:
-            spy_contract = await self._qualify_stock('SPY', 'SMART', 'USD')
-            vixy_contract = await self._qualify_stock('VIXY', 'BATS', 'USD')
+            spy_contract, vixy_contract = await self._qualify_stocks(('SPY', 'SMART', 'USD'), ('VIXY', 'BATS', 'USD'))
+            # Keep both streams open across runs so sizing reads live prices from memory.
+            self._env.tickers.subscribe(self.id, spy_contract, vixy_contract)
 
-            spy_df = await self._fetch_history(spy_contract, duration='200 D', bar_size='1 day')
-            if spy_df.empty or len(spy_df) < 2:
+            reading = await IncrementalMACD(self._env, self.id).update(spy_contract, full_duration='200 D')
+            if reading is None:
                 payload = _error_payload("Insufficient SPY historical data.", now_iso)
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], error_message=payload["error_message"])
                 return payload
 
-            macd, signal = self._calculate_macd(spy_df)
-            last_price = spy_df.iloc[-1]['close']
+            macd, signal = reading.macd, reading.signal
+            last_price = self._env.tickers.price(spy_contract.conId) or reading.last_close
 
             regime = self._determine_regime(macd, signal)
             if regime == 'neutral':
@@ -111,12 +110,14 @@ class SpyMacdVixyIntent(Intent):
                     },
                     "target_positions": []
                 }
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], metadata=payload["metadata"])
                 return payload
 
-            vixy_df = await self._fetch_history(vixy_contract, duration='30 D', bar_size='1 day')
-            vixy_price = vixy_df.iloc[-1]['close'] if not vixy_df.empty else None
+            vixy_price = self._env.tickers.price(vixy_contract.conId)
+            if vixy_price is None:
+                vixy_df = await self._fetch_history(vixy_contract, duration='30 D', bar_size='1 day')
+                vixy_price = vixy_df.iloc[-1]['close'] if not vixy_df.empty else None
 
             account_values = self._env.ibgw.accountValues()
             portfolio = self._env.ibgw.portfolio()
@@ -125,7 +126,7 @@ class SpyMacdVixyIntent(Intent):
             net_liquidation = self._extract_account_value(account_values, 'NetLiquidation')
             if net_liquidation == 0:
                 payload = _error_payload("Net Liquidation is zero.", now_iso)
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], error_message=payload["error_message"])
                 return payload
 
@@ -149,7 +150,7 @@ class SpyMacdVixyIntent(Intent):
                     },
                     "target_positions": []
                 }
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], metadata=payload["metadata"])
                 return payload
 
@@ -182,44 +183,30 @@ class SpyMacdVixyIntent(Intent):
                 },
                 "target_positions": target_positions
             }
-            doc_ref.set(payload)
+            await self._publish_strategy_intent(self.id, intent_path, payload)
             self._activity_log.update(status=payload["status"], metadata=payload["metadata"], target_positions=target_positions)
             return payload
 
         except Exception as exc:  # noqa: BLE001
             payload = _error_payload(str(exc), now_iso)
-            doc_ref.set(payload)
+            await self._publish_strategy_intent(self.id, intent_path, payload)
             self._activity_log.update(status="error", error_message=str(exc))
             raise
 
-    async def _qualify_stock(self, symbol: str, exchange: str, currency: str):
-        stock = Stock(symbol, exchange, currency)
-        qualified = await self._env.ibgw.qualifyContractsAsync(stock)
-        if not qualified:
-            raise RuntimeError(f"Failed to qualify contract for {symbol}.")
-        return StockInstrument(self._env, ib_contract=qualified[0]).contract
+    async def _qualify_stocks(self, *specs: Tuple[str, str, str]) -> List[Any]:
+        qualified = await self._env.contracts.qualify(*[Stock(*spec) for spec in specs])
+        for (symbol, _, _), contract in zip(specs, qualified):
+            if contract is None:
+                raise RuntimeError(f"Failed to qualify contract for {symbol}.")
+        return qualified
 
     async def _fetch_history(self, contract, duration: str, bar_size: str) -> pd.DataFrame:
-        bars = await self._env.ibgw.reqHistoricalDataAsync(
-            contract,
-            endDateTime='',
-            durationStr=duration,
-            barSizeSetting=bar_size,
-            whatToShow='TRADES',
-            useRTH=True,
-            timeout=30,
-        )
-        if not bars:
-            return pd.DataFrame()
-        return util.df(bars)
+        return await self._env.get_bars(contract, duration, bar_size, what_to_show='TRADES', use_rth=True)
 
     @staticmethod
     def _calculate_macd(df: pd.DataFrame):
-        exp12 = df['close'].ewm(span=12, adjust=False).mean()
-        exp26 = df['close'].ewm(span=26, adjust=False).mean()
-        macd = exp12 - exp26
-        signal = macd.ewm(span=9, adjust=False).mean()
-        return macd, signal
+        result = indicators.macd(df['close'].to_numpy())
+        return pd.Series(result.macd[:, 0], index=df.index), pd.Series(result.signal[:, 0], index=df.index)
 
     @staticmethod
     def _determine_regime(macd: pd.Series, signal: pd.Series) -> str:
@@ -319,6 +306,7 @@ class SpyMacdVixyIntent(Intent):
                 "exchange": contract.exchange,
                 "currency": contract.currency,
                 "quantity": int(target_quantity),
+                "price": float(price),
                 "contract": _contract_dict(contract)
             })
 
@@ -72,7 +72,7 @@ class Strategy:
         if self._base_currency is not None and self._exposure:
             for k, v_tuple in self._signals.items():
                 if (c := self._contracts[k]).tickers is None:
-                    c.get_tickers()
+                    c.get_tickers(owner=self._id)
             self._get_currencies(self._base_currency)
 
             self._target_positions = {}
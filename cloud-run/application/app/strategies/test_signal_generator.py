@@ -5,6 +5,7 @@ import pandas as pd
 from ib_insync import Stock, util
 
 from intents.intent import Intent
+from lib import indicators
 from lib.trading import Stock as StockInstrument
 
 # Firestore document template helpers
@@ -24,41 +25,24 @@ class TestSignalGenerator(Intent):
 
     async def _core_async(self):
         self._env.logging.info("--- Starting Robust, Target-Aware Signal Generator ---")
-        doc_ref = self._env.db.document(f"strategies/{self.id}/intent/latest")
+        intent_path = f"strategies/{self.id}/intent/latest"
 
         try:
-            spy_obj = Stock('SPY', 'SMART', 'USD')
-            qualified_contracts = await self._env.ibgw.qualifyContractsAsync(spy_obj)
-            spy_instrument = StockInstrument(self._env, ib_contract=qualified_contracts[0])
+            spy_contract = await self._env.contracts.qualify_one(Stock('SPY', 'SMART', 'USD'))
+            if spy_contract is None:
+                raise RuntimeError("Failed to qualify contract for SPY.")
+            spy_instrument = StockInstrument(self._env, ib_contract=spy_contract)
 
             self._env.logging.info("Fetching 5D/30min historical data for SPY...")
-            bars = await self._env.ibgw.reqHistoricalDataAsync(
-                spy_instrument.contract,
-                endDateTime='',
-                durationStr='5 D',
-                barSizeSetting='30 mins',
-                whatToShow='TRADES',
-                useRTH=True,
-                timeout=20,
-            )
-
-            if not bars:
-                payload = _error_payload("Could not fetch market data.")
-                doc_ref.set(payload)
-                self._activity_log.update(status=payload["status"], error_message=payload["error_message"])
-                return payload
-
-            df = util.df(bars)
+            df = await self._env.get_bars(spy_instrument.contract, '5 D', '30 mins', what_to_show='TRADES', use_rth=True)
             if df.empty:
                 payload = _error_payload("Market data is empty.")
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], error_message=payload["error_message"])
                 return payload
 
-            exp12 = df['close'].ewm(span=12, adjust=False).mean()
-            exp26 = df['close'].ewm(span=26, adjust=False).mean()
-            macd = exp12 - exp26
-            signal = macd.ewm(span=9, adjust=False).mean()
+            result = indicators.macd(df['close'].to_numpy())
+            macd, signal = pd.Series(result.macd[:, 0]), pd.Series(result.signal[:, 0])
             last_price = df.iloc[-1]['close']
             self._env.logging.info(f"[Data Check] Last MACD: {macd.iloc[-1]:.4f}, Last Signal: {signal.iloc[-1]:.4f}")
 
@@ -75,7 +59,7 @@ class TestSignalGenerator(Intent):
                     },
                     "target_positions": []
                 }
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], metadata=payload["metadata"])
                 return payload
 
@@ -89,7 +73,7 @@ class TestSignalGenerator(Intent):
             net_liquidation = float(net_liquidation_str)
             if net_liquidation == 0:
                 payload = _error_payload("Net Liquidation is zero.")
-                doc_ref.set(payload)
+                await self._publish_strategy_intent(self.id, intent_path, payload)
                 self._activity_log.update(status=payload["status"], error_message=payload["error_message"])
                 return payload
 
@@ -123,6 +107,7 @@ class TestSignalGenerator(Intent):
                 "exchange": spy_instrument.contract.exchange,
                 "currency": spy_instrument.contract.currency,
                 "quantity": int(target_quantity),
+                "price": float(last_price),
                 "contract": _contract_dict(spy_instrument.contract)
             }]
 
@@ -143,7 +128,7 @@ class TestSignalGenerator(Intent):
                 "target_positions": target_positions
             }
 
-            doc_ref.set(payload)
+            await self._publish_strategy_intent(self.id, intent_path, payload)
             self._activity_log.update(status=payload["status"], metadata=payload["metadata"], target_positions=target_positions)
             return payload
 
@@ -155,7 +140,7 @@ class TestSignalGenerator(Intent):
                 "metadata": {},
                 "target_positions": []
             }
-            doc_ref.set(error_payload)
+            await self._publish_strategy_intent(self.id, intent_path, error_payload)
             self._activity_log.update(status="error", error_message=str(exc))
             raise
 
@@ -28,7 +28,10 @@ def install_ib_insync_stub():
         pass
 
     class Stock(_Base):
-        pass
+        def __init__(self, symbol='', exchange='', currency='', **kwargs):
+            kwargs.setdefault('secType', 'STK')
+            kwargs.setdefault('conId', 0)
+            super().__init__(symbol=symbol, exchange=exchange, currency=currency, **kwargs)
 
     class Forex(_Base):
         pass
@@ -54,8 +57,15 @@ def install_ib_insync_stub():
     def dict_to_contract(data):
         return SimpleNamespace(**data)
 
+    def df(objs):
+        import pandas as pd
+        return pd.DataFrame([vars(obj) for obj in objs]) if objs else None
+
     util_module = ModuleType('ib_insync.util')
     util_module.dictToContract = dict_to_contract
+    util_module.contractToDict = lambda contract: dict(vars(contract))
+    util_module.orderToDict = lambda order: dict(vars(order))
+    util_module.df = df
 
     objects_module = ModuleType('ib_insync.objects')
 
@@ -89,6 +99,8 @@ def install_google_cloud_stub():
     Install lightweight google.cloud modules so unit tests can import code
     without pulling in heavy native dependencies.
     """
+    # Kept across reinstalls, so modules imported earlier still catch the same exception classes.
+    exceptions_module = sys.modules.get('google.api_core.exceptions')
     if 'google' in sys.modules:
         keys_to_remove = [name for name in sys.modules if name == 'google' or name.startswith('google.')]
         for key in keys_to_remove:
@@ -152,7 +164,7 @@ def install_google_cloud_stub():
             return SimpleNamespace()
 
         def document(self, *_):
-            return SimpleNamespace(get=lambda: SimpleNamespace(), set=lambda *_a, **_k: None)
+            return SimpleNamespace(get=lambda: SimpleNamespace(exists=False, to_dict=lambda: {}), set=lambda *_a, **_k: None)
 
     class _SecretManager:
         def __init__(self, *_, **__):
@@ -179,9 +191,24 @@ def install_google_cloud_stub():
     bigquery_module.QueryJob = QueryJob
 
     firestore_module.Client = _FirestoreClient
+    firestore_module.AsyncClient = _FirestoreClient
     logging_module.Client = _LoggingClient
     secretmanager_module.SecretManagerServiceClient = _SecretManager
 
+    api_core_module = ModuleType('google.api_core')
+    api_core_module.__path__ = []
+    setattr(google_module, 'api_core', api_core_module)
+    if exceptions_module is None:
+        exceptions_module = ModuleType('google.api_core.exceptions')
+
+        class NotFound(Exception):
+            pass
+
+        exceptions_module.NotFound = NotFound
+    setattr(api_core_module, 'exceptions', exceptions_module)
+    module_map['google.api_core'] = api_core_module
+    module_map['google.api_core.exceptions'] = exceptions_module
+
     auth_module = ModuleType('google.auth')
     setattr(google_module, 'auth', auth_module)
 
@@ -197,3 +224,122 @@ def install_google_cloud_stub():
     module_map['google.auth'] = auth_module
 
     sys.modules.update(module_map)
+
+
+class FakeAsyncFirestore:
+    """
+    In-memory stand-in for firestore.AsyncClient. Documents are kept in `docs`
+    by path; batch commits and get_all calls are recorded for assertions, and
+    `reads` counts read round trips (document gets, get_all calls and queries).
+    """
+
+    def __init__(self, docs=None):
+        self.docs = {path: dict(data) for path, data in (docs or {}).items()}
+        self.commits = []
+        self.get_all_calls = []
+        self.reads = 0
+        self.fail_commits = 0
+
+    def document(self, path):
+        return _FakeAsyncDocumentRef(self, path)
+
+    def collection(self, name):
+        return _FakeAsyncCollection(self, name)
+
+    def batch(self):
+        return _FakeAsyncBatch(self)
+
+    def require(self, path):
+        """Raises NotFound, as an update of a missing document does."""
+        if path not in self.docs:
+            from google.api_core.exceptions import NotFound
+            raise NotFound(f'No document to update: {path}')
+
+    async def get_all(self, refs):
+        self.reads += 1
+        self.get_all_calls.append([ref.path for ref in refs])
+        for ref in refs:
+            yield ref.snapshot()
+
+
+class _FakeAsyncDocumentRef:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def snapshot(self):
+        data = self._client.docs.get(self.path)
+        return SimpleNamespace(id=self.id, reference=self, exists=data is not None,
+                               to_dict=lambda: dict(data) if data is not None else None)
+
+    async def get(self):
+        self._client.reads += 1
+        return self.snapshot()
+
+    async def update(self, data):
+        self._client.require(self.path)
+        self._client.docs[self.path] = {**self._client.docs[self.path], **data}
+        self._client.commits.append([self.path])
+
+
+class _FakeAsyncCollection:
+    def __init__(self, client, name, filters=(), limit=None):
+        self._client = client
+        self._name = name
+        self._filters = filters
+        self._limit = limit
+
+    def where(self, field, op, value):
+        if op != '==':
+            raise NotImplementedError(op)
+        return _FakeAsyncCollection(self._client, self._name, self._filters + ((field, value),), self._limit)
+
+    def limit(self, count):
+        return _FakeAsyncCollection(self._client, self._name, self._filters, count)
+
+    def _matches(self, data):
+        for field, value in self._filters:
+            found = data
+            for key in field.split('.'):
+                found = found.get(key) if isinstance(found, dict) else None
+            if found != value:
+                return False
+        return True
+
+    async def stream(self):
+        self._client.reads += 1
+        prefix = f'{self._name}/'
+        matched = 0
+        for path in list(self._client.docs):
+            if path.startswith(prefix) and '/' not in path[len(prefix):]:
+                if not self._matches(self._client.docs[path]):
+                    continue
+                if self._limit is not None and matched >= self._limit:
+                    return
+                matched += 1
+                yield self._client.document(path).snapshot()
+
+
+class _FakeAsyncBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((ref.path, dict(data), merge))
+
+    def update(self, ref, data):
+        self._writes.append((ref.path, dict(data), None))
+
+    async def commit(self):
+        if self._client.fail_commits:
+            self._client.fail_commits -= 1
+            raise RuntimeError('commit failed')
+        for path, _, merge in self._writes:
+            if merge is None:
+                self._client.require(path)
+        for path, data, merge in self._writes:
+            # Updates (merge None) merge like set(merge=True).
+            self._client.docs[path] = data if merge is False else {**self._client.docs.get(path, {}), **data}
+        self._client.commits.append([path for path, _, _ in self._writes])
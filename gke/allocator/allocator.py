@@ -7,6 +7,7 @@ import logging
 from os import environ
 import re
 import requests
+import time
 
 
 # setup logging
@@ -17,6 +18,7 @@ logger.addHandler(ContainerEngineHandler())
 # get environment variables
 DRY_RUN = environ.get('DRY_RUN', default=False)
 HOSTNAME = environ.get('HOSTNAME')  # Pod name
+ORDER_ACK_TIMEOUT = float(environ.get('ORDER_ACK_TIMEOUT', default=10))
 ORDER_PROPERTIES = environ.get('ORDER_PROPERTIES', default='{}')
 STRATEGIES = environ.get('STRATEGIES')
 TRADING_MODE = environ.get('TRADING_MODE', default='paper')
@@ -66,9 +68,12 @@ def get_contract_data(contract_ids=()):
         contract = contract_details.pop('contract')
         contract_data[con_id] = {
             'contract': contract,
-            'contract_details': contract_details,
-            'ticker': get_tickers(contract)
+            'contract_details': contract_details
         }
+    # one request for the whole universe instead of one round trip per contract
+    tickers = get_tickers(*[v['contract'] for v in contract_data.values()])
+    for data, ticker in zip(contract_data.values(), tickers):
+        data['ticker'] = ticker
 
     return contract_data
 
@@ -96,15 +101,39 @@ def get_signal(identifier):
         # return {}
 
 
-def get_tickers(contract):
+def get_tickers(*contracts):
     """
-    Requests price (tick) data
+    Requests price (tick) data for all contracts at once
 
-    :param contract: ib_insync.Contract
-    :return: ib_insync.Ticker
+    :param contracts: ib_insync.Contract(s)
+    :return: list of ib_insync.Ticker, in the order of contracts
     """
-    logging.info('Requesting tick data for {}...'.format(contract.localSymbol))
-    return ib_gw.reqTickers(contract)[0]
+    if not contracts:
+        return []
+    logger.info('Requesting tick data for {}...'.format([c.localSymbol or c.symbol for c in contracts]))
+    return ib_gw.reqTickers(*contracts)
+
+
+def wait_for_acknowledgement(trades, timeout=ORDER_ACK_TIMEOUT):
+    """
+    Blocks until the IB Gateway has acknowledged or rejected every order, or until the timeout
+
+    :param trades: ib_insync.Trade(s) as returned by placeOrder
+    :param timeout: maximum seconds to wait (float)
+    :return: trades still pending submission (list)
+    """
+    deadline = time.monotonic() + timeout
+    pending = [t for t in trades if t.orderStatus.status in ('', 'PendingSubmit', 'ApiPending')]
+    while pending:
+        remaining = deadline - time.monotonic()
+        # waitOnUpdate returns as soon as the gateway sends anything, e.g. an order status or an error
+        if remaining <= 0 or not ib_gw.waitOnUpdate(timeout=remaining):
+            logger.warning('No acknowledgement within {}s for orders {}'.format(
+                timeout, [t.order.orderId for t in pending]))
+            break
+        pending = [t for t in pending if t.orderStatus.status in ('', 'PendingSubmit', 'ApiPending')]
+
+    return pending
 
 
 def make_allocation(signals=()):
@@ -188,10 +217,9 @@ def main():
 
         # get relevant currencies and corresponding FX ratese
         currencies = {v['contract'].currency for v in contract_data.values()}
-        fx = {
-            c: 1 if c == base_currency else get_tickers(Forex(c + base_currency))
-            for c in currencies
-        }
+        fx_currencies = [c for c in currencies if c != base_currency]
+        fx = {c: 1 for c in currencies if c == base_currency}
+        fx.update(zip(fx_currencies, get_tickers(*[Forex(c + base_currency) for c in fx_currencies])))
         activity_log['fx'] = {
             v.contract.symbol + v.contract.currency: v.midpoint()
             if v.midpoint() == v.midpoint() else v.close
@@ -224,15 +252,15 @@ def main():
         activity_log['trades'] = {symbol_map[k]: v for k, v in trades.items()}
         logger.info('Trades: {}'.format(activity_log['trades']))
 
-        perm_ids = []
+        placed = []
         if not DRY_RUN:
             # place orders
             for k, v in trades.items():
-                order = ib_gw.placeOrder(contract_data[k]['contract'],
-                                         MarketOrder(action='BUY' if v > 0 else 'SELL',
-                                                     totalQuantity=abs(v)).update(**order_properties))
-                perm_ids.append(order.order.permId)
-        ib_gw.sleep(5)  # give the IB Gateway a couple of seconds to digest orders and to raise possible errors
+                placed.append(ib_gw.placeOrder(contract_data[k]['contract'],
+                                               MarketOrder(action='BUY' if v > 0 else 'SELL',
+                                                           totalQuantity=abs(v)).update(**order_properties)))
+        # return as soon as the IB Gateway has acknowledged the orders or raised errors for them
+        wait_for_acknowledgement(placed)
         activity_log['orders'] = {
             t.contract.localSymbol: {
                 'order': {
@@ -246,7 +274,7 @@ def main():
                     if isinstance(v, (int, float, str))
                 },
                 'isActive': t.isActive()
-            } for t in ib_gw.trades() if t.order.permId in perm_ids
+            } for t in placed
         }
         logging.info('Orders placed: {}'.format(activity_log['orders']))
 